@@ -0,0 +1,125 @@
+"""
+Agregação mensal das abas fontes.
+
+Agrupa as linhas de Vendas, Custo_Despesas, Folha e Financiamento por
+(fonte, categoria, mês) em uma única passada por aba, para que a DRE possa
+ser escrita com valores em vez de fórmulas SUMIFS.
+
+Os critérios seguem os das fórmulas da DRE: somente datas numéricas (datas
+do Excel ou números de série) entram no período, somente valores numéricos
+são somados e a categoria é comparada sem diferenciar maiúsculas.
+
+Cada aba é primeiro convertida no modelo compacto de transações (ver
+modelo.py) e somada por categoria e mês com NumPy.
+"""
+from datas import conversor_padrao
+from modelo import AbaCompacta, compactar, normalizar_categoria, somas_mensais
+
+
+FONTE_VENDAS = 'Vendas'
+FONTE_CUSTOS = 'Custo_Despesas'
+FONTE_FOLHA = 'Folha'
+FONTE_FINANCIAMENTO = 'Financiamento'
+
+CAMPOS_FOLHA = ('salario', 'encargos', 'beneficios')
+
+
+class AgregadosMensais:
+    """Somas por (fonte, categoria) e índice de mês."""
+
+    def __init__(self):
+        self.somas = {}
+        self.rotulos = {}
+
+    def __len__(self):
+        return sum(len(por_mes) for por_mes in self.somas.values())
+
+    def adicionar(self, fonte, categoria, mes, valor, rotulo=None):
+        chave = (fonte, categoria)
+        por_mes = self.somas.get(chave)
+        if por_mes is None:
+            por_mes = self.somas[chave] = {}
+            self.rotulos[chave] = rotulo
+        por_mes[mes] = por_mes.get(mes, 0) + valor
+
+    def linhas(self):
+        """Itera (fonte, rótulo da categoria, mês, soma) em ordem estável."""
+        for chave in sorted(self.somas, key=lambda c: (c[0], c[1] or '')):
+            por_mes = self.somas[chave]
+            for mes in sorted(por_mes):
+                yield chave[0], self.rotulos[chave], mes, por_mes[mes]
+
+    def mesclar(self, outros):
+        """Soma a estes agregados os de `outros` (ex.: agregados de outra aba)."""
+        for chave, por_mes in outros.somas.items():
+            for mes, valor in por_mes.items():
+                self.adicionar(chave[0], chave[1], mes, valor, outros.rotulos[chave])
+
+    def valor(self, fonte, mes, categoria=None):
+        return self.somas.get((fonte, normalizar_categoria(categoria)), {}).get(mes, 0)
+
+    def serie(self, fonte, mes_inicial, num_meses, categoria=None):
+        """Valores mensais de uma fonte/categoria a partir de `mes_inicial`."""
+        por_mes = self.somas.get((fonte, normalizar_categoria(categoria)), {})
+        return [por_mes.get(mes_inicial + i, 0) for i in range(num_meses)]
+
+
+ABAS_AGREGADAS = (FONTE_VENDAS, FONTE_CUSTOS, FONTE_FOLHA, FONTE_FINANCIAMENTO)
+
+
+def compactar_aba(fontes, aba, meses=None, tabela=None):
+    """
+    Converte uma aba fonte no modelo compacto de transações. `meses` são os
+    índices de mês de cada linha (da varredura de datas); para
+    Financiamento são calculados aqui. `tabela` é a tabela de categorias de
+    Custo_Despesas (ver modelo.compactar). Uma AbaCompacta já traz as
+    transações.
+    """
+    dados = fontes[aba]
+    if isinstance(dados, AbaCompacta):
+        return dados.transacoes
+    datas = dados.coluna('data')
+    if aba == FONTE_VENDAS:
+        return compactar(aba, meses, datas, [dados.coluna('valor')])
+    if aba == FONTE_CUSTOS:
+        return compactar(aba, meses, datas, [dados.coluna('valor')], dados.coluna('categoria'), tabela=tabela)
+    if aba == FONTE_FOLHA:
+        # Toda linha com data válida conta, mesmo sem valores numéricos
+        return compactar(aba, meses, datas, [dados.coluna(c) for c in CAMPOS_FOLHA], exigir_numero=False)
+    if aba == FONTE_FINANCIAMENTO:
+        meses = conversor_padrao.meses_coluna(datas, coluna=(FONTE_FINANCIAMENTO, 'data'))
+        return compactar(aba, meses, datas, [dados.coluna('juros')])
+    raise ValueError(f"Aba sem agregação mensal: {aba}")
+
+
+def agregar_transacoes(transacoes):
+    """Soma as transações compactas por categoria e mês."""
+    agregados = AgregadosMensais()
+    tabela = transacoes.tabela
+    codigos, meses, somas = somas_mensais(transacoes)
+    for codigo, mes, soma in zip(codigos.tolist(), meses.tolist(), somas.tolist()):
+        if codigo < 0:
+            agregados.adicionar(transacoes.fonte, None, mes, soma)
+        else:
+            agregados.adicionar(transacoes.fonte, tabela.chaves[codigo], mes, soma, tabela.rotulos[codigo])
+    return agregados
+
+
+def agregar_aba(fontes, aba, meses=None):
+    """Agrega uma aba fonte por mês (ver compactar_aba)."""
+    return agregar_transacoes(compactar_aba(fontes, aba, meses))
+
+
+def agregar_fontes(fontes, varredura):
+    """
+    Agrega as abas fontes por mês. Os índices de mês de Vendas,
+    Custo_Despesas e Folha vêm da varredura de datas já calculada.
+    """
+    agregados = AgregadosMensais()
+    for aba in ABAS_AGREGADAS:
+        if aba == FONTE_FINANCIAMENTO:
+            if aba in fontes:
+                agregados.mesclar(agregar_aba(fontes, aba))
+        elif aba in varredura.abas:
+            agregados.mesclar(agregar_aba(fontes, aba, varredura.abas[aba].meses))
+    return agregados
@@ -0,0 +1,554 @@
+"""
+Avaliação da DRE em Python, sem Excel.
+
+As linhas alimentadas pelas abas fontes recebem as séries agregadas (ver
+agregacao.py) e as células do TOTAL D&A da aba Investimentos recebem o total
+mensal do waterfall (ver depreciacao.py). As demais células da DRE são
+calculadas a partir das próprias fórmulas do plano compilado (ver
+layout.py), interpretadas por um avaliador do subconjunto de fórmulas do
+Excel usado pelo layout: operadores aritméticos, de comparação e
+percentual, referências a células e intervalos (inclusive de outras abas) e
+as funções de FUNCOES. As células são avaliadas na ordem do layout (mês a
+mês, linha a linha); referências fora dessa ordem são avaliadas sob demanda
+e uma referência circular gera ValueError.
+
+O resultado (TabelaDRE) serve de oráculo para conferir a DRE gerada e
+fornece os valores gravados como cache das fórmulas no arquivo de saída (ver
+saida.gravar_valores_em_cache), para que leitores com
+load_workbook(data_only=True) vejam os números sem recálculo.
+"""
+import calendar
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from openpyxl.formula.tokenizer import Token, Tokenizer
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.utils.datetime import from_excel, to_excel
+
+from layout import COLUNA_INICIAL, COLUNA_INICIAL_INVESTIMENTOS, FORMULA_DATA_MES, ITEM_FONTE, LINHA_DATAS
+
+
+ABA_DRE = 'DRE'
+ABA_INVESTIMENTOS = 'Investimentos'
+LINHA_TOTAL_INVESTIMENTOS = 1
+
+
+class ErroExcel(Exception):
+    """Valor de erro do Excel (#DIV/0!, #VALUE!, ...), propagado pelas fórmulas."""
+
+    def __init__(self, codigo):
+        super().__init__(codigo)
+        self.codigo = codigo
+
+    def __eq__(self, outro):
+        return isinstance(outro, ErroExcel) and outro.codigo == self.codigo
+
+    def __hash__(self):
+        return hash(self.codigo)
+
+    def __repr__(self):
+        return f'ErroExcel({self.codigo!r})'
+
+
+class _Intervalo(list):
+    """Valores de um intervalo com mais de uma célula."""
+
+
+# Operadores infixos e sua precedência (maior = avaliado antes)
+PRECEDENCIA = {'=': 1, '<>': 1, '<': 1, '>': 1, '<=': 1, '>=': 1, '&': 2, '+': 3, '-': 3, '*': 4, '/': 4,
+               '^': 5}
+
+
+def _numero(valor):
+    if isinstance(valor, ErroExcel):
+        raise ErroExcel(valor.codigo)
+    if valor is None:
+        return 0.0
+    if isinstance(valor, (bool, int, float)):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return float(to_excel(valor))
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        raise ErroExcel('#VALUE!') from None
+
+
+def _texto(valor):
+    if isinstance(valor, ErroExcel):
+        raise ErroExcel(valor.codigo)
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _logico(valor):
+    if isinstance(valor, str):
+        if valor.upper() in ('TRUE', 'FALSE'):
+            return valor.upper() == 'TRUE'
+        raise ErroExcel('#VALUE!')
+    return _numero(valor) != 0
+
+
+def _escalar(valor):
+    if isinstance(valor, _Intervalo):
+        raise ErroExcel('#VALUE!')
+    if isinstance(valor, ErroExcel):
+        raise ErroExcel(valor.codigo)
+    return valor
+
+
+def _chave_comparacao(valor, outro):
+    # O Excel ordena números < textos < lógicos; célula vazia assume o tipo
+    # do outro operando
+    if valor is None:
+        valor = '' if isinstance(outro, str) else False if isinstance(outro, bool) else 0.0
+    if isinstance(valor, bool):
+        return (2, valor)
+    if isinstance(valor, str):
+        return (1, valor.lower())
+    return (0, _numero(valor))
+
+
+def _dividir(a, b):
+    if b == 0:
+        raise ErroExcel('#DIV/0!')
+    return a / b
+
+
+def _potencia(a, b):
+    try:
+        resultado = a ** b
+    except ZeroDivisionError:
+        raise ErroExcel('#DIV/0!') from None
+    if isinstance(resultado, complex) or math.isinf(resultado):
+        raise ErroExcel('#NUM!')
+    return resultado
+
+
+ARITMETICOS = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': _dividir,
+    '^': _potencia,
+}
+COMPARACOES = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _valores_numericos(avaliador, aba, argumentos):
+    """Números dos argumentos de SUM/MIN/MAX: em intervalos, textos e vazios são ignorados."""
+    numeros = []
+    for argumento in argumentos:
+        valor = argumento(avaliador, aba)
+        if isinstance(valor, _Intervalo):
+            for item in valor:
+                if isinstance(item, ErroExcel):
+                    raise ErroExcel(item.codigo)
+                if isinstance(item, (int, float)) and not isinstance(item, bool):
+                    numeros.append(float(item))
+        elif valor is not None:
+            numeros.append(_numero(valor))
+    return numeros
+
+
+def _soma(avaliador, aba, argumentos):
+    return math.fsum(_valores_numericos(avaliador, aba, argumentos))
+
+
+def _minimo(avaliador, aba, argumentos):
+    return min(_valores_numericos(avaliador, aba, argumentos), default=0.0)
+
+
+def _maximo(avaliador, aba, argumentos):
+    return max(_valores_numericos(avaliador, aba, argumentos), default=0.0)
+
+
+def _argumentos(avaliador, aba, argumentos, minimo, maximo, nome):
+    if not minimo <= len(argumentos) <= maximo:
+        raise ValueError(f"Número de argumentos inválido para {nome}: {len(argumentos)}")
+    return [_escalar(argumento(avaliador, aba)) for argumento in argumentos]
+
+
+def _se(avaliador, aba, argumentos):
+    if not 2 <= len(argumentos) <= 3:
+        raise ValueError(f"Número de argumentos inválido para IF: {len(argumentos)}")
+    condicao = _logico(_escalar(argumentos[0](avaliador, aba)))
+    if condicao:
+        return _escalar(argumentos[1](avaliador, aba))
+    if len(argumentos) == 3:
+        return _escalar(argumentos[2](avaliador, aba))
+    return False
+
+
+def _e(avaliador, aba, argumentos):
+    return all([_logico(valor) for valor in _argumentos(avaliador, aba, argumentos, 1, 255, 'AND')])
+
+
+def _ou(avaliador, aba, argumentos):
+    return any([_logico(valor) for valor in _argumentos(avaliador, aba, argumentos, 1, 255, 'OR')])
+
+
+def _absoluto(avaliador, aba, argumentos):
+    valor, = _argumentos(avaliador, aba, argumentos, 1, 1, 'ABS')
+    return abs(_numero(valor))
+
+
+def _data_serial(valor):
+    serial = _numero(valor)
+    if serial < 0:
+        raise ErroExcel('#NUM!')
+    return from_excel(int(serial))
+
+
+def _somar_meses(data, meses):
+    indice = data.year * 12 + data.month - 1 + meses
+    ano, mes = divmod(indice, 12)
+    return ano, mes + 1
+
+
+def _edate(avaliador, aba, argumentos):
+    inicio, meses = _argumentos(avaliador, aba, argumentos, 2, 2, 'EDATE')
+    data = _data_serial(inicio)
+    ano, mes = _somar_meses(data, int(_numero(meses)))
+    return float(to_excel(datetime(ano, mes, min(data.day, calendar.monthrange(ano, mes)[1]))))
+
+
+def _eomonth(avaliador, aba, argumentos):
+    inicio, meses = _argumentos(avaliador, aba, argumentos, 2, 2, 'EOMONTH')
+    ano, mes = _somar_meses(_data_serial(inicio), int(_numero(meses)))
+    return float(to_excel(datetime(ano, mes, calendar.monthrange(ano, mes)[1])))
+
+
+def _data(avaliador, aba, argumentos):
+    ano, mes, dia = (int(_numero(valor)) for valor in _argumentos(avaliador, aba, argumentos, 3, 3, 'DATE'))
+    ano, mes = divmod(ano * 12 + mes - 1, 12)
+    return float(to_excel(datetime(ano, mes + 1, 1) + timedelta(days=dia - 1)))
+
+
+# Funções suportadas: recebem o avaliador, a aba da célula e os argumentos
+# compilados (avaliados sob demanda, para que IF avalie só o ramo escolhido)
+FUNCOES = {
+    'SUM': _soma,
+    'MIN': _minimo,
+    'MAX': _maximo,
+    'IF': _se,
+    'AND': _e,
+    'OR': _ou,
+    'ABS': _absoluto,
+    'EDATE': _edate,
+    'EOMONTH': _eomonth,
+    'DATE': _data,
+}
+
+
+def _constante(valor):
+    return lambda avaliador, aba: valor
+
+
+def _referencia(texto):
+    aba = None
+    if '!' in texto:
+        aba, texto = texto.rsplit('!', 1)
+        if aba.startswith("'") and aba.endswith("'"):
+            aba = aba[1:-1].replace("''", "'")
+    try:
+        coluna_min, linha_min, coluna_max, linha_max = range_boundaries(texto.replace('$', ''))
+    except ValueError:
+        raise ValueError(f"Referência não suportada: {texto}") from None
+    if None in (coluna_min, linha_min, coluna_max, linha_max):
+        raise ValueError(f"Referência a linhas ou colunas inteiras não suportada: {texto}")
+
+    if coluna_min == coluna_max and linha_min == linha_max:
+        return lambda avaliador, aba_atual: avaliador.valor(aba or aba_atual, linha_min, coluna_min)
+
+    def intervalo(avaliador, aba_atual):
+        return _Intervalo(avaliador.valor(aba or aba_atual, linha, coluna)
+                          for linha in range(linha_min, linha_max + 1)
+                          for coluna in range(coluna_min, coluna_max + 1))
+    return intervalo
+
+
+def _operacao(operador, esquerda, direita):
+    if operador in ARITMETICOS:
+        funcao = ARITMETICOS[operador]
+        return lambda avaliador, aba: funcao(_numero(_escalar(esquerda(avaliador, aba))),
+                                             _numero(_escalar(direita(avaliador, aba))))
+    if operador in COMPARACOES:
+        funcao = COMPARACOES[operador]
+
+        def comparar(avaliador, aba):
+            a = _escalar(esquerda(avaliador, aba))
+            b = _escalar(direita(avaliador, aba))
+            return funcao(_chave_comparacao(a, b), _chave_comparacao(b, a))
+        return comparar
+    if operador == '&':
+        return lambda avaliador, aba: _texto(_escalar(esquerda(avaliador, aba))) + _texto(
+            _escalar(direita(avaliador, aba)))
+    raise ValueError(f"Operador não suportado: {operador}")
+
+
+class _Compilador:
+    """Compila os tokens de uma fórmula (openpyxl Tokenizer) em funções Python."""
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.tokens = [token for token in Tokenizer(formula).items if token.type != Token.WSPACE]
+        self.posicao = 0
+
+    def _atual(self):
+        return self.tokens[self.posicao] if self.posicao < len(self.tokens) else None
+
+    def _consumir(self):
+        token = self._atual()
+        if token is None:
+            raise ValueError(f"Fórmula incompleta: {self.formula}")
+        self.posicao += 1
+        return token
+
+    def compilar(self):
+        if not self.tokens:
+            raise ValueError(f"Fórmula vazia: {self.formula}")
+        expressao = self._expressao(0)
+        if self._atual() is not None:
+            raise ValueError(f"Token inesperado '{self._atual().value}' na fórmula: {self.formula}")
+        return expressao
+
+    def _expressao(self, precedencia_minima):
+        esquerda = self._unario()
+        while True:
+            token = self._atual()
+            if token is None or token.type != Token.OP_IN or PRECEDENCIA.get(token.value, 0) < precedencia_minima:
+                return esquerda
+            self._consumir()
+            if token.value not in PRECEDENCIA:
+                raise ValueError(f"Operador não suportado '{token.value}' na fórmula: {self.formula}")
+            direita = self._expressao(PRECEDENCIA[token.value] + 1)
+            esquerda = _operacao(token.value, esquerda, direita)
+
+    def _unario(self):
+        token = self._atual()
+        if token is not None and token.type == Token.OP_PRE:
+            self._consumir()
+            operando = self._unario()
+            if token.value == '-':
+                return lambda avaliador, aba: -_numero(_escalar(operando(avaliador, aba)))
+            return operando
+        expressao = self._primario()
+        while self._atual() is not None and self._atual().type == Token.OP_POST:
+            self._consumir()
+            expressao = (lambda operando: lambda avaliador, aba: _numero(_escalar(operando(avaliador, aba))) / 100)(
+                expressao)
+        return expressao
+
+    def _primario(self):
+        token = self._consumir()
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                return _constante(float(token.value))
+            if token.subtype == Token.TEXT:
+                return _constante(token.value[1:-1].replace('""', '"'))
+            if token.subtype == Token.LOGICAL:
+                return _constante(token.value.upper() == 'TRUE')
+            if token.subtype == Token.ERROR:
+                codigo = token.value
+
+                def propagar(avaliador, aba):
+                    raise ErroExcel(codigo)
+                return propagar
+            return _referencia(token.value)
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            return self._funcao(token.value[:-1].upper())
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            expressao = self._expressao(0)
+            fechamento = self._consumir()
+            if fechamento.type != Token.PAREN or fechamento.subtype != Token.CLOSE:
+                raise ValueError(f"Parêntese não fechado na fórmula: {self.formula}")
+            return expressao
+        raise ValueError(f"Token inesperado '{token.value}' na fórmula: {self.formula}")
+
+    def _funcao(self, nome):
+        if nome not in FUNCOES:
+            raise ValueError(f"Função não suportada: {nome}")
+        funcao = FUNCOES[nome]
+        argumentos = []
+        token = self._atual()
+        if token is not None and token.type == Token.FUNC and token.subtype == Token.CLOSE:
+            self._consumir()
+        else:
+            while True:
+                argumentos.append(self._expressao(0))
+                token = self._consumir()
+                if token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                    break
+                if token.type != Token.SEP or token.subtype != Token.ARG:
+                    raise ValueError(f"Token inesperado '{token.value}' na fórmula: {self.formula}")
+        return lambda avaliador, aba: funcao(avaliador, aba, argumentos)
+
+
+def compilar_formula(formula):
+    """Compila uma fórmula ('=...') em uma função (avaliador, aba) -> valor."""
+    return _Compilador(formula).compilar()
+
+
+class AvaliadorFormulas:
+    """
+    Células de um ou mais abas, com valores ou fórmulas, avaliadas sob
+    demanda. Datas são guardadas como números de série do Excel; as fórmulas
+    são compiladas na primeira avaliação.
+    """
+
+    def __init__(self):
+        self.valores = {}
+        self.formulas = {}
+        self._em_avaliacao = set()
+
+    def definir(self, aba, linha, coluna, conteudo):
+        chave = (aba, linha, coluna)
+        self.valores.pop(chave, None)
+        self.formulas.pop(chave, None)
+        if isinstance(conteudo, str) and conteudo.startswith('=') and len(conteudo) > 1:
+            self.formulas[chave] = conteudo
+        elif isinstance(conteudo, (datetime, date)):
+            self.valores[chave] = float(to_excel(conteudo))
+        else:
+            self.valores[chave] = conteudo
+
+    def valor(self, aba, linha, coluna):
+        chave = (aba, linha, coluna)
+        if chave in self.valores:
+            return self.valores[chave]
+        formula = self.formulas.get(chave)
+        if formula is None:
+            return None
+        if chave in self._em_avaliacao:
+            raise ValueError(f"Referência circular em {aba}!{get_column_letter(coluna)}{linha}")
+        if isinstance(formula, str):
+            formula = self.formulas[chave] = compilar_formula(formula)
+        self._em_avaliacao.add(chave)
+        try:
+            valor = _escalar(formula(self, aba))
+            # Uma fórmula que resulta em uma célula vazia vale 0
+            valor = 0.0 if valor is None else valor
+        except ErroExcel as erro:
+            valor = erro
+        finally:
+            self._em_avaliacao.discard(chave)
+        self.valores[chave] = valor
+        return valor
+
+
+class TabelaDRE:
+    """
+    Valores calculados da aba DRE ({(linha, coluna): valor}). Erros do
+    Excel ficam como ErroExcel e células em branco como None.
+    """
+
+    __slots__ = ('plano', 'celulas')
+
+    def __init__(self, plano, celulas):
+        self.plano = plano
+        self.celulas = celulas
+
+    @property
+    def chaves(self):
+        return [plano.item.chave for plano in self.plano.linhas if plano.item.chave]
+
+    def serie(self, chave):
+        linha = self.plano.linha(chave)
+        return [self.celulas.get((linha, COLUNA_INICIAL + i)) for i in range(self.plano.num_colunas)]
+
+    def como_array(self):
+        """Matriz (chaves × meses) em float64, com NaN para erros e células não numéricas."""
+        matriz = np.full((len(self.chaves), self.plano.num_colunas), np.nan)
+        for indice, chave in enumerate(self.chaves):
+            for mes, valor in enumerate(self.serie(chave)):
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    matriz[indice, mes] = valor
+        return matriz
+
+    def valores_em_cache(self):
+        """Valores por coordenada (ex.: {'E5': 0.12}), para gravar como cache das fórmulas."""
+        return {f'{get_column_letter(coluna)}{linha}': valor for (linha, coluna), valor in self.celulas.items()
+                if valor is not None}
+
+    def divergencias(self, ws, tolerancia=1e-6):
+        """
+        Compara os valores calculados com os de uma aba DRE lida com
+        load_workbook(data_only=True) (ex.: após o recálculo no Excel).
+        Devolve (coordenada, esperado, encontrado) das células diferentes;
+        números são comparados com tolerância relativa.
+        """
+        diferentes = []
+        for (linha, coluna), esperado in sorted(self.celulas.items()):
+            encontrado = ws.cell(row=linha, column=coluna).value
+            if isinstance(encontrado, (datetime, date)):
+                encontrado = float(to_excel(encontrado))
+            if isinstance(esperado, ErroExcel):
+                igual = encontrado == esperado.codigo
+            elif isinstance(esperado, (int, float)) and not isinstance(esperado, bool):
+                igual = (isinstance(encontrado, (int, float)) and not isinstance(encontrado, bool)
+                         and math.isclose(esperado, encontrado, rel_tol=tolerancia, abs_tol=tolerancia))
+            else:
+                igual = encontrado == esperado
+            if not igual:
+                diferentes.append((f'{get_column_letter(coluna)}{linha}', esperado, encontrado))
+        return diferentes
+
+
+def avaliar_dre(plano, data_inicial, series_fontes, totais_depreciacao=None, chaves=None):
+    """
+    Calcula todas as células da DRE do `plano` compilado. `series_fontes`
+    traz, por chave, a série mensal (já com o sinal) de cada linha
+    ITEM_FONTE; `totais_depreciacao` é o TOTAL D&A de cada mês (None se não
+    houver a aba Investimentos, o que zera o D&A). Com `chaves`, a tabela
+    traz só as linhas dessas chaves, e só as células de que elas dependem
+    são calculadas.
+    """
+    avaliador = AvaliadorFormulas()
+    num_colunas = plano.num_colunas
+
+    avaliador.definir(ABA_DRE, LINHA_DATAS, COLUNA_INICIAL, datetime.strptime(data_inicial, '%Y-%m-%d'))
+    for i in range(1, num_colunas):
+        avaliador.definir(ABA_DRE, LINHA_DATAS, COLUNA_INICIAL + i, FORMULA_DATA_MES.format(ant=plano.letras[i - 1]))
+    if totais_depreciacao is not None:
+        for i, total in enumerate(totais_depreciacao):
+            avaliador.definir(ABA_INVESTIMENTOS, LINHA_TOTAL_INVESTIMENTOS, COLUNA_INICIAL_INVESTIMENTOS + i,
+                              float(total))
+
+    linhas = []
+    for linha_plano in plano.linhas:
+        item = linha_plano.item
+        if linha_plano.formulas is not None:
+            conteudos = linha_plano.formulas
+        elif item.tipo == ITEM_FONTE:
+            conteudos = [float(valor) for valor in series_fontes.get(item.chave, [0.0] * num_colunas)]
+        else:
+            continue
+        for i, conteudo in enumerate(conteudos):
+            avaliador.definir(ABA_DRE, linha_plano.linha, COLUNA_INICIAL + i, conteudo)
+        linhas.append(linha_plano.linha)
+
+    if chaves is not None:
+        linhas = [plano.linha(chave) for chave in chaves]
+
+    celulas = {}
+    for i in range(num_colunas):
+        coluna = COLUNA_INICIAL + i
+        if chaves is None:
+            celulas[(LINHA_DATAS, coluna)] = avaliador.valor(ABA_DRE, LINHA_DATAS, coluna)
+        for linha in linhas:
+            celulas[(linha, coluna)] = avaliador.valor(ABA_DRE, linha, coluna)
+    return TabelaDRE(plano, celulas)
@@ -0,0 +1,198 @@
+"""
+Benchmarks da geração da DRE.
+
+Cada caso gera (ou reaproveita) um arquivo sintético (ver sintetico.py) e
+executa processar_dre em um processo novo, medindo o tempo de cada fase
+(spans de instrumentacao.py) e o pico de memória (RSS) do processo.
+
+Os resultados são gravados em JSON. Com --comparar, os totais são
+comparados aos de um resultado anterior e o código de saída é 1 se algum
+caso ficou mais lento do que a tolerância.
+
+Uso:
+    python -m benchmarks.executar --casos pequeno medio --saida resultados.json
+    python -m benchmarks.executar --comparar resultados_anteriores.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.sintetico import ConfiguracaoSintetica, gerar_entrada
+
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+DIRETORIO_DADOS = os.path.join(DIRETORIO, 'dados')
+
+# Casos padrão: (vendas, ativos, meses)
+CASOS = {
+    'pequeno': ConfiguracaoSintetica(vendas=10000, ativos=10, meses=12),
+    'medio': ConfiguracaoSintetica(vendas=100000, ativos=100, meses=36),
+    'grande': ConfiguracaoSintetica(vendas=1000000, ativos=1000, meses=60),
+    'maximo': ConfiguracaoSintetica(vendas=5000000, ativos=10000, meses=120),
+}
+CASOS_PADRAO = ('pequeno', 'medio')
+
+TOLERANCIA_PADRAO = 0.2
+
+
+def pico_rss_mb():
+    """Pico de memória residente do processo atual em MB, ou None se indisponível."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em bytes no macOS e em KB nos demais sistemas
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _executar_caso(entrada, externas, modo, streaming, fila):
+    import instrumentacao
+    import main
+
+    medicoes = instrumentacao.ativar()
+    destino = os.path.splitext(entrada)[0] + '_dre.xlsx'
+    inicio = time.perf_counter()
+    try:
+        resultado = main.processar_dre(entrada, destino, modo=modo, streaming=streaming, externas=externas)
+        instrumentacao.desativar()
+        fila.put({
+            'total': time.perf_counter() - inicio,
+            'fases': medicoes.por_fase(),
+            'cpu_fases': {span.nome: span.cpu_segundos for span in medicoes.spans},
+            'contagens': {span.nome: span.contagens for span in medicoes.spans if span.contagens},
+            'pico_rss_mb': pico_rss_mb(),
+            'num_meses': resultado.num_meses,
+            'modo': resultado.modo,
+        })
+    except Exception as e:
+        fila.put({'erro': f'{type(e).__name__}: {e}'})
+    finally:
+        if os.path.exists(destino):
+            os.remove(destino)
+
+
+def executar_caso(entrada, externas, modo=None, streaming=None):
+    """Executa a DRE em um processo novo, para medir o pico de memória do caso."""
+    contexto = multiprocessing.get_context('spawn')
+    fila = contexto.Queue()
+    processo = contexto.Process(target=_executar_caso, args=(entrada, externas, modo, streaming, fila))
+    processo.start()
+    while True:
+        try:
+            medicao = fila.get(timeout=1)
+            break
+        except queue.Empty:
+            if not processo.is_alive():
+                # Ex.: processo encerrado pelo sistema por falta de memória
+                medicao = {'erro': f'Processo encerrado (código {processo.exitcode})'}
+                break
+    processo.join()
+    return medicao
+
+
+def preparar_entrada(nome, config):
+    """Gera o arquivo do caso em benchmarks/dados, ou reaproveita o já gerado."""
+    os.makedirs(DIRETORIO_DADOS, exist_ok=True)
+    chave = '_'.join(f'{campo}{valor}' for campo, valor in config.como_dict().items())
+    caminho = os.path.join(DIRETORIO_DADOS, f'{nome}_{chave}.xlsx')
+    caminho_externas = caminho + '.externas.json'
+    if os.path.exists(caminho) and os.path.exists(caminho_externas):
+        with open(caminho_externas, encoding='utf-8') as arquivo:
+            return caminho, json.load(arquivo)
+    print(f"Gerando arquivo sintético do caso '{nome}'...")
+    externas = gerar_entrada(caminho, config)
+    with open(caminho_externas, 'w', encoding='utf-8') as arquivo:
+        json.dump(externas, arquivo)
+    return caminho, externas
+
+
+def _versao():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=DIRETORIO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(resultados, anteriores, tolerancia):
+    """
+    Compara o tempo total de cada caso com o de um resultado anterior.
+    Devolve os nomes dos casos mais lentos do que a tolerância.
+    """
+    por_nome = {caso['nome']: caso for caso in anteriores.get('casos', [])}
+    lentos = []
+    for caso in resultados['casos']:
+        anterior = por_nome.get(caso['nome'])
+        if anterior is None or 'total' not in caso or 'total' not in anterior:
+            continue
+        razao = caso['total'] / anterior['total']
+        marca = '⚠' if razao > 1 + tolerancia else '✓'
+        print(f"{marca} {caso['nome']}: {anterior['total']:.2f}s -> {caso['total']:.2f}s ({razao:.2f}x)")
+        if razao > 1 + tolerancia:
+            lentos.append(caso['nome'])
+    return lentos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks da geração da DRE.')
+    parser.add_argument('--casos', nargs='+', default=list(CASOS_PADRAO), choices=sorted(CASOS),
+                        help=f"Casos a executar (padrão: {' '.join(CASOS_PADRAO)})")
+    parser.add_argument('--repeticoes', type=int, default=1,
+                        help='Execuções por caso; vale a de menor tempo total (padrão: 1)')
+    parser.add_argument('--modo', default=None, help='Modo da DRE (padrão: parametros.modo_dre)')
+    parser.add_argument('--sem-streaming', dest='streaming', action='store_false',
+                        help='Carrega o workbook em modo de escrita (padrão: saída em streaming)')
+    parser.add_argument('--saida', default='resultados_benchmark.json',
+                        help='Arquivo JSON de resultados (padrão: resultados_benchmark.json)')
+    parser.add_argument('--comparar', default=None, help='Resultado anterior (JSON) para comparação')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help='Aumento de tempo aceito na comparação (padrão: 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    resultados = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'versao': _versao(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'modo': args.modo,
+        'streaming': args.streaming,
+        'casos': [],
+    }
+    for nome in args.casos:
+        config = CASOS[nome]
+        entrada, externas = preparar_entrada(nome, config)
+        medicoes = [executar_caso(entrada, externas, args.modo, args.streaming) for _ in range(args.repeticoes)]
+        validas = [m for m in medicoes if 'erro' not in m]
+        caso = {'nome': nome, 'config': config.como_dict()}
+        if validas:
+            caso.update(min(validas, key=lambda m: m['total']))
+            fases = ', '.join(f"{fase} {segundos:.2f}s" for fase, segundos in caso['fases'].items())
+            print(f"✓ {nome}: {caso['total']:.2f}s, pico {caso['pico_rss_mb'] or 0:.0f} MB ({fases})")
+        else:
+            caso['erro'] = medicoes[0]['erro']
+            print(f"❌ {nome}: {caso['erro']}")
+        resultados['casos'].append(caso)
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em: {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anteriores = json.load(arquivo)
+        print(f"\nComparação com {args.comparar}:")
+        if comparar(resultados, anteriores, args.tolerancia):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+"""
+Gerador determinístico de arquivos de entrada sintéticos para os benchmarks.
+
+Gera as cinco abas fontes (Vendas, Custo_Despesas, Folha, Investimentos e
+Financiamento) com a mesma estrutura de entrada.xlsx, no tamanho pedido.
+A mesma semente gera sempre o mesmo arquivo. Abas com mais linhas do que
+cabem em uma planilha do Excel são gravadas em CSV, para serem lidas como
+fontes externas (ver ingestao.ler_aba_externa).
+
+Uso:
+    python -m benchmarks.sintetico saida.xlsx --vendas 100000 --ativos 100 --meses 36
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime
+
+import openpyxl
+
+
+# Linhas de dados que cabem em uma planilha (1.048.576 menos o cabeçalho)
+LIMITE_LINHAS_XLSX = 1048575
+
+CLIENTES = ('Hospital A', 'Clínica B', 'Laboratório C', 'Hospital D', 'Clínica E')
+PRODUTOS = ('Produto A', 'Produto B', 'Produto C')
+CATEGORIAS = ('Armazenagem', 'Frete', 'Matéria-prima', 'Marketing', 'Comercial', 'Administrativo')
+DESCRICOES_ATIVOS = ('Expansão', 'Equipamento', 'Software', 'Veículo')
+
+CABECALHOS = {
+    'Vendas': ('Cliente', 'Produto', 'Quantidade', 'Valor_Unitário', 'Valor_Líquido', 'Mês'),
+    'Custo_Despesas': ('Categoria', 'Valor', 'Mês'),
+    'Folha': ('Mês', 'Funcionário', 'Salário_Bruto', 'Encargos', 'Benefícios'),
+    'Investimentos': ('Mês', 'Descrição', 'Valor'),
+    'Financiamento': ('Parcela', 'Data_Pagamento', 'Prestação', 'Juros', 'Amortização',
+                      'Saldo_Devedor_Antes', 'Saldo_Devedor_Depois'),
+}
+
+
+class ConfiguracaoSintetica:
+    """Tamanho e semente de um arquivo sintético."""
+
+    __slots__ = ('vendas', 'custos', 'funcionarios', 'ativos', 'meses', 'semente', 'data_inicial')
+
+    def __init__(self, vendas=10000, ativos=10, meses=12, custos=None, funcionarios=50, semente=42,
+                 data_inicial=datetime(2024, 1, 1)):
+        self.vendas = vendas
+        self.custos = 2 * vendas if custos is None else custos
+        self.funcionarios = funcionarios
+        self.ativos = ativos
+        self.meses = meses
+        self.semente = semente
+        self.data_inicial = data_inicial
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__ if campo != 'data_inicial'}
+
+
+def _mes(config, indice):
+    mes = config.data_inicial.month - 1 + indice
+    return config.data_inicial.year + mes // 12, mes % 12 + 1
+
+
+def _data(config, rng):
+    ano, mes = _mes(config, rng.randrange(config.meses))
+    return datetime(ano, mes, rng.randint(1, 28))
+
+
+def _linhas_vendas(config, rng):
+    for _ in range(config.vendas):
+        quantidade = rng.randint(1, 40)
+        unitario = rng.uniform(500, 2500)
+        yield (rng.choice(CLIENTES), rng.choice(PRODUTOS), quantidade, unitario, quantidade * unitario,
+               _data(config, rng))
+
+
+def _linhas_custos(config, rng):
+    for _ in range(config.custos):
+        yield rng.choice(CATEGORIAS), rng.uniform(100, 10000), _data(config, rng)
+
+
+def _linhas_folha(config, rng):
+    for indice in range(config.meses):
+        data = datetime(*_mes(config, indice), 1)
+        for funcionario in range(config.funcionarios):
+            yield (data, f'Funcionário {funcionario + 1}', rng.uniform(5000, 35000), rng.uniform(1000, 11000),
+                   rng.uniform(500, 6000))
+
+
+def _linhas_investimentos(config, rng):
+    for _ in range(config.ativos):
+        data = datetime(*_mes(config, rng.randrange(config.meses)), 1)
+        yield data, rng.choice(DESCRICOES_ATIVOS), rng.uniform(5000, 100000)
+
+
+def _gravar_csv(caminho, cabecalho, linhas):
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(cabecalho)
+        for linha in linhas:
+            escritor.writerow([valor.strftime('%Y-%m-%d') if isinstance(valor, datetime) else valor
+                               for valor in linha])
+
+
+def _gravar_aba(wb, nome, linhas):
+    ws = wb.create_sheet(nome)
+    ws.append(CABECALHOS[nome])
+    for linha in linhas:
+        ws.append(linha)
+    return ws
+
+
+def _gravar_financiamento(wb, config, rng):
+    ws = wb.create_sheet('Financiamento')
+    # Tabela de parcelas nas colunas A:G e, como esperado pela DRE, datas na
+    # linha 4 e juros na linha 5 a partir da coluna J (até AZ)
+    meses_linhas = min(config.meses, 43)
+    datas = [datetime(*_mes(config, i), 1) for i in range(config.meses)]
+    saldo = 1000000.0
+    parcelas = []
+    for parcela, data in enumerate(datas, start=1):
+        juros = saldo * 0.01
+        amortizacao = rng.uniform(20000, 40000)
+        parcelas.append((parcela, data, juros + amortizacao, juros, amortizacao, saldo, saldo - amortizacao))
+        saldo -= amortizacao
+    linhas = [CABECALHOS['Financiamento']] + parcelas
+    for numero_linha in range(1, max(len(linhas), 5) + 1):
+        linha = list(linhas[numero_linha - 1]) if numero_linha <= len(linhas) else [None] * 7
+        if numero_linha == 4:
+            linha += [None, None] + datas[:meses_linhas]
+        elif numero_linha == 5:
+            linha += [None, None] + [p[3] for p in parcelas[:meses_linhas]]
+        ws.append(linha)
+
+
+def gerar_entrada(caminho, config=None):
+    """
+    Grava o arquivo sintético em `caminho` (modo write_only). Devolve as
+    abas gravadas em CSV ao lado do arquivo ({aba: caminho}), para uso como
+    fontes externas.
+    """
+    config = config or ConfiguracaoSintetica()
+    rng = random.Random(config.semente)
+    base = os.path.splitext(caminho)[0]
+    externas = {}
+
+    wb = openpyxl.Workbook(write_only=True)
+    for nome in ('DFC', 'BP'):
+        wb.create_sheet(nome)
+    for nome, total, linhas in (('Vendas', config.vendas, _linhas_vendas(config, rng)),
+                                ('Custo_Despesas', config.custos, _linhas_custos(config, rng))):
+        if total > LIMITE_LINHAS_XLSX:
+            externas[nome] = f'{base}_{nome}.csv'
+            _gravar_csv(externas[nome], CABECALHOS[nome], linhas)
+            _gravar_aba(wb, nome, ())
+        else:
+            _gravar_aba(wb, nome, linhas)
+    _gravar_aba(wb, 'Investimentos', _linhas_investimentos(config, rng))
+    _gravar_aba(wb, 'Folha', _linhas_folha(config, rng))
+    _gravar_financiamento(wb, config, rng)
+    wb.save(caminho)
+    return externas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera um arquivo de entrada sintético para a DRE.')
+    parser.add_argument('saida', help='Arquivo .xlsx a gerar')
+    parser.add_argument('--vendas', type=int, default=10000, help='Linhas de Vendas (padrão: 10000)')
+    parser.add_argument('--custos', type=int, default=None, help='Linhas de Custo_Despesas (padrão: 2 x vendas)')
+    parser.add_argument('--funcionarios', type=int, default=50, help='Funcionários por mês na Folha (padrão: 50)')
+    parser.add_argument('--ativos', type=int, default=10, help='Linhas de Investimentos (padrão: 10)')
+    parser.add_argument('--meses', type=int, default=12, help='Meses cobertos pelos dados (padrão: 12)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente do gerador (padrão: 42)')
+    args = parser.parse_args(argv)
+
+    config = ConfiguracaoSintetica(args.vendas, args.ativos, args.meses, args.custos, args.funcionarios,
+                                   args.semente)
+    externas = gerar_entrada(args.saida, config)
+    print(f"✓ Arquivo gerado: {args.saida}")
+    for aba, caminho in externas.items():
+        print(f"  - Aba '{aba}' gravada em CSV: {caminho}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
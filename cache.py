@@ -0,0 +1,226 @@
+"""
+Cache em disco das execuções da DRE (SQLite).
+
+Dois níveis de cache:
+- execuções: hash do arquivo de entrada, impressão digital dos parâmetros,
+  destino e hash do arquivo gerado. Se a entrada é o próprio arquivo gerado
+  por uma execução anterior com os mesmos parâmetros (saída sobre a entrada),
+  ou se a saída registrada para esta entrada ainda existe sem alterações, a
+  execução é dispensada.
+- abas: hash do conteúdo lido de cada aba fonte, com o resumo da varredura de
+  datas e os agregados mensais daquela aba. Quando só algumas abas mudaram,
+  as demais não são varridas nem agregadas novamente.
+
+O tamanho total das entradas é limitado; ao ultrapassar o limite, as
+entradas usadas há mais tempo são removidas.
+
+Por padrão o arquivo fica no diretório de cache do usuário
+(caminho_cache_padrao), não no diretório de trabalho.
+
+O mesmo arquivo guarda o estado do modo incremental (ver incremental.py) por
+arquivo e aba. Esse estado não entra no limite de tamanho: perdê-lo apenas
+força uma leitura completa.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+from modelo import AbaCompacta
+
+
+# Incrementar quando o formato dos dados guardados ou o cálculo mudar
+VERSAO_CACHE = 3
+
+TAMANHO_BLOCO = 1 << 20
+
+
+def caminho_cache_padrao():
+    """
+    Arquivo do cache no diretório de cache do usuário: %LOCALAPPDATA%\\dre
+    no Windows, $XDG_CACHE_HOME/dre ou ~/.cache/dre nos demais sistemas. O
+    diretório é criado se não existir.
+    """
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else os.environ.get('XDG_CACHE_HOME')
+    diretorio = os.path.join(base or os.path.join(os.path.expanduser('~'), '.cache'), 'dre')
+    os.makedirs(diretorio, exist_ok=True)
+    return os.path.join(diretorio, 'cache.sqlite')
+
+
+def hash_arquivo(arquivo):
+    """SHA-256 do conteúdo de um arquivo (caminho ou bytes)."""
+    h = hashlib.sha256()
+    if isinstance(arquivo, (bytes, bytearray)):
+        h.update(arquivo)
+        return h.hexdigest()
+    with open(arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def hash_aba(aba):
+    """
+    SHA-256 do conteúdo lido de uma aba fonte: as transações e o resumo de
+    datas de uma modelo.AbaCompacta, ou os valores de uma ingestao.AbaFonte.
+    """
+    h = hashlib.sha256(f'{VERSAO_CACHE}:{aba.nome}:{aba.primeira_linha}:{aba.ultima_linha}'.encode())
+    if isinstance(aba, AbaCompacta):
+        transacoes = aba.transacoes
+        for valores in (transacoes.meses, transacoes.valores, transacoes.categorias):
+            if valores is not None:
+                h.update(valores.tobytes())
+        if transacoes.tabela is not None:
+            h.update(repr(transacoes.tabela.rotulos).encode())
+        h.update(repr(aba.datas).encode())
+        return h.hexdigest()
+    for campo in sorted(aba.colunas):
+        h.update(campo.encode())
+        h.update(repr(aba.colunas[campo]).encode())
+    return h.hexdigest()
+
+
+def impressao_parametros(valores):
+    """Impressão digital de um dicionário de parâmetros."""
+    texto = json.dumps(valores, sort_keys=True, default=str)
+    return hashlib.sha256(f'{VERSAO_CACHE}:{texto}'.encode()).hexdigest()
+
+
+class ExecucaoEmCache:
+    """Dados de uma execução anterior encontrada no cache."""
+
+    __slots__ = ('data_inicial', 'num_meses', 'modo', 'datas_invalidas')
+
+    def __init__(self, data_inicial, num_meses, modo, datas_invalidas):
+        self.data_inicial = data_inicial
+        self.num_meses = num_meses
+        self.modo = modo
+        self.datas_invalidas = datas_invalidas
+
+
+class CacheDRE:
+    """Cache em um arquivo SQLite, limitado a `tamanho_maximo` bytes."""
+
+    def __init__(self, caminho, tamanho_maximo):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self._conexao = sqlite3.connect(caminho, timeout=30)
+        with self._conexao:
+            self._conexao.execute(
+                'CREATE TABLE IF NOT EXISTS execucoes ('
+                ' hash_entrada TEXT, parametros TEXT, destino TEXT, hash_saida TEXT,'
+                ' dados BLOB, tamanho INTEGER, ultimo_uso REAL,'
+                ' PRIMARY KEY (hash_entrada, parametros, destino))'
+            )
+            self._conexao.execute(
+                'CREATE TABLE IF NOT EXISTS abas ('
+                ' hash TEXT PRIMARY KEY, aba TEXT, dados BLOB, tamanho INTEGER, ultimo_uso REAL)'
+            )
+            self._conexao.execute(
+                'CREATE TABLE IF NOT EXISTS incrementais ('
+                ' arquivo TEXT, aba TEXT, versao INTEGER, dados BLOB, PRIMARY KEY (arquivo, aba))'
+            )
+
+    def fechar(self):
+        self._conexao.close()
+
+    def buscar_execucao(self, hash_entrada, parametros, destino):
+        """
+        Procura uma execução que torne desnecessário gerar `destino` de novo.
+        Devolve ExecucaoEmCache ou None.
+        """
+        destino = os.path.abspath(destino)
+        linhas = self._conexao.execute(
+            'SELECT hash_entrada, hash_saida, dados FROM execucoes'
+            ' WHERE parametros = ? AND destino = ? AND (hash_entrada = ? OR hash_saida = ?)',
+            (parametros, destino, hash_entrada, hash_entrada),
+        ).fetchall()
+        for entrada_registrada, saida_registrada, dados in linhas:
+            if saida_registrada == hash_entrada:
+                # A entrada é o arquivo gerado por essa execução
+                valido = True
+            else:
+                valido = os.path.exists(destino) and hash_arquivo(destino) == saida_registrada
+            if valido:
+                with self._conexao:
+                    self._conexao.execute(
+                        'UPDATE execucoes SET ultimo_uso = ?'
+                        ' WHERE hash_entrada = ? AND parametros = ? AND destino = ?',
+                        (time.time(), entrada_registrada, parametros, destino),
+                    )
+                return ExecucaoEmCache(*pickle.loads(dados))
+        return None
+
+    def registrar_execucao(self, hash_entrada, parametros, destino, hash_saida, resultado):
+        dados = pickle.dumps((resultado.data_inicial, resultado.num_meses, resultado.modo,
+                              resultado.datas_invalidas))
+        with self._conexao:
+            self._conexao.execute(
+                'INSERT OR REPLACE INTO execucoes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (hash_entrada, parametros, os.path.abspath(destino), hash_saida, dados, len(dados),
+                 time.time()),
+            )
+        self._podar()
+
+    def buscar_aba(self, hash_conteudo):
+        linha = self._conexao.execute('SELECT dados FROM abas WHERE hash = ?', (hash_conteudo,)).fetchone()
+        if linha is None:
+            return None
+        with self._conexao:
+            self._conexao.execute('UPDATE abas SET ultimo_uso = ? WHERE hash = ?', (time.time(), hash_conteudo))
+        return pickle.loads(linha[0])
+
+    def guardar_aba(self, hash_conteudo, aba, objeto):
+        dados = pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._conexao:
+            self._conexao.execute('INSERT OR REPLACE INTO abas VALUES (?, ?, ?, ?, ?)',
+                                  (hash_conteudo, aba, dados, len(dados), time.time()))
+        self._podar()
+
+    def buscar_estado(self, arquivo, aba):
+        """Estado incremental de uma aba de um arquivo, ou None."""
+        linha = self._conexao.execute(
+            'SELECT dados FROM incrementais WHERE arquivo = ? AND aba = ? AND versao = ?',
+            (os.path.abspath(arquivo), aba, VERSAO_CACHE),
+        ).fetchone()
+        return pickle.loads(linha[0]) if linha is not None else None
+
+    def guardar_estado(self, arquivo, aba, estado):
+        dados = pickle.dumps(estado, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._conexao:
+            self._conexao.execute('INSERT OR REPLACE INTO incrementais VALUES (?, ?, ?, ?)',
+                                  (os.path.abspath(arquivo), aba, VERSAO_CACHE, dados))
+
+    def remover_estados(self, arquivo):
+        with self._conexao:
+            self._conexao.execute('DELETE FROM incrementais WHERE arquivo = ?', (os.path.abspath(arquivo),))
+
+    def tamanho_total(self):
+        total = 0
+        for tabela in ('execucoes', 'abas'):
+            total += self._conexao.execute(f'SELECT COALESCE(SUM(tamanho), 0) FROM {tabela}').fetchone()[0]
+        return total
+
+    def _podar(self):
+        """Remove as entradas usadas há mais tempo até respeitar o tamanho máximo."""
+        excesso = self.tamanho_total() - self.tamanho_maximo
+        if excesso <= 0:
+            return
+        entradas = self._conexao.execute(
+            "SELECT 'abas', hash, NULL, NULL, tamanho, ultimo_uso FROM abas"
+            " UNION ALL SELECT 'execucoes', hash_entrada, parametros, destino, tamanho, ultimo_uso FROM execucoes"
+            ' ORDER BY ultimo_uso'
+        ).fetchall()
+        with self._conexao:
+            for tabela, chave, parametros, destino, tamanho, _ in entradas:
+                if excesso <= 0:
+                    break
+                if tabela == 'abas':
+                    self._conexao.execute('DELETE FROM abas WHERE hash = ?', (chave,))
+                else:
+                    self._conexao.execute(
+                        'DELETE FROM execucoes WHERE hash_entrada = ? AND parametros = ? AND destino = ?',
+                        (chave, parametros, destino))
+                excesso -= tamanho
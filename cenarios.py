@@ -0,0 +1,206 @@
+"""
+Cenários de sensibilidade sobre os parâmetros da DRE.
+
+Um cenário altera parâmetros da configuração (ver configuracao.py):
+taxa_imposto, limite_compensacao_prejuizo, vida_util_padrao ou a vida útil
+de um tipo de ativo ('vida_util_ativos.<descrição>', ex.:
+'vida_util_ativos.Software'). Os valores passam pelas mesmas validações da
+configuração (Configuracao.alterar): taxas e limites entre 0 e 100, vidas
+úteis maiores que zero.
+
+A leitura, a agregação das abas fontes e os investimentos vêm de uma única
+passada pelo arquivo (ver main.simular_cenarios); a DRE base é calculada
+uma vez (BaseCenarios). Em cada cenário só as linhas que dependem desses
+parâmetros são recalculadas, em arrays cenários × meses: o D&A (uma vez por
+combinação distinta de vidas úteis), o EBIT e o EBT (que variam junto com o
+D&A), a compensação de prejuízo e o imposto (ver impostos.py, de uma vez
+para todos os cenários) e o lucro líquido.
+"""
+import itertools
+import math
+
+import numpy as np
+
+from avaliacao import avaliar_dre
+from consolidacao import series_entidade
+from depreciacao import Investimentos, total_depreciacao
+from impostos import compensar_prejuizo
+
+
+PARAMETROS_CENARIO = ('taxa_imposto', 'limite_compensacao_prejuizo', 'vida_util_padrao')
+PREFIXO_VIDA_UTIL = 'vida_util_ativos.'
+
+# Linhas da DRE recalculadas em cada cenário
+LINHAS_CENARIO = ('depreciacao', 'ebit', 'ebt', 'impostos', 'lucro_liquido')
+
+
+def validar_parametro(nome):
+    if nome in PARAMETROS_CENARIO or (nome.startswith(PREFIXO_VIDA_UTIL) and len(nome) > len(PREFIXO_VIDA_UTIL)):
+        return
+    raise ValueError(f"Parâmetro não suportado nos cenários: {nome}. Use um de: "
+                     f"{', '.join(PARAMETROS_CENARIO)} ou {PREFIXO_VIDA_UTIL}<descrição>")
+
+
+def _formatar(valor):
+    return f'{valor:g}' if isinstance(valor, (int, float)) else str(valor)
+
+
+class Cenario:
+    """Valores de parâmetros alterados em relação à base ({parâmetro: valor})."""
+
+    __slots__ = ('nome', 'valores')
+
+    def __init__(self, valores, nome=None):
+        for parametro in valores:
+            validar_parametro(parametro)
+        self.valores = dict(valores)
+        self.nome = nome or ', '.join(f'{parametro}={_formatar(valor)}' for parametro, valor in self.valores.items())
+
+
+def _ler_valor(parametro, texto):
+    try:
+        valor = float(texto)
+    except ValueError:
+        valor = math.nan
+    if not math.isfinite(valor):
+        raise ValueError(f"Valor inválido para {parametro}: {texto.strip()!r} (use números separados por vírgula)")
+    return valor
+
+
+def ler_variacao(texto, config=None):
+    """
+    Lê 'parametro=v1,v2,...' (opção --variar) em (parâmetro, [valores]).
+    Com `config`, os valores são validados como na configuração.
+    """
+    parametro, separador, valores = texto.partition('=')
+    if not separador or not valores:
+        raise ValueError(f"Variação deve ter o formato PARAMETRO=V1,V2,...: {texto}")
+    validar_parametro(parametro)
+    valores = [_ler_valor(parametro, valor) for valor in valores.split(',')]
+    if config is not None:
+        for valor in valores:
+            config.alterar({parametro: valor})
+    return parametro, valores
+
+
+def validar_cenarios(cenarios, config):
+    """Valida os valores de cada cenário aplicados sobre `config` (ver Configuracao.alterar)."""
+    for cenario in cenarios:
+        try:
+            config.alterar(cenario.valores)
+        except ValueError as e:
+            raise ValueError(f"Cenário inválido ({cenario.nome}): {e}") from None
+
+
+def grade(variacoes):
+    """
+    Cenário base (sem alterações) seguido dos cenários de todas as
+    combinações de `variacoes` ({parâmetro: [valores]}).
+    """
+    nomes = list(variacoes)
+    cenarios = [Cenario({}, 'Base')]
+    for combinacao in itertools.product(*(variacoes[nome] for nome in nomes)):
+        cenarios.append(Cenario(dict(zip(nomes, combinacao))))
+    return cenarios
+
+
+class BaseCenarios:
+    """
+    Dados comuns a todos os cenários: investimentos lidos (ou None), eixo de
+    meses, parâmetros da base ({nome: valor}, com vida_util_ativos como
+    dicionário) e as linhas depreciacao, ebit e ebt da DRE base.
+    """
+
+    __slots__ = ('investimentos', 'mes_inicial', 'num_meses', 'parametros', 'depreciacao', 'ebit', 'ebt')
+
+    def __init__(self, investimentos, mes_inicial, num_meses, parametros, depreciacao, ebit, ebt):
+        self.investimentos = investimentos
+        self.mes_inicial = mes_inicial
+        self.num_meses = num_meses
+        self.parametros = parametros
+        self.depreciacao = depreciacao
+        self.ebit = ebit
+        self.ebt = ebt
+
+    def valor(self, cenario, parametro):
+        """Valor do parâmetro no cenário, ou o da base."""
+        if parametro in cenario.valores:
+            return cenario.valores[parametro]
+        if parametro.startswith(PREFIXO_VIDA_UTIL):
+            descricao = parametro[len(PREFIXO_VIDA_UTIL):]
+            return self.parametros['vida_util_ativos'].get(descricao, self.valor(cenario, 'vida_util_padrao'))
+        return self.parametros[parametro]
+
+
+def base_cenarios(entidade, plano, data_inicial, mes_inicial, parametros):
+    """
+    Calcula a DRE base de uma entidade lida (consolidacao.DadosEntidade)
+    com os `parametros` da base, restrita às linhas de que os cenários
+    partem.
+    """
+    series = series_entidade(entidade, plano, mes_inicial)
+    tabela = avaliar_dre(plano, data_inicial, series, 0.0 - series['depreciacao'],
+                         chaves=('depreciacao', 'ebit', 'ebt'))
+    matriz = tabela.como_array()
+    linhas = [matriz[tabela.chaves.index(chave)] for chave in ('depreciacao', 'ebit', 'ebt')]
+    if not np.isfinite(linhas).all():
+        raise ValueError("O EBT da DRE base tem valores não numéricos")
+    return BaseCenarios(entidade.investimentos, mes_inicial, plano.num_colunas, parametros, *linhas)
+
+
+def _depreciacao(base, vidas):
+    investimentos = base.investimentos
+    if investimentos is None:
+        return np.zeros(base.num_meses)
+    vidas_uteis = np.asarray(vidas, dtype=np.float64)[investimentos.codigos]
+    recalculados = Investimentos(investimentos.meses, investimentos.codigos, investimentos.tabela,
+                                 investimentos.valores, vidas_uteis)
+    return 0.0 - total_depreciacao(recalculados, base.mes_inicial, base.num_meses)
+
+
+class TabelaCenarios:
+    """Séries das LINHAS_CENARIO por chave, em arrays cenários × meses."""
+
+    __slots__ = ('base', 'cenarios', 'series')
+
+    def __init__(self, base, cenarios, series):
+        self.base = base
+        self.cenarios = cenarios
+        self.series = series
+
+    def valor(self, indice, parametro):
+        """Valor do parâmetro usado no cenário de índice `indice`."""
+        return self.base.valor(self.cenarios[indice], parametro)
+
+    def totais(self, chave):
+        """Total do período de uma linha, por cenário."""
+        return self.series[chave].sum(axis=1)
+
+
+def avaliar_cenarios(base, cenarios):
+    """Recalcula as LINHAS_CENARIO de todos os `cenarios` a partir da `base`."""
+    descricoes = base.investimentos.tabela.rotulos if base.investimentos is not None else []
+    depreciacao = np.empty((len(cenarios), base.num_meses))
+    por_vidas = {}
+    for indice, cenario in enumerate(cenarios):
+        vidas = tuple(base.valor(cenario, PREFIXO_VIDA_UTIL + descricao) for descricao in descricoes)
+        if vidas not in por_vidas:
+            por_vidas[vidas] = _depreciacao(base, vidas)
+        depreciacao[indice] = por_vidas[vidas]
+
+    # EBIT e EBT variam com o D&A; as demais linhas acima deles não
+    # dependem dos parâmetros dos cenários
+    variacao = depreciacao - base.depreciacao
+    ebit = base.ebit + variacao
+    ebt = base.ebt + variacao
+
+    limites = np.array([base.valor(cenario, 'limite_compensacao_prejuizo') for cenario in cenarios]) / 100
+    taxas = np.array([base.valor(cenario, 'taxa_imposto') for cenario in cenarios]) / 100
+    impostos = compensar_prejuizo(ebt, limites[:, None], taxas[:, None])['impostos']
+    return TabelaCenarios(base, cenarios, {
+        'depreciacao': depreciacao,
+        'ebit': ebit,
+        'ebt': ebt,
+        'impostos': impostos,
+        'lucro_liquido': ebt + impostos,
+    })
@@ -0,0 +1,276 @@
+"""
+Configuração da geração da DRE.
+
+Os parâmetros (CAMPOS) vêm de parametros.py ou de um arquivo JSON, TOML ou
+YAML com as mesmas chaves (as ausentes ficam com o valor de parametros.py) e
+podem ser alterados por execução com definições 'chave=valor' (opção
+--definir). O resultado é uma Configuracao validada e imutável, passada
+explicitamente às funções de main.py: processos de lote podem gerar arquivos
+com configurações diferentes ao mesmo tempo, sem estado global.
+
+Cada arquivo lido fica em cache pela data de modificação e pelo tamanho;
+um processo de longa duração relê o arquivo apenas quando ele muda, sem
+reimportar módulos.
+"""
+import json
+import os
+import runpy
+from datetime import datetime
+from types import MappingProxyType
+
+from depreciacao import MODOS_DEPRECIACAO
+from impostos import MODOS_PREJUIZO
+
+
+# Modos de geração das linhas da DRE alimentadas pelas abas fontes
+MODOS_DRE = ('formulas', 'agregado', 'valores', 'hibrido')
+
+CAMINHO_PARAMETROS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parametros.py')
+
+CAMPOS = (
+    'taxa_imposto', 'limite_compensacao_prejuizo', 'auto_detectar_periodo', 'periodo_inicio', 'periodo_final',
+    'modo_dre', 'modo_depreciacao', 'modo_prejuizo', 'vida_util_ativos', 'vida_util_padrao',
+    'usar_cache', 'caminho_cache', 'tamanho_maximo_cache_mb', 'fontes_externas',
+    'csv_delimitador', 'csv_separador_decimal', 'csv_codificacao',
+    'caminho_metricas', 'metricas_memoria', 'gravar_valores_em_cache',
+)
+# Campos dicionário: 'campo.chave' em uma definição altera um item
+CAMPOS_DICIONARIO = ('vida_util_ativos', 'fontes_externas')
+
+_LOGICOS = ('auto_detectar_periodo', 'usar_cache', 'metricas_memoria', 'gravar_valores_em_cache')
+_TEXTOS = ('csv_delimitador', 'csv_separador_decimal', 'csv_codificacao')
+_MODOS = {'modo_dre': MODOS_DRE, 'modo_depreciacao': MODOS_DEPRECIACAO, 'modo_prejuizo': MODOS_PREJUIZO}
+
+
+def _numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _validar_numero(campo, valor, minimo, maximo=None, minimo_incluso=True):
+    if not _numero(valor):
+        raise ValueError(f"Parâmetro {campo} deve ser um número: {valor!r}")
+    if maximo is not None and not minimo <= valor <= maximo:
+        raise ValueError(f"Parâmetro {campo} deve estar entre {minimo} e {maximo}: {valor!r}")
+    if valor < minimo or (valor == minimo and not minimo_incluso):
+        limite = f"maior que {minimo}" if not minimo_incluso else f"maior ou igual a {minimo}"
+        raise ValueError(f"Parâmetro {campo} deve ser {limite}: {valor!r}")
+
+
+def validar(valores):
+    """
+    Valida os valores de todos os CAMPOS ({campo: valor}) e devolve uma
+    cópia, com os dicionários copiados. Erros levantam ValueError.
+    """
+    desconhecidos = sorted(set(valores) - set(CAMPOS))
+    if desconhecidos:
+        raise ValueError(f"Parâmetro(s) desconhecido(s): {', '.join(desconhecidos)}")
+    ausentes = [campo for campo in CAMPOS if campo not in valores]
+    if ausentes:
+        raise ValueError(f"Parâmetro(s) ausente(s): {', '.join(ausentes)}")
+    valores = dict(valores)
+
+    _validar_numero('taxa_imposto', valores['taxa_imposto'], 0, 100)
+    _validar_numero('limite_compensacao_prejuizo', valores['limite_compensacao_prejuizo'], 0, 100)
+    _validar_numero('vida_util_padrao', valores['vida_util_padrao'], 0, minimo_incluso=False)
+    _validar_numero('tamanho_maximo_cache_mb', valores['tamanho_maximo_cache_mb'], 0, minimo_incluso=False)
+    for campo in _LOGICOS:
+        if not isinstance(valores[campo], bool):
+            raise ValueError(f"Parâmetro {campo} deve ser true ou false: {valores[campo]!r}")
+    for campo in _TEXTOS:
+        if not isinstance(valores[campo], str) or not valores[campo]:
+            raise ValueError(f"Parâmetro {campo} deve ser um texto não vazio: {valores[campo]!r}")
+    for campo in ('caminho_cache', 'caminho_metricas'):
+        if valores[campo] is not None and (not isinstance(valores[campo], str) or not valores[campo]):
+            raise ValueError(f"Parâmetro {campo} deve ser um caminho ou nulo: {valores[campo]!r}")
+    for campo, modos in _MODOS.items():
+        if valores[campo] not in modos:
+            raise ValueError(f"Parâmetro {campo} inválido: {valores[campo]!r}. Use um de: {', '.join(modos)}")
+    for campo in ('periodo_inicio', 'periodo_final'):
+        try:
+            datetime.strptime(valores[campo], '%m/%y')
+        except (TypeError, ValueError):
+            raise ValueError(f"Parâmetro {campo} deve ter o formato MM/YY (ex: '01/24'): "
+                             f"{valores[campo]!r}") from None
+
+    for campo in CAMPOS_DICIONARIO:
+        if not isinstance(valores[campo], (dict, MappingProxyType)):
+            raise ValueError(f"Parâmetro {campo} deve ser um dicionário: {valores[campo]!r}")
+        valores[campo] = dict(valores[campo])
+    for descricao, vida in valores['vida_util_ativos'].items():
+        _validar_numero(f"vida_util_ativos['{descricao}']", vida, 0, minimo_incluso=False)
+    for aba, caminho in valores['fontes_externas'].items():
+        if not isinstance(caminho, str) or not caminho:
+            raise ValueError(f"Parâmetro fontes_externas['{aba}'] deve ser um caminho: {caminho!r}")
+    return valores
+
+
+class Configuracao:
+    """
+    Parâmetros da geração da DRE (CAMPOS, com os nomes de parametros.py),
+    validados e imutáveis; os dicionários são somente leitura. `origem` é o
+    arquivo de onde vieram. Para alterar valores, use alterar().
+    """
+
+    __slots__ = CAMPOS + ('origem',)
+
+    def __init__(self, valores, origem=None):
+        valores = validar(valores)
+        for campo in CAMPOS_DICIONARIO:
+            valores[campo] = MappingProxyType(valores[campo])
+        for campo in CAMPOS:
+            object.__setattr__(self, campo, valores[campo])
+        object.__setattr__(self, 'origem', origem)
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError(f"Configuracao é imutável; use alterar() para mudar {nome}")
+
+    def __delattr__(self, nome):
+        raise AttributeError(f"Configuracao é imutável; não é possível remover {nome}")
+
+    def __reduce__(self):
+        # Enviada aos processos do lote e da consolidação
+        return (Configuracao, (self.como_dict(), self.origem))
+
+    def __repr__(self):
+        return f"Configuracao(origem={self.origem!r})"
+
+    def como_dict(self):
+        """Valores de todos os CAMPOS, com os dicionários copiados."""
+        valores = {campo: getattr(self, campo) for campo in CAMPOS}
+        for campo in CAMPOS_DICIONARIO:
+            valores[campo] = dict(valores[campo])
+        return valores
+
+    def alterar(self, alteracoes):
+        """
+        Nova Configuracao com `alteracoes` ({chave: valor}) aplicadas. Uma
+        chave 'campo.item' (ex.: 'vida_util_ativos.Software') altera um item
+        de um campo dicionário (CAMPOS_DICIONARIO).
+        """
+        valores = self.como_dict()
+        for chave, valor in alteracoes.items():
+            campo, separador, item = chave.partition('.')
+            if campo not in CAMPOS:
+                raise ValueError(f"Parâmetro desconhecido: {campo}")
+            if not separador:
+                valores[campo] = valor
+            elif campo in CAMPOS_DICIONARIO and item:
+                valores[campo][item] = valor
+            else:
+                raise ValueError(f"Parâmetro {campo} não aceita itens ({chave})")
+        return Configuracao(valores, self.origem)
+
+
+def ler_definicao(texto):
+    """
+    Lê 'chave=valor' (opção --definir) em (chave, valor). O valor é lido
+    como JSON (números, true/false, null, listas e objetos) ou, se não for
+    JSON válido, como texto.
+    """
+    chave, separador, valor = texto.partition('=')
+    chave = chave.strip()
+    if not separador or not chave:
+        raise ValueError(f"Definição deve ter o formato CHAVE=VALOR: {texto}")
+    try:
+        return chave, json.loads(valor)
+    except ValueError:
+        return chave, valor
+
+
+def _ler_python(caminho):
+    namespace = runpy.run_path(caminho)
+    return {nome: valor for nome, valor in namespace.items() if nome in CAMPOS}
+
+
+def _ler_json(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def _ler_toml(caminho):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError("a leitura de arquivos TOML requer Python 3.11 ou o pacote tomli")
+    with open(caminho, 'rb') as arquivo:
+        return tomllib.load(arquivo)
+
+
+def _ler_yaml(caminho):
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("a leitura de arquivos YAML requer o pacote PyYAML")
+    with open(caminho, encoding='utf-8') as arquivo:
+        return yaml.safe_load(arquivo)
+
+
+LEITORES = {
+    '.py': _ler_python,
+    '.json': _ler_json,
+    '.toml': _ler_toml,
+    '.yaml': _ler_yaml,
+    '.yml': _ler_yaml,
+}
+
+# Configurações lidas: {caminho absoluto: ((mtime_ns, tamanho), Configuracao)}
+_cache = {}
+
+
+def _ler_configuracao(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in LEITORES:
+        raise ValueError(f"Formato de configuração não suportado: {caminho}. "
+                         f"Use um de: {', '.join(sorted(LEITORES))}")
+    try:
+        valores = LEITORES[extensao](caminho)
+    except Exception as e:
+        raise ValueError(f"Erro ao ler a configuração {caminho}: {e}") from e
+    if valores is None:
+        valores = {}
+    if not isinstance(valores, dict):
+        raise ValueError(f"A configuração {caminho} deve ser um objeto com os parâmetros")
+
+    if caminho != CAMINHO_PARAMETROS:
+        base = configuracao_padrao().como_dict()
+        desconhecidos = sorted(set(valores) - set(CAMPOS))
+        if desconhecidos:
+            raise ValueError(f"Parâmetro(s) desconhecido(s) em {caminho}: {', '.join(desconhecidos)}")
+        base.update(valores)
+        valores = base
+    try:
+        return Configuracao(valores, caminho)
+    except ValueError as e:
+        raise ValueError(f"{e} ({caminho})") from None
+
+
+def carregar_configuracao(caminho=None, definicoes=None):
+    """
+    Configuracao lida de `caminho` (.py, .json, .toml, .yaml/.yml; padrão:
+    parametros.py), com `definicoes` ({chave: valor}, ver
+    Configuracao.alterar) aplicadas. O arquivo só é lido de novo quando a
+    sua data de modificação ou o seu tamanho mudam.
+    """
+    caminho = os.path.abspath(caminho or CAMINHO_PARAMETROS)
+    try:
+        estado = os.stat(caminho)
+    except OSError as e:
+        raise ValueError(f"Arquivo de configuração não encontrado: {caminho} ({e.strerror})") from None
+    assinatura = (estado.st_mtime_ns, estado.st_size)
+    em_cache = _cache.get(caminho)
+    if em_cache is not None and em_cache[0] == assinatura:
+        config = em_cache[1]
+    else:
+        config = _ler_configuracao(caminho)
+        _cache[caminho] = (assinatura, config)
+    if definicoes:
+        config = config.alterar(definicoes)
+    return config
+
+
+def configuracao_padrao():
+    """Configuracao de parametros.py."""
+    return carregar_configuracao(CAMINHO_PARAMETROS)
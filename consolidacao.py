@@ -0,0 +1,129 @@
+"""
+Consolidação da DRE de várias entidades (um arquivo de entrada por
+entidade).
+
+Cada arquivo é lido, varrido e agregado uma única vez, em paralelo, em um
+DadosEntidade (ver main.agregar_entidade). As séries das linhas da DRE
+alimentadas pelas abas fontes e o D&A de todas as entidades são alinhados
+em um eixo de meses comum e empilhados em arrays entidades × meses, dos
+quais saem as DREs por entidade e a consolidada (soma no eixo das
+entidades). A compensação de prejuízo é feita por entidade, de uma vez para
+todas (ver impostos.py), e somada na consolidada.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from avaliacao import avaliar_dre
+from depreciacao import total_depreciacao
+from impostos import compensar_prejuizo
+from layout import ITEM_FONTE
+
+
+class DadosEntidade:
+    """
+    Resultado da leitura de uma entidade: varredura de datas (sem os índices
+    de mês por linha), agregados mensais e investimentos (None se não houver
+    a aba Investimentos).
+    """
+
+    __slots__ = ('nome', 'caminho', 'varredura', 'agregados', 'investimentos')
+
+    def __init__(self, nome, caminho, varredura, agregados, investimentos):
+        self.nome = nome
+        self.caminho = caminho
+        self.varredura = varredura
+        self.agregados = agregados
+        self.investimentos = investimentos
+
+
+def nome_entidade(caminho):
+    """Nome da entidade: nome do arquivo sem a extensão."""
+    return os.path.splitext(os.path.basename(caminho))[0]
+
+
+def agregar_entidades(caminhos, agregar, workers=None):
+    """
+    Executa `agregar(caminho)` (função de nível de módulo que devolve um
+    DadosEntidade) para cada arquivo em um ProcessPoolExecutor, na ordem de
+    `caminhos`. O erro de qualquer arquivo interrompe a consolidação.
+    """
+    if workers == 1 or len(caminhos) <= 1:
+        resultados = []
+        for caminho in caminhos:
+            try:
+                resultados.append(agregar(caminho))
+            except Exception as e:
+                raise ValueError(f"Erro ao ler {caminho}: {e}") from e
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [executor.submit(agregar, caminho) for caminho in caminhos]
+        resultados = []
+        for caminho, futuro in zip(caminhos, futuros):
+            try:
+                resultados.append(futuro.result())
+            except Exception as e:
+                raise ValueError(f"Erro ao ler {caminho}: {e}") from e
+        return resultados
+
+
+class Consolidacao:
+    """
+    Séries mensais das linhas da DRE calculadas em Python, por chave, em
+    arrays entidades × meses: linhas ITEM_FONTE, D&A e compensação de
+    prejuízo e imposto (impostos.LINHAS_PREJUIZO).
+    """
+
+    __slots__ = ('nomes', 'series')
+
+    def __init__(self, nomes, series):
+        self.nomes = nomes
+        self.series = series
+
+    def entidade(self, indice):
+        return {chave: serie[indice] for chave, serie in self.series.items()}
+
+    def consolidada(self):
+        return {chave: serie.sum(axis=0) for chave, serie in self.series.items()}
+
+
+def series_entidade(entidade, plano, mes_inicial):
+    """
+    Séries mensais (já com o sinal) das linhas ITEM_FONTE do plano e do D&A
+    de uma entidade, a partir do índice de mês `mes_inicial`.
+    """
+    num_meses = plano.num_colunas
+    series = {}
+    for linha_plano in plano.linhas:
+        item = linha_plano.item
+        if item.tipo == ITEM_FONTE:
+            serie = np.asarray(entidade.agregados.serie(item.fonte, mes_inicial, num_meses, item.categoria),
+                               dtype=np.float64)
+            series[item.chave] = 0.0 - serie if item.sinal == '-' else serie
+    series['depreciacao'] = np.zeros(num_meses)
+    if entidade.investimentos is not None:
+        series['depreciacao'] = 0.0 - total_depreciacao(entidade.investimentos, mes_inicial, num_meses)
+    return series
+
+
+def consolidar(entidades, plano, data_inicial, mes_inicial, limite, taxa):
+    """
+    Alinha as entidades no eixo de `plano.num_colunas` meses a partir do
+    índice de mês `mes_inicial` e calcula as séries da Consolidacao. O EBT
+    de cada entidade é calculado pelo avaliador das fórmulas do layout (ver
+    avaliacao.py), restrito às células de que ele depende.
+    """
+    por_entidade = [series_entidade(entidade, plano, mes_inicial) for entidade in entidades]
+    series = {chave: np.stack([serie[chave] for serie in por_entidade]) for chave in por_entidade[0]}
+
+    ebt = np.empty((len(entidades), plano.num_colunas))
+    for indice, serie in enumerate(por_entidade):
+        tabela = avaliar_dre(plano, data_inicial, serie, 0.0 - serie['depreciacao'], chaves=('ebt',))
+        ebt[indice] = tabela.como_array()[tabela.chaves.index('ebt')]
+    if not np.isfinite(ebt).all():
+        raise ValueError("O EBT de alguma entidade tem valores não numéricos")
+
+    series.update(compensar_prejuizo(ebt, limite, taxa))
+    return Consolidacao([entidade.nome for entidade in entidades], series)
@@ -0,0 +1,231 @@
+"""
+Conversão das datas das abas fontes.
+
+Os arquivos reais repetem poucas centenas de datas distintas em centenas de
+milhares de linhas, então a conversão de cada valor bruto é memorizada em um
+cache LRU limitado. Para textos, o último formato reconhecido em cada coluna
+é testado primeiro. Números de série do Excel são convertidos em lote com
+NumPy.
+
+Os meses são representados como índices inteiros (ano * 12 + mês - 1).
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+
+
+FORMATOS_DATA = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S',
+                 '%d-%m-%Y', '%m-%d-%Y']
+
+# Formatos que podem reconhecer o mesmo texto que um formato anterior da
+# lista (ex.: '03/04/2024'). Quando um deles é o formato preferido da coluna,
+# os anteriores são testados antes para manter a prioridade de FORMATOS_DATA.
+_FORMATOS_CONFLITANTES = {
+    '%m/%d/%Y': ('%d/%m/%Y',),
+    '%m-%d-%Y': ('%d-%m-%Y',),
+}
+
+EPOCA_EXCEL = date(1899, 12, 30)
+SERIAL_MAXIMO = 1000000
+ANO_MINIMO = 1900
+ANO_MAXIMO = 2100
+
+# Códigos usados em meses_coluna para células sem data válida
+MES_VAZIO = -2
+MES_INVALIDO = -1
+
+TAMANHO_CACHE = 4096
+
+
+def validar_data(data):
+    """
+    Valida se uma data é válida verificando:
+    - Tipo datetime (dia e mês já são validados na construção)
+    - Ano razoável (entre 1900 e 2100)
+    """
+    if not isinstance(data, datetime):
+        return False
+    return ANO_MINIMO <= data.year <= ANO_MAXIMO
+
+
+def indice_mes(data):
+    """Converte uma data no índice de mês (ano * 12 + mês - 1)."""
+    return data.year * 12 + data.month - 1
+
+
+def mes_do_indice(indice):
+    """Converte um índice de mês no datetime do primeiro dia do mês."""
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def _vazio(valor):
+    return valor is None or valor == ''
+
+
+class ConversorDatas:
+    """
+    Conversor de valores brutos de células em datas válidas.
+
+    O resultado de cada valor (datetime já validado ou None) fica em um cache
+    LRU com no máximo `tamanho_cache` entradas.
+    """
+
+    def __init__(self, tamanho_cache=TAMANHO_CACHE):
+        self.tamanho_cache = tamanho_cache
+        self._cache = OrderedDict()
+        self._formato_por_coluna = {}
+
+    def limpar_cache(self):
+        self._cache.clear()
+        self._formato_por_coluna.clear()
+
+    def converter(self, valor, coluna=None):
+        """
+        Converte um valor em datetime válido, ou None se o valor não for uma
+        data reconhecida dentro do intervalo aceito. `coluna` identifica a
+        origem do valor (ex.: ('Vendas', 'data')) para a escolha do formato.
+        """
+        cache = self._cache
+        try:
+            resultado = cache[valor]
+        except KeyError:
+            pass
+        except TypeError:
+            return None
+        else:
+            cache.move_to_end(valor)
+            return resultado
+
+        resultado = self._converter(valor, coluna)
+        if resultado is not None and not validar_data(resultado):
+            resultado = None
+        cache[valor] = resultado
+        if len(cache) > self.tamanho_cache:
+            cache.popitem(last=False)
+        return resultado
+
+    def _converter(self, valor, coluna):
+        if valor is None:
+            return None
+        if isinstance(valor, datetime):
+            return valor
+        if isinstance(valor, (int, float)):
+            return self._converter_serial(valor)
+        if isinstance(valor, str):
+            return self._converter_texto(valor, coluna)
+        return None
+
+    @staticmethod
+    def _converter_serial(valor):
+        if valor < 0 or valor > SERIAL_MAXIMO:
+            return None
+        try:
+            dia = date.fromordinal(EPOCA_EXCEL.toordinal() + int(valor))
+        except (ValueError, OverflowError):
+            return None
+        return datetime(dia.year, dia.month, dia.day)
+
+    def _converter_texto(self, valor, coluna):
+        valor = valor.strip()
+        if not valor:
+            return None
+
+        preferido = self._formato_por_coluna.get(coluna)
+        if preferido is not None:
+            data = _strptime(valor, preferido)
+            if data is not None:
+                for anterior in _FORMATOS_CONFLITANTES.get(preferido, ()):
+                    data_anterior = _strptime(valor, anterior)
+                    if data_anterior is not None:
+                        self._formato_por_coluna[coluna] = anterior
+                        return data_anterior
+                return data
+
+        for fmt in FORMATOS_DATA:
+            if fmt == preferido:
+                continue
+            data = _strptime(valor, fmt)
+            if data is not None:
+                self._formato_por_coluna[coluna] = fmt
+                return data
+        return None
+
+    def meses_coluna(self, valores, coluna=None):
+        """
+        Converte uma coluna inteira em índices de mês (array int32).
+
+        Células vazias recebem MES_VAZIO e valores que não são datas válidas
+        recebem MES_INVALIDO. Os números de série do Excel da coluna são
+        convertidos de uma só vez com NumPy; os demais valores passam pelo
+        cache de conversão.
+        """
+        meses = np.full(len(valores), MES_VAZIO, dtype=np.int32)
+        posicoes_seriais = []
+        seriais = []
+        converter = self.converter
+        for posicao, valor in enumerate(valores):
+            if _vazio(valor):
+                continue
+            if isinstance(valor, (int, float)):
+                posicoes_seriais.append(posicao)
+                seriais.append(valor)
+                continue
+            data = converter(valor, coluna)
+            meses[posicao] = indice_mes(data) if data is not None else MES_INVALIDO
+
+        if seriais:
+            meses[posicoes_seriais] = meses_de_seriais(np.asarray(seriais, dtype=np.float64))
+        return meses
+
+
+def meses_de_seriais(seriais):
+    """
+    Converte um array de números de série do Excel em índices de mês, com
+    MES_INVALIDO para seriais fora do intervalo aceito.
+    """
+    validos = (seriais >= 0) & (seriais <= SERIAL_MAXIMO)
+    dias = np.where(validos, np.trunc(seriais), 0).astype('timedelta64[D]')
+    meses_1970 = (np.datetime64(EPOCA_EXCEL, 'D') + dias).astype('datetime64[M]').astype(np.int64)
+    meses = meses_1970 + 1970 * 12
+    validos &= (meses >= ANO_MINIMO * 12) & (meses < (ANO_MAXIMO + 1) * 12)
+    return np.where(validos, meses, MES_INVALIDO).astype(np.int32)
+
+
+def resumir_meses(aba, valores, meses, primeira_linha):
+    """
+    Resumo da varredura de uma coluna de datas já convertida em índices de
+    mês (ver meses_coluna): (mes_min, mes_max, datas_validas,
+    datas_invalidas), com as datas inválidas como (aba, linha, valor).
+    """
+    validos = meses[meses >= 0]
+    mes_min = mes_max = None
+    if len(validos):
+        mes_min = mes_do_indice(int(validos.min()))
+        mes_max = mes_do_indice(int(validos.max()))
+    invalidas = [(aba, primeira_linha + posicao, valores[posicao])
+                 for posicao in np.flatnonzero(meses == MES_INVALIDO).tolist()]
+    return mes_min, mes_max, len(validos), invalidas
+
+
+def somar_datas(anteriores, novas):
+    """Combina dois resumos de datas (mes_min, mes_max, validas, invalidas)."""
+    minimos = [d[0] for d in (anteriores, novas) if d[0] is not None]
+    maximos = [d[1] for d in (anteriores, novas) if d[1] is not None]
+    return (min(minimos) if minimos else None, max(maximos) if maximos else None,
+            anteriores[2] + novas[2], anteriores[3] + novas[3])
+
+
+def _strptime(valor, fmt):
+    try:
+        return datetime.strptime(valor, fmt)
+    except ValueError:
+        return None
+
+
+conversor_padrao = ConversorDatas()
+
+
+def converter_data(valor, coluna=None):
+    """Converte um valor em datetime válido usando o conversor padrão."""
+    return conversor_padrao.converter(valor, coluna)
@@ -0,0 +1,100 @@
+"""
+Cálculo do waterfall de depreciação (D&A).
+
+Cada investimento é depreciado linearmente a partir do MÊS SEGUINTE ao seu
+lançamento, por vida_util * 12 meses. Em vez de uma fórmula por ativo e por
+mês, a matriz ativos × meses é calculada com NumPy: cada ativo tem um índice
+de mês de início e de fim, e uma máscara comparando esses índices com os
+meses da DRE seleciona as células depreciadas. O TOTAL D&A de cada mês é a
+soma da coluna correspondente da matriz.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from datas import indice_mes
+from modelo import TabelaCategorias, numero
+
+
+# Modos de escrita do waterfall na aba Investimentos
+# 'valores':   valores calculados por ativo e mês, e o total por mês
+# 'resumo':    apenas o total por mês (sem a grade por ativo)
+# 'auditoria': fórmulas por ativo e mês, como na planilha original
+MODOS_DEPRECIACAO = ('valores', 'resumo', 'auditoria')
+
+
+class Investimentos:
+    """
+    Investimentos válidos da aba Investimentos, em arrays: índice do mês do
+    lançamento (int32), código da descrição na tabela de descrições
+    internadas, valor e vida útil.
+    """
+
+    __slots__ = ('meses', 'codigos', 'tabela', 'valores', 'vidas_uteis')
+
+    def __init__(self, meses, codigos, tabela, valores, vidas_uteis):
+        self.meses = np.asarray(meses, dtype=np.int32)
+        self.codigos = np.asarray(codigos, dtype=np.int32)
+        self.tabela = tabela
+        self.valores = np.asarray(valores, dtype=np.float64)
+        self.vidas_uteis = np.asarray(vidas_uteis, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.meses)
+
+    @property
+    def descricoes(self):
+        rotulos = self.tabela.rotulos
+        return [rotulos[codigo] for codigo in self.codigos.tolist()]
+
+    @property
+    def depreciacao_mensal(self):
+        return self.valores / (self.vidas_uteis * 12)
+
+    @property
+    def meses_inicio(self):
+        """Índice do mês em que a depreciação começa (mês seguinte ao lançamento)."""
+        return self.meses + 1
+
+    @property
+    def meses_fim(self):
+        """Índice do primeiro mês sem depreciação."""
+        return self.meses_inicio + self.vidas_uteis * 12
+
+
+def ler_investimentos(aba_inv, vida_util_ativos, vida_util_padrao):
+    """
+    Lê os investimentos da aba (buffer da ingestão) até a primeira linha sem
+    data. Linhas sem data válida, descrição ou valor numérico são ignoradas.
+    A vida útil vem de `vida_util_ativos` pela descrição, ou o padrão.
+    """
+    tabela = TabelaCategorias(normalizar=False)
+    meses, codigos, valores = [], [], []
+    for _, data, descricao, valor in aba_inv.linhas('data', 'descricao', 'valor'):
+        if data is None:
+            break
+        if isinstance(data, datetime) and descricao and valor and numero(valor):
+            meses.append(indice_mes(data))
+            codigos.append(tabela.codigo(descricao))
+            valores.append(valor)
+    # Vida útil consultada uma vez por descrição distinta
+    vidas = np.asarray([vida_util_ativos.get(descricao, vida_util_padrao) for descricao in tabela.rotulos],
+                       dtype=np.float64)
+    codigos = np.asarray(codigos, dtype=np.int32)
+    return Investimentos(meses, codigos, tabela, valores, vidas[codigos])
+
+
+def matriz_depreciacao(investimentos, mes_inicial, num_meses):
+    """
+    Matriz (ativos × meses) com a depreciação de cada ativo em cada mês da
+    DRE, a partir do índice de mês `mes_inicial`.
+    """
+    meses = mes_inicial + np.arange(num_meses)
+    mascara = ((meses >= investimentos.meses_inicio[:, None])
+               & (meses < investimentos.meses_fim[:, None]))
+    return np.where(mascara, investimentos.depreciacao_mensal[:, None], 0.0)
+
+
+def total_depreciacao(investimentos, mes_inicial, num_meses):
+    """TOTAL D&A de cada mês da DRE (soma das colunas da matriz de depreciação)."""
+    return matriz_depreciacao(investimentos, mes_inicial, num_meses).sum(axis=0)
@@ -0,0 +1,65 @@
+"""
+Compensação de prejuízo fiscal e imposto sobre o lucro.
+
+Nas fórmulas da DRE o saldo de prejuízo acumulado de cada mês depende do
+saldo final do mês anterior, o que forma uma cadeia serial ao longo de
+todos os meses. O saldo (em módulo) segue a recorrência
+
+    saldo[t] = max(saldo[t-1] + prejuizo[t] - limite * lucro[t], 0)
+
+(no mês com lucro o prejuízo é 0 e vice-versa), cuja forma fechada é
+
+    saldo[t] = S[t] - min(-saldo_inicial, S[1], ..., S[t])
+
+com S a soma acumulada de prejuizo - limite * lucro. Com NumPy isso é uma
+soma acumulada e um mínimo acumulado ao longo do eixo dos meses, calculados
+de uma vez para todos os meses e, com um EBT bidimensional (entidades ×
+meses), para todas as entidades.
+"""
+import numpy as np
+
+
+# Modos de escrita da compensação de prejuízo na DRE
+# 'formulas': fórmulas encadeadas mês a mês, como na planilha original
+# 'valores':  valores calculados pelo script (ver compensar_prejuizo)
+MODOS_PREJUIZO = ('formulas', 'valores')
+
+# Linhas do layout da DRE (layout.py) calculadas por compensar_prejuizo
+LINHAS_PREJUIZO = ('prejuizo_inicio', 'prejuizo_adquirido', 'prejuizo_utilizado', 'prejuizo_final',
+                   'base_calculo', 'impostos')
+
+
+def compensar_prejuizo(ebt, limite, taxa, saldo_inicial=0.0):
+    """
+    Compensação de prejuízo e imposto a partir do EBT mensal (array de
+    meses, ou entidades × meses). `limite` é a fração do lucro do mês que
+    pode ser compensada com o prejuízo acumulado e `taxa` a alíquota do
+    imposto (ex.: 0.3), escalares ou arrays com uma linha por entidade (ex.:
+    formato (n, 1)); `saldo_inicial` é o prejuízo acumulado antes do
+    primeiro mês (positivo, escalar ou por entidade).
+
+    Devolve {chave de LINHAS_PREJUIZO: array com o formato de `ebt`}, com os
+    sinais das linhas da DRE (prejuízo acumulado e imposto negativos).
+    """
+    ebt = np.asarray(ebt, dtype=np.float64)
+    prejuizo = np.maximum(-ebt, 0.0)
+    lucro = np.maximum(ebt, 0.0)
+
+    somas = np.cumsum(prejuizo - limite * lucro, axis=-1)
+    piso = -np.asarray(saldo_inicial, dtype=np.float64)[..., None]
+    minimos = np.minimum(np.minimum.accumulate(somas, axis=-1), piso)
+    saldo_final = somas - minimos
+    saldo_anterior = np.concatenate([np.broadcast_to(-piso, saldo_final[..., :1].shape), saldo_final[..., :-1]],
+                                    axis=-1)
+
+    utilizado = np.where(lucro > 0, saldo_anterior - saldo_final, 0.0)
+    base = lucro - utilizado
+    # 0.0 - x em vez de -x, para não gravar -0.0 nos meses sem saldo
+    return {
+        'prejuizo_inicio': 0.0 - saldo_anterior,
+        'prejuizo_adquirido': 0.0 - prejuizo,
+        'prejuizo_utilizado': utilizado,
+        'prejuizo_final': 0.0 - saldo_final,
+        'base_calculo': base,
+        'impostos': 0.0 - base * taxa,
+    }
@@ -0,0 +1,59 @@
+"""
+Modo incremental para as abas que só crescem (Vendas e Custo_Despesas).
+
+Para cada arquivo e aba, o cache (ver cache.py) guarda o estado da última
+execução: a última linha do XML da aba (marca), a última linha com valores,
+o hash dos bytes das linhas até a marca (com os textos compartilhados que
+elas referenciam), o resumo das datas e os agregados mensais.
+
+Na execução seguinte a aba é lida a partir da marca (ver
+ingestao.LeituraAposMarca): as linhas até a marca só passam pelo hash, sem
+serem convertidas em valores, e apenas as linhas novas são lidas, varridas e
+agregadas, somando o resultado ao estado guardado. Se o hash não confere
+(alguma linha processada foi alterada, removida ou inserida), a aba é lida,
+varrida e agregada por completo.
+
+O hash é dos bytes do XML: a saída do modo incremental é sempre gravada em
+streaming, que copia as abas fontes sem alterá-las (ver saida.py). Um
+arquivo salvo de novo pelo Excel ou em modo de escrita pelo openpyxl tem o
+XML reescrito, e a primeira execução seguinte é completa.
+"""
+ABAS_INCREMENTAIS = ('Vendas', 'Custo_Despesas')
+
+
+class EstadoAba:
+    """
+    Estado incremental de uma aba. `marca` é a última linha do XML e
+    `ultima_linha` a última linha com valores nas colunas lidas;
+    `hash_linhas` é o hash das linhas até a marca
+    (LeituraAposMarca.hash_final); `datas` é a tupla (mes_min, mes_max,
+    datas_validas, datas_invalidas) da varredura de datas.
+    """
+
+    __slots__ = ('marca', 'ultima_linha', 'hash_linhas', 'datas', 'agregados')
+
+    def __init__(self, marca, ultima_linha, hash_linhas, datas, agregados):
+        self.marca = marca
+        self.ultima_linha = ultima_linha
+        self.hash_linhas = hash_linhas
+        self.datas = datas
+        self.agregados = agregados
+
+
+def marca_leitura(estado):
+    """(marca, primeira_linha) para ler a aba a partir do estado (ver ingestao.ler_fontes)."""
+    if estado is None:
+        return 0, 2
+    return estado.marca, estado.ultima_linha + 1
+
+
+def estado_valido(estado, leitura):
+    """Indica se as linhas até a marca do estado não mudaram (leitura: ingestao.LeituraAposMarca)."""
+    return leitura is not None and leitura.suportada and leitura.hash_marca == estado.hash_linhas
+
+
+def novo_estado(leitura, aba, datas, agregados):
+    """Estado após processar a aba até a última linha, ou None se vazia ou sem leitura suportada."""
+    if leitura is None or not leitura.suportada or not aba.ultima_linha:
+        return None
+    return EstadoAba(leitura.ultima, aba.ultima_linha, leitura.hash_final, datas, agregados)
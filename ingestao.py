@@ -0,0 +1,520 @@
+"""
+Ingestão das abas fontes da DRE.
+
+As abas são lidas uma única vez, em streaming (openpyxl em modo read_only /
+values_only), e somente as colunas usadas pela DRE e pelo waterfall são
+copiadas para buffers colunares. Nenhum objeto Cell é criado nessa etapa.
+Vendas, Custo_Despesas e Folha são lidas em blocos de LINHAS_POR_BLOCO
+linhas: cada bloco tem as datas varridas e é compactado (ver
+modelo.AbaCompacta) antes da leitura do seguinte.
+
+Vendas, Custo_Despesas e Folha também podem vir de arquivos externos (CSV
+ou Parquet) com as mesmas colunas da aba. Esses arquivos não são carregados
+inteiros: ler_aba_externa devolve blocos de linhas (AbaFonte) que são
+varridos e agregados um a um.
+
+No modo incremental (ver incremental.py), Vendas e Custo_Despesas podem ser
+lidas a partir de uma marca: o XML da aba passa por LeituraAposMarca, que
+descarta as linhas até a marca antes do parser do openpyxl e calcula o hash
+dos bytes dessas linhas, sem convertê-las em valores.
+"""
+import csv
+import hashlib
+import itertools
+import os
+import re
+from datetime import date, datetime
+
+import openpyxl
+
+from agregacao import compactar_aba
+from datas import conversor_padrao, resumir_meses, somar_datas
+from modelo import AbaCompacta, TabelaCategorias, juntar_transacoes
+
+
+# Colunas lidas de cada aba fonte: campo -> número da coluna na planilha
+COLUNAS_FONTES = {
+    'Vendas': {'valor': 5, 'data': 6},
+    'Custo_Despesas': {'categoria': 1, 'valor': 2, 'data': 3},
+    'Folha': {'data': 1, 'salario': 3, 'encargos': 4, 'beneficios': 5},
+    'Investimentos': {'data': 1, 'descricao': 2, 'valor': 3},
+}
+
+# Abas compactadas na leitura (ver modelo.AbaCompacta)
+ABAS_COMPACTAS = ('Vendas', 'Custo_Despesas', 'Folha')
+
+# Abas que podem ser lidas de arquivos externos, e extensões aceitas
+ABAS_EXTERNAS = ('Vendas', 'Custo_Despesas', 'Folha')
+FORMATOS_EXTERNOS = ('.csv', '.parquet')
+LINHAS_POR_BLOCO = 65536
+
+# Campos de texto; 'data' é convertido em datetime e os demais em número
+CAMPOS_TEXTO = ('categoria', 'descricao')
+
+# Leitura do XML das abas a partir de uma marca (ver LeituraAposMarca)
+TAMANHO_BLOCO_XML = 1 << 16
+_INICIO_LINHA = re.compile(rb'<([\w.-]+:)?row[\s/>]')
+_NUMERO_LINHA = re.compile(rb'\sr="(\d+)"')
+_ESPACO_APOS_TAG = re.compile(rb'>\s')
+_TEXTO_COMPARTILHADO = re.compile(rb't="s"[^>]*>\s*<(?:[\w.-]+:)?v>(\d+)<')
+
+# A aba Financiamento é lida por linhas: datas na linha 4 e juros na linha 5,
+# colunas J até AZ (mesmo intervalo usado pela fórmula de Juros da DRE)
+FINANCIAMENTO_LINHA_DATAS = 4
+FINANCIAMENTO_LINHA_JUROS = 5
+FINANCIAMENTO_COLUNAS = (10, 52)
+
+
+class AbaFonte:
+    """
+    Buffer colunar de uma aba fonte.
+
+    Cada campo é uma lista com um valor por linha da planilha, a partir de
+    `primeira_linha`. `ultima_linha` é a última linha com algum valor nas
+    colunas lidas (0 se a aba estiver vazia).
+    """
+
+    __slots__ = ('nome', 'colunas', 'primeira_linha', 'ultima_linha')
+
+    def __init__(self, nome, campos, primeira_linha=2):
+        self.nome = nome
+        self.colunas = {campo: [] for campo in campos}
+        self.primeira_linha = primeira_linha
+        self.ultima_linha = 0
+
+    def __len__(self):
+        return self.ultima_linha - self.primeira_linha + 1 if self.ultima_linha else 0
+
+    def coluna(self, campo):
+        return self.colunas[campo]
+
+    def linhas(self, *campos):
+        """Itera (numero_linha, valor_campo1, valor_campo2, ...)."""
+        colunas = [self.colunas[campo] for campo in campos]
+        return zip(range(self.primeira_linha, self.ultima_linha + 1), *colunas)
+
+
+class DadosFontes:
+    """
+    Resultado da ingestão: buffers por aba, a lista de abas do arquivo, os
+    nomes definidos do workbook e as dimensões (max_row, max_column) das
+    abas lidas. `externas` ({aba: caminho}) indica as abas lidas de arquivos
+    externos, que não ficam em `abas` (ver ler_aba_externa). `leituras`
+    ({aba: LeituraAposMarca}) traz as abas lidas a partir de uma marca.
+    """
+
+    def __init__(self, sheetnames, abas, nomes_definidos=None, dimensoes=None, externas=None, leituras=None):
+        self.sheetnames = sheetnames
+        self.abas = abas
+        self.nomes_definidos = nomes_definidos or {}
+        self.dimensoes = dimensoes or {}
+        self.externas = externas or {}
+        self.leituras = leituras or {}
+
+    def __contains__(self, nome):
+        return nome in self.abas
+
+    def __getitem__(self, nome):
+        return self.abas[nome]
+
+    def disponivel(self, nome):
+        """Indica se a aba existe no arquivo ou vem de um arquivo externo."""
+        return nome in self.sheetnames or nome in self.externas
+
+
+class LeituraAposMarca:
+    """
+    Fluxo do XML de uma aba que omite as linhas até `marca` (atributo r do
+    elemento <row>), entregue ao parser do openpyxl no lugar do XML original.
+
+    Os bytes de todas as linhas entram num SHA-256: `hash_marca` cobre as
+    linhas até a marca e `hash_final` todas as linhas, ambos completados por
+    concluir() com os textos compartilhados que essas linhas referenciam.
+    `ultima` é o número da última linha do XML. Linhas sem o atributo r ou
+    fora de ordem tornam a leitura não suportada (`suportada` False): nada
+    mais é omitido, e a aba deve ser lida de novo sem marca.
+
+    Linhas até a marca com a fórmula base de uma fórmula compartilhada são
+    mantidas, para que o parser traduza as fórmulas das linhas seguintes.
+    Os blocos lidos com todas as linhas do mesmo lado da marca são tratados
+    de uma vez (ver _processar_bloco), sem percorrer as linhas.
+    """
+
+    __slots__ = ('_fonte', '_marca', '_pendente', '_saida', '_fim', '_hash', '_indices', '_indices_marca',
+                 'hash_marca', 'hash_final', 'ultima', 'suportada')
+
+    def __init__(self, fonte, marca=0):
+        self._fonte = fonte
+        self._marca = marca
+        self._pendente = b''
+        self._saida = b''
+        self._fim = False
+        self._hash = hashlib.sha256()
+        self._indices = set()
+        self._indices_marca = None
+        self.hash_marca = None
+        self.hash_final = None
+        self.ultima = 0
+        self.suportada = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.close()
+
+    def close(self):
+        # Os hashes cobrem todas as linhas, mesmo se o parser parar antes do fim
+        while not self._fim:
+            self._saida = b''
+            self.read(TAMANHO_BLOCO_XML)
+        self._fonte.close()
+
+    def read(self, tamanho=-1):
+        while not self._fim and (tamanho < 0 or len(self._saida) < tamanho):
+            bloco = self._fonte.read(TAMANHO_BLOCO_XML)
+            if bloco:
+                self._saida += self._filtrar(self._pendente + bloco)
+            else:
+                self._fim = True
+                self._saida += self._pendente
+                self._pendente = b''
+                self._fechar_marca()
+        if tamanho < 0:
+            tamanho = len(self._saida)
+        dados, self._saida = self._saida[:tamanho], self._saida[tamanho:]
+        return dados
+
+    def _filtrar(self, dados):
+        """Devolve os bytes a entregar; o trecho final incompleto fica pendente."""
+        partes = []
+        posicao = 0
+        if self.suportada:
+            bloco = self._processar_bloco(dados)
+            if bloco is not None:
+                inicio, fim, manter = bloco
+                partes.append(dados[:fim if manter else inicio])
+                posicao = fim
+        while True:
+            inicio = _INICIO_LINHA.search(dados, posicao)
+            if inicio is None:
+                # Uma tag pode ter sido cortada no fim do bloco
+                corte = dados.rfind(b'<', posicao)
+                corte = len(dados) if corte < 0 else corte
+                break
+            fim_tag = dados.find(b'>', inicio.end() - 1)
+            fim = fim_tag + 1
+            if fim_tag >= 0 and dados[fim_tag - 1] != ord('/'):
+                fechamento = b'</' + (inicio.group(1) or b'') + b'row>'
+                fim = dados.find(fechamento, fim_tag)
+                fim = fim + len(fechamento) if fim >= 0 else 0
+            if fim_tag < 0 or not fim:
+                corte = inicio.start()
+                break
+            partes.append(dados[posicao:inicio.start()])
+            linha = dados[inicio.start():fim]
+            if self._manter(linha, dados[inicio.start():fim_tag]):
+                partes.append(linha)
+            posicao = fim
+        partes.append(dados[posicao:corte])
+        self._pendente = dados[corte:]
+        return b''.join(partes)
+
+    def _processar_bloco(self, dados):
+        """
+        Trata de uma vez as linhas completas do bloco quando estão todas do
+        mesmo lado da marca, numeradas (r como primeiro atributo), em ordem
+        e sem espaço entre as tags: o trecho entra inteiro no hash (o mesmo
+        das linhas uma a uma) e é mantido ou, sem fórmulas compartilhadas,
+        omitido. Devolve (início, fim, manter) do trecho, ou None.
+        """
+        inicio = _INICIO_LINHA.search(dados)
+        if inicio is None:
+            return None
+        prefixo = inicio.group(1) or b''
+        fim = dados.rfind(b'</' + prefixo + b'row>')
+        if fim < inicio.start():
+            return None
+        fim += len(prefixo) + len(b'</row>')
+        trecho = dados[inicio.start():fim]
+        abertura = b'<' + prefixo + b'row'
+        ultima = trecho.rfind(abertura)
+        primeiro = _NUMERO_LINHA.search(trecho, 0, trecho.find(b'>'))
+        numero = _NUMERO_LINHA.search(trecho, ultima, trecho.find(b'>', ultima))
+        if (primeiro is None or numero is None or int(primeiro.group(1)) <= self.ultima
+                or trecho.count(abertura) != trecho.count(abertura + b' r="') or _ESPACO_APOS_TAG.search(trecho)):
+            return None
+        manter = int(primeiro.group(1)) > self._marca
+        if manter:
+            self._fechar_marca()
+        elif int(numero.group(1)) > self._marca or b't="shared"' in trecho:
+            return None
+        self.ultima = int(numero.group(1))
+        self._hash.update(trecho)
+        self._indices.update(_TEXTO_COMPARTILHADO.findall(trecho))
+        return inicio.start(), fim, manter
+
+    def _manter(self, linha, tag):
+        numero = _NUMERO_LINHA.search(tag)
+        if numero is None or int(numero.group(1)) <= self.ultima:
+            self.suportada = False
+        else:
+            self.ultima = int(numero.group(1))
+        if self.ultima > self._marca:
+            self._fechar_marca()
+        self._hash.update(linha)
+        self._indices.update(_TEXTO_COMPARTILHADO.findall(linha))
+        if not self.suportada or self.ultima > self._marca:
+            return True
+        return b't="shared"' in linha and b'ref="' in linha
+
+    def _fechar_marca(self):
+        if self.hash_marca is None:
+            self.hash_marca = self._hash.hexdigest()
+            self._indices_marca = frozenset(self._indices)
+
+    def concluir(self, textos):
+        """Completa os hashes com os textos compartilhados (`textos`) referenciados pelas linhas."""
+        self.hash_marca = _hash_com_textos(self.hash_marca, self._indices_marca, textos)
+        self.hash_final = _hash_com_textos(self._hash.hexdigest(), self._indices, textos)
+        self._indices = self._indices_marca = None
+
+
+def _hash_com_textos(hash_linhas, indices, textos):
+    h = hashlib.sha256(hash_linhas.encode())
+    for indice in sorted(int(i) for i in indices):
+        h.update(repr((indice, textos[indice] if indice < len(textos) else None)).encode())
+    return h.hexdigest()
+
+
+def _ler_a_partir_da_marca(ws, marca):
+    # O ReadOnlyWorksheet abre o XML da aba por _get_source ao iterar as
+    # linhas; a única iteração da aba passa a receber o XML já filtrado
+    leitura = LeituraAposMarca(ws._get_source(), marca)
+    ws._get_source = lambda: leitura
+    return leitura
+
+
+def _blocos_colunares(ws, nome, colunas, primeira_linha=2, linhas_por_bloco=None):
+    """
+    Itera blocos (AbaFonte) de até `linhas_por_bloco` linhas da aba (sem
+    limite: um único bloco), cada um sem as linhas vazias do seu final.
+    """
+    campos = list(colunas)
+    indices = [colunas[campo] - 1 for campo in campos]
+    max_col = max(colunas.values())
+    bloco = None
+
+    linhas = ws.iter_rows(min_row=primeira_linha, max_col=max_col, values_only=True)
+    for numero_linha, row in enumerate(linhas, start=primeira_linha):
+        if bloco is None:
+            bloco = AbaFonte(nome, campos, numero_linha)
+            destinos = [bloco.colunas[campo] for campo in campos]
+        vazia = True
+        for destino, indice in zip(destinos, indices):
+            valor = row[indice] if indice < len(row) else None
+            destino.append(valor)
+            if valor is not None:
+                vazia = False
+        if not vazia:
+            bloco.ultima_linha = numero_linha
+        if linhas_por_bloco and numero_linha - bloco.primeira_linha + 1 == linhas_por_bloco:
+            yield _sem_linhas_vazias_finais(bloco)
+            bloco = None
+    if bloco is not None:
+        yield _sem_linhas_vazias_finais(bloco)
+
+
+def _sem_linhas_vazias_finais(aba):
+    tamanho = len(aba)
+    for valores in aba.colunas.values():
+        del valores[tamanho:]
+    return aba
+
+
+def _ler_aba_colunar(ws, nome, colunas):
+    return next(_blocos_colunares(ws, nome, colunas), None) or AbaFonte(nome, list(colunas))
+
+
+def _ler_aba_compacta(ws, nome, colunas, primeira_linha=2):
+    # Cada bloco é varrido e compactado assim que lido, como os blocos das
+    # abas externas, e suas listas de valores são descartadas
+    ultima_linha = primeira_linha - 1 if primeira_linha > 2 else 0
+    datas = (None, None, 0, [])
+    tabela = TabelaCategorias() if 'categoria' in colunas else None
+    partes = []
+    for bloco in _blocos_colunares(ws, nome, colunas, primeira_linha, LINHAS_POR_BLOCO):
+        if not bloco.ultima_linha:
+            continue
+        valores = bloco.coluna('data')
+        meses = conversor_padrao.meses_coluna(valores, coluna=(nome, 'data'))
+        datas = somar_datas(datas, resumir_meses(nome, valores, meses, bloco.primeira_linha))
+        partes.append(compactar_aba({nome: bloco}, nome, meses, tabela).contadas())
+        ultima_linha = bloco.ultima_linha
+    return AbaCompacta(nome, primeira_linha, ultima_linha, juntar_transacoes(nome, partes, tabela), datas)
+
+
+def _ler_financiamento(ws):
+    # Aba lida por linhas: cada posição do buffer corresponde a uma coluna
+    # (J, K, ...), e primeira_linha/ultima_linha guardam números de coluna
+    col_ini, col_fim = FINANCIAMENTO_COLUNAS
+    aba = AbaFonte('Financiamento', ['data', 'juros'], primeira_linha=col_ini)
+    linhas = ws.iter_rows(min_row=FINANCIAMENTO_LINHA_DATAS, max_row=FINANCIAMENTO_LINHA_JUROS,
+                          min_col=col_ini, max_col=col_fim, values_only=True)
+    por_linha = {FINANCIAMENTO_LINHA_DATAS + i: list(row) for i, row in enumerate(linhas)}
+    largura = col_fim - col_ini + 1
+    datas = por_linha.get(FINANCIAMENTO_LINHA_DATAS, [])
+    juros = por_linha.get(FINANCIAMENTO_LINHA_JUROS, [])
+    aba.colunas['data'] = (datas + [None] * largura)[:largura]
+    aba.colunas['juros'] = (juros + [None] * largura)[:largura]
+    for indice in range(largura - 1, -1, -1):
+        if aba.colunas['data'][indice] is not None or aba.colunas['juros'][indice] is not None:
+            aba.ultima_linha = col_ini + indice
+            break
+    tamanho = len(aba)
+    aba.colunas['data'] = aba.colunas['data'][:tamanho]
+    aba.colunas['juros'] = aba.colunas['juros'][:tamanho]
+    return aba
+
+
+def ler_fontes(caminho_arquivo, externas=None, marcas=None):
+    """
+    Lê as abas fontes do arquivo em uma única passada por aba, sem carregar
+    o workbook em modo de escrita. As abas de `externas` ({aba: caminho},
+    ver validar_externas) não são lidas do arquivo.
+
+    `marcas` ({aba: (marca, primeira_linha)}) lê as abas indicadas (de
+    ABAS_COMPACTAS) a partir
+    de uma marca (ver LeituraAposMarca): as linhas do XML até `marca` não
+    são convertidas, e a aba começa em `primeira_linha`, que não pode
+    passar de marca + 1. As leituras ficam em DadosFontes.leituras.
+    """
+    externas = externas or {}
+    marcas = marcas or {}
+    wb = openpyxl.load_workbook(caminho_arquivo, read_only=True)
+    try:
+        abas = {}
+        leituras = {}
+        for nome, colunas in COLUNAS_FONTES.items():
+            if nome in wb.sheetnames and nome not in externas:
+                ws = wb[nome]
+                if nome in marcas:
+                    marca, primeira_linha = marcas[nome]
+                    leituras[nome] = _ler_a_partir_da_marca(ws, marca)
+                    abas[nome] = _ler_aba_compacta(ws, nome, colunas, primeira_linha)
+                    leituras[nome].concluir(ws._shared_strings)
+                elif nome in ABAS_COMPACTAS:
+                    abas[nome] = _ler_aba_compacta(ws, nome, colunas)
+                else:
+                    abas[nome] = _ler_aba_colunar(ws, nome, colunas)
+        if 'Financiamento' in wb.sheetnames:
+            abas['Financiamento'] = _ler_financiamento(wb['Financiamento'])
+        dimensoes = {nome: (wb[nome].max_row or 0, wb[nome].max_column or 0) for nome in abas}
+        return DadosFontes(list(wb.sheetnames), abas, dict(wb.defined_names), dimensoes, externas, leituras)
+    finally:
+        wb.close()
+
+
+def validar_externas(externas):
+    """
+    Confere as abas externas ({aba: caminho}): aba aceita, formato conhecido
+    e arquivo existente. Erros são ValueError.
+    """
+    for nome, caminho in (externas or {}).items():
+        if nome not in ABAS_EXTERNAS:
+            raise ValueError(f"A aba '{nome}' não pode ser lida de um arquivo externo. "
+                             f"Use uma de: {', '.join(ABAS_EXTERNAS)}")
+        if os.path.splitext(caminho)[1].lower() not in FORMATOS_EXTERNOS:
+            raise ValueError(f"Formato não suportado para a aba '{nome}': {caminho}. "
+                             f"Use um de: {', '.join(FORMATOS_EXTERNOS)}")
+        if not os.path.exists(caminho):
+            raise ValueError(f"Arquivo da aba '{nome}' não encontrado: {caminho}")
+
+
+def _converter_numero(valor, decimal):
+    if not isinstance(valor, str):
+        return valor
+    texto = valor.strip()
+    if not texto:
+        return None
+    if decimal != '.':
+        texto = texto.replace('.', '').replace(decimal, '.')
+    try:
+        return float(texto)
+    except ValueError:
+        return valor
+
+
+def _converter_data(valor, coluna):
+    # Textos reconhecidos viram datetime; os demais continuam texto, para
+    # serem informados como datas inválidas na varredura
+    if isinstance(valor, str):
+        if not valor.strip():
+            return None
+        return conversor_padrao.converter(valor, coluna) or valor
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        return datetime(valor.year, valor.month, valor.day)
+    return valor
+
+
+def _bloco_externo(nome, campos, primeira_linha, colunas, decimal):
+    """AbaFonte de um bloco de linhas, com textos convertidos como nas células."""
+    aba = AbaFonte(nome, campos, primeira_linha)
+    for campo, valores in zip(campos, colunas):
+        if campo == 'data':
+            valores = [_converter_data(valor, (nome, campo)) for valor in valores]
+        elif campo in CAMPOS_TEXTO:
+            valores = [valor if valor != '' else None for valor in valores]
+        else:
+            valores = [_converter_numero(valor, decimal) for valor in valores]
+        aba.colunas[campo] = valores
+    aba.ultima_linha = primeira_linha + len(colunas[0]) - 1 if colunas and colunas[0] else 0
+    return aba
+
+
+def _blocos_csv(caminho, nome, campos, indices, linhas_por_bloco, delimitador, decimal, codificacao):
+    with open(caminho, newline='', encoding=codificacao) as arquivo:
+        leitor = csv.reader(arquivo, delimiter=delimitador)
+        next(leitor, None)  # cabeçalho
+        primeira_linha = 2
+        while True:
+            linhas = list(itertools.islice(leitor, linhas_por_bloco))
+            if not linhas:
+                return
+            colunas = [[linha[indice] if indice < len(linha) else None for linha in linhas]
+                       for indice in indices]
+            yield _bloco_externo(nome, campos, primeira_linha, colunas, decimal)
+            primeira_linha += len(linhas)
+
+
+def _blocos_parquet(caminho, nome, campos, indices, linhas_por_bloco, decimal):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(f"A leitura de arquivos Parquet requer o pacote pyarrow ({caminho})")
+    arquivo = pq.ParquetFile(caminho)
+    nomes = arquivo.schema_arrow.names
+    lidas = sorted({nomes[indice] for indice in indices if indice < len(nomes)})
+    primeira_linha = 2
+    for lote in arquivo.iter_batches(batch_size=linhas_por_bloco, columns=lidas):
+        colunas = [lote.column(nomes[indice]).to_pylist() if indice < len(nomes) else [None] * lote.num_rows
+                   for indice in indices]
+        yield _bloco_externo(nome, campos, primeira_linha, colunas, decimal)
+        primeira_linha += lote.num_rows
+
+
+def ler_aba_externa(caminho, nome, linhas_por_bloco=LINHAS_POR_BLOCO, delimitador=',', decimal='.',
+                    codificacao='utf-8-sig'):
+    """
+    Itera blocos (AbaFonte) de até `linhas_por_bloco` linhas de uma aba lida
+    de um arquivo CSV ou Parquet. As colunas seguem a posição das colunas da
+    aba (COLUNAS_FONTES: coluna E da aba = 5ª coluna do arquivo), e as linhas
+    são numeradas como na aba, com o cabeçalho na linha 1. No CSV, datas e
+    números em texto são convertidos; `decimal` é o separador decimal.
+    """
+    colunas = COLUNAS_FONTES[nome]
+    campos = list(colunas)
+    indices = [colunas[campo] - 1 for campo in campos]
+    if os.path.splitext(caminho)[1].lower() == '.parquet':
+        return _blocos_parquet(caminho, nome, campos, indices, linhas_por_bloco, decimal)
+    return _blocos_csv(caminho, nome, campos, indices, linhas_por_bloco, delimitador, decimal, codificacao)
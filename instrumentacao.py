@@ -0,0 +1,224 @@
+"""
+Instrumentação das fases da geração da DRE.
+
+Cada fase é medida por um span (gerenciador de contexto) que registra o
+tempo de relógio, o tempo de CPU, contagens informadas pela fase (linhas,
+células, ...) e, opcionalmente, o pico de memória alocada (tracemalloc).
+
+A instrumentação fica desligada por padrão: sem ativar(), medir() devolve
+sempre o mesmo span inativo, cujos métodos não fazem nada. Ativada, as
+medições podem ser gravadas em JSON (uma linha por fase, acrescentada ao
+arquivo) ou no formato texto do Prometheus (ver gravar).
+"""
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+
+class Span:
+    """Medição de uma fase."""
+
+    __slots__ = ('nome', 'inicio', 'segundos', 'cpu_segundos', 'contagens', 'pico_memoria',
+                 '_instrumentacao', '_relogio', '_cpu', '_pico_filhos')
+
+    def __init__(self, instrumentacao, nome, contagens):
+        self.nome = nome
+        self.inicio = None
+        self.segundos = None
+        self.cpu_segundos = None
+        self.contagens = dict(contagens)
+        self.pico_memoria = None
+        self._instrumentacao = instrumentacao
+        self._relogio = None
+        self._cpu = None
+        self._pico_filhos = 0
+
+    def contar(self, **contagens):
+        """Soma contagens à fase (ex.: span.contar(linhas=100))."""
+        for chave, valor in contagens.items():
+            self.contagens[chave] = self.contagens.get(chave, 0) + valor
+
+    def __enter__(self):
+        self._instrumentacao._entrar(self)
+        self.inicio = time.time()
+        self._cpu = time.process_time()
+        self._relogio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self._relogio
+        self.cpu_segundos = time.process_time() - self._cpu
+        self._instrumentacao._sair(self)
+        return False
+
+    def como_dict(self):
+        return {
+            'fase': self.nome,
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec='milliseconds'),
+            'segundos': self.segundos,
+            'cpu_segundos': self.cpu_segundos,
+            'pico_memoria_bytes': self.pico_memoria,
+            'contagens': self.contagens,
+        }
+
+
+class _SpanInativo:
+    """Span usado com a instrumentação desligada: não mede nada."""
+
+    __slots__ = ()
+
+    def contar(self, **contagens):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+SPAN_INATIVO = _SpanInativo()
+
+
+class Instrumentacao:
+    """
+    Spans medidos em uma execução. `rotulos` (ex.: {'arquivo': ...}) são
+    gravados com cada span. Com `memoria=True`, o tracemalloc fica ativo e
+    cada span registra o pico de memória alocada durante a fase (incluindo
+    as fases internas a ela).
+    """
+
+    def __init__(self, rotulos=None, memoria=False):
+        self.rotulos = dict(rotulos or {})
+        self.memoria = memoria
+        self.spans = []
+        self._pilha = []
+        self._parar_tracemalloc = False
+        if memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._parar_tracemalloc = True
+
+    def medir(self, nome, **contagens):
+        return Span(self, nome, contagens)
+
+    def _entrar(self, span):
+        if self.memoria:
+            # O pico é zerado a cada fase; o pico já atingido na fase externa
+            # é guardado antes
+            if self._pilha:
+                externo = self._pilha[-1]
+                externo._pico_filhos = max(externo._pico_filhos, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._pilha.append(span)
+
+    def _sair(self, span):
+        self._pilha.pop()
+        if self.memoria:
+            span.pico_memoria = max(tracemalloc.get_traced_memory()[1], span._pico_filhos)
+            if self._pilha:
+                externo = self._pilha[-1]
+                externo._pico_filhos = max(externo._pico_filhos, span.pico_memoria)
+        self.spans.append(span)
+
+    def encerrar(self):
+        if self._parar_tracemalloc:
+            tracemalloc.stop()
+            self._parar_tracemalloc = False
+
+    def por_fase(self):
+        """Segundos por fase (somados se a fase se repetir)."""
+        fases = {}
+        for span in self.spans:
+            fases[span.nome] = fases.get(span.nome, 0.0) + span.segundos
+        return fases
+
+    def gravar(self, caminho):
+        """
+        Grava as medições: no formato texto do Prometheus se o arquivo
+        terminar em .prom (o arquivo é substituído), ou em JSON, com uma
+        linha por fase acrescentada ao arquivo.
+        """
+        if caminho.endswith('.prom'):
+            self.gravar_prometheus(caminho)
+        else:
+            self.gravar_json(caminho)
+
+    def gravar_json(self, caminho):
+        with open(caminho, 'a', encoding='utf-8') as arquivo:
+            for span in self.spans:
+                registro = dict(self.rotulos, **span.como_dict())
+                arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+
+    def gravar_prometheus(self, caminho):
+        linhas = []
+        metricas = (
+            ('dre_fase_segundos', 'Tempo de relógio de cada fase da geração da DRE.', 'segundos'),
+            ('dre_fase_cpu_segundos', 'Tempo de CPU de cada fase da geração da DRE.', 'cpu_segundos'),
+            ('dre_fase_pico_memoria_bytes', 'Pico de memória alocada em cada fase (tracemalloc).',
+             'pico_memoria'),
+        )
+        for nome, ajuda, atributo in metricas:
+            valores = [(span, getattr(span, atributo)) for span in self.spans]
+            valores = [(span, valor) for span, valor in valores if valor is not None]
+            if not valores:
+                continue
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} gauge']
+            for span, valor in valores:
+                linhas.append(f'{nome}{{{_rotulos_prometheus(self.rotulos, fase=span.nome)}}} {valor}')
+        contagens = [(span, chave, valor) for span in self.spans for chave, valor in span.contagens.items()]
+        if contagens:
+            linhas += ['# HELP dre_fase_itens Itens processados em cada fase (linhas, células, ...).',
+                       '# TYPE dre_fase_itens gauge']
+            for span, chave, valor in contagens:
+                linhas.append(f'dre_fase_itens{{{_rotulos_prometheus(self.rotulos, fase=span.nome, item=chave)}}} '
+                              f'{valor}')
+        # Grava em um arquivo temporário e substitui, para que o coletor
+        # nunca leia um arquivo pela metade
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('\n'.join(linhas) + '\n')
+        os.replace(temporario, caminho)
+
+
+def _rotulos_prometheus(rotulos, **extras):
+    itens = dict(rotulos, **extras)
+    return ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in itens.items())
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_ativa = None
+
+
+def ativar(rotulos=None, memoria=False):
+    """Liga a instrumentação e devolve a Instrumentacao que recebe os spans."""
+    global _ativa
+    _ativa = Instrumentacao(rotulos, memoria)
+    return _ativa
+
+
+def desativar():
+    """Desliga a instrumentação e devolve a Instrumentacao que estava ativa."""
+    global _ativa
+    instrumentacao, _ativa = _ativa, None
+    if instrumentacao is not None:
+        instrumentacao.encerrar()
+    return instrumentacao
+
+
+def ativa():
+    return _ativa is not None
+
+
+def medir(nome, **contagens):
+    """
+    Span da fase `nome`, para uso com `with`. Com a instrumentação
+    desligada, devolve SPAN_INATIVO.
+    """
+    if _ativa is None:
+        return SPAN_INATIVO
+    return _ativa.medir(nome, **contagens)
@@ -0,0 +1,245 @@
+"""
+Layout da DRE.
+
+Cada linha da DRE é descrita uma única vez em LAYOUT_DRE: rótulo, nível
+(coluna B ou C), tipo do item, aba fonte/categoria e formatação. O layout é
+compilado em um PlanoDRE, com o número de cada linha e as letras das colunas
+de mês já calculados, que é usado tanto na escrita das fórmulas quanto na
+formatação da aba.
+
+As fórmulas entre linhas usam marcadores no formato de str.format:
+{col} é a coluna do mês, {ant} a coluna do mês anterior, {inv} a coluna do
+mesmo mês no waterfall da aba Investimentos e {<chave>} o número da linha
+do item com essa chave. Outros marcadores (ex.: {taxa} e {limite}) vêm do
+contexto passado a compilar_layout.
+"""
+from openpyxl.utils import get_column_letter
+
+from agregacao import FONTE_CUSTOS, FONTE_FINANCIAMENTO, FONTE_FOLHA, FONTE_VENDAS
+
+
+LINHA_INICIAL = 4
+LINHA_DATAS = 3  # Cabeçalho com o primeiro dia de cada mês
+COLUNA_INICIAL = 4  # Coluna D
+COLUNA_INICIAL_INVESTIMENTOS = 10  # Coluna J da aba Investimentos (waterfall)
+
+# Data do cabeçalho a partir da segunda coluna: mês seguinte ao da coluna
+# anterior ({ant})
+FORMULA_DATA_MES = '=EDATE({ant}3, 1)'
+
+# Tipos de item
+ITEM_FONTE = 'fonte'      # valores mensais de uma aba fonte
+ITEM_GRUPO = 'grupo'      # soma, com sinal negativo, dos itens filhos
+ITEM_FORMULA = 'formula'  # fórmula sobre outras linhas da DRE
+ITEM_TITULO = 'titulo'    # apenas o rótulo
+ITEM_VAZIO = 'vazio'      # linha em branco
+
+# Tipos de linha usados na formatação
+LINHA_VAZIA = 'vazia'
+LINHA_CABECALHO = 'cabecalho'
+LINHA_VALOR = 'valor'
+LINHA_PERCENTUAL = 'percentual'
+
+_SEM_PRIMEIRO = object()
+
+
+class ItemDRE:
+    """Uma linha do layout da DRE."""
+
+    __slots__ = ('chave', 'rotulo', 'tipo', 'nivel', 'formato', 'fonte', 'categoria',
+                 'sinal', 'formula', 'primeiro', 'filhos', 'contorno')
+
+    def __init__(self, chave, rotulo, tipo, nivel=0, formato=LINHA_VALOR, fonte=None, categoria=None,
+                 sinal='', formula=None, primeiro=_SEM_PRIMEIRO, filhos=(), contorno=0):
+        self.chave = chave
+        self.rotulo = rotulo
+        self.tipo = tipo
+        self.nivel = nivel
+        self.formato = formato
+        self.fonte = fonte
+        self.categoria = categoria
+        self.sinal = sinal
+        self.formula = formula
+        self.primeiro = primeiro
+        self.filhos = tuple(filhos)
+        self.contorno = contorno
+
+    @property
+    def coluna_rotulo(self):
+        if self.rotulo is None:
+            return None
+        return 2 + self.nivel
+
+
+def fonte(chave, rotulo, aba, categoria=None, nivel=1, sinal=''):
+    return ItemDRE(chave, rotulo, ITEM_FONTE, nivel, fonte=aba, categoria=categoria, sinal=sinal)
+
+
+def grupo(chave, rotulo, filhos):
+    return ItemDRE(chave, rotulo, ITEM_GRUPO, filhos=filhos)
+
+
+def formula(chave, rotulo, expressao, nivel=0, formato=LINHA_VALOR, primeiro=_SEM_PRIMEIRO, contorno=0):
+    return ItemDRE(chave, rotulo, ITEM_FORMULA, nivel, formato, formula=expressao, primeiro=primeiro,
+                   contorno=contorno)
+
+
+def percentual_receita(base, nivel=0, rotulo='% da Receita'):
+    return formula(f'{base}_pct', rotulo, '={col}{' + base + '}/{col}{receita}', nivel, LINHA_PERCENTUAL)
+
+
+def margem(chave, rotulo, base):
+    # Os rótulos das margens terminam em '%' e são formatados como as demais
+    # linhas percentuais.
+    return formula(chave, rotulo, '={col}{' + base + '}/{col}{receita}', formato=LINHA_PERCENTUAL)
+
+
+def titulo(chave, rotulo, contorno=0):
+    return ItemDRE(chave, rotulo, ITEM_TITULO, contorno=contorno)
+
+
+def vazia(contorno=0):
+    return ItemDRE(None, None, ITEM_VAZIO, contorno=contorno)
+
+
+LAYOUT_DRE = [
+    fonte('receita', 'Receita ', FONTE_VENDAS, nivel=0),
+    formula('growth', 'Growth %', '=({col}{receita}/{ant}{receita})-1', formato=LINHA_PERCENTUAL,
+            primeiro=None),
+    vazia(),
+    grupo('cmv', 'CMV (-)', ('armazenagem', 'frete', 'materia_prima')),
+    percentual_receita('cmv'),
+    fonte('armazenagem', 'Armazenagem', FONTE_CUSTOS, categoria='Armazenagem'),
+    percentual_receita('armazenagem', nivel=1),
+    fonte('frete', 'Frete', FONTE_CUSTOS, categoria='Frete'),
+    percentual_receita('frete', nivel=1),
+    fonte('materia_prima', 'Matéria-prima', FONTE_CUSTOS, categoria='Matéria-prima'),
+    percentual_receita('materia_prima', nivel=1),
+    vazia(),
+    formula('lucro_bruto', 'Lucro bruto', '={col}{receita}+{col}{cmv}'),
+    margem('margem_bruta', 'Margem Bruta %', 'lucro_bruto'),
+    vazia(),
+    grupo('sga', 'SG&A (-)', ('marketing', 'comercial', 'administrativo', 'folha')),
+    vazia(),
+    fonte('marketing', 'Marketing', FONTE_CUSTOS, categoria='Marketing'),
+    percentual_receita('marketing', nivel=1),
+    fonte('comercial', 'Comercial', FONTE_CUSTOS, categoria='Comercial'),
+    percentual_receita('comercial', nivel=1),
+    fonte('administrativo', 'Administrativo', FONTE_CUSTOS, categoria='Administrativo'),
+    percentual_receita('administrativo', nivel=1),
+    fonte('folha', 'Folha', FONTE_FOLHA),
+    percentual_receita('folha', nivel=1),
+    vazia(),
+    formula('ebitda', 'EBITDA', '={col}{receita}+{col}{cmv}+{col}{sga}'),
+    margem('margem_ebitda', 'Margem EBITDA %', 'ebitda'),
+    vazia(),
+    formula('depreciacao', 'D&A (-)', '=-Investimentos!{inv}1'),
+    vazia(),
+    formula('ebit', 'EBIT', '={col}{ebitda}+{col}{depreciacao}'),
+    margem('margem_operacional', 'Margem Operacional %', 'ebit'),
+    vazia(),
+    fonte('juros', 'Juros (-)', FONTE_FINANCIAMENTO, nivel=0, sinal='-'),
+    vazia(),
+    formula('ebt', 'EBT', '={col}{ebit}+{col}{juros}'),
+    percentual_receita('ebt'),
+    vazia(),
+    titulo('prejuizo', 'Prejuizo Acumulado *', contorno=1),
+    formula('prejuizo_inicio', 'Inicio', '={ant}{prejuizo_final}', nivel=1, primeiro=0, contorno=1),
+    formula('prejuizo_adquirido', 'Saldo Adquirido', '=-IF({col}{ebt}<0,-{col}{ebt},0)', nivel=1,
+            contorno=1),
+    formula('prejuizo_utilizado', 'Saldo Utilizado',
+            '=IF({col}${ebt}>0, MIN({col}${ebt}*{limite}, -{col}${prejuizo_inicio}), 0)', nivel=1, contorno=1),
+    formula('prejuizo_final', 'Final', '=SUM({col}{prejuizo_inicio}:{col}{prejuizo_utilizado})', nivel=1,
+            contorno=1),
+    vazia(contorno=1),
+    formula('base_calculo', 'Base de calculo ', '=IF({col}{ebt}<0,0,{col}{ebt}-{col}{prejuizo_utilizado})',
+            contorno=1),
+    vazia(contorno=1),
+    formula('impostos', 'Impostos (-)', '=-{col}{base_calculo}*{taxa}'),
+    formula('taxa_efetiva', 'Taxa Efetiva de Imposto %', '=ABS({col}{impostos})/{col}{ebit}',
+            formato=LINHA_PERCENTUAL),
+    vazia(),
+    formula('lucro_liquido', 'Lucro (prejuízo) líquido', '=SUM({col}{impostos},{col}{ebt})'),
+    vazia(),
+]
+
+
+class LinhaPlano:
+    """Linha compilada: número da linha, item do layout e fórmulas por mês."""
+
+    __slots__ = ('linha', 'item', 'formulas')
+
+    def __init__(self, linha, item, formulas=None):
+        self.linha = linha
+        self.item = item
+        self.formulas = formulas
+
+
+class PlanoDRE:
+    """
+    Layout compilado para um número de meses: linhas numeradas, letras das
+    colunas de mês e fórmulas entre linhas já montadas.
+    """
+
+    def __init__(self, num_colunas, linhas, letras):
+        self.num_colunas = num_colunas
+        self.linhas = linhas
+        self.letras = letras
+        self.por_chave = {plano.item.chave: plano for plano in linhas if plano.item.chave}
+        self.ultima_linha = linhas[-1].linha if linhas else LINHA_INICIAL - 1
+
+    def linha(self, chave):
+        return self.por_chave[chave].linha
+
+    def linhas_contorno(self):
+        """Itera (linha, nível de contorno) das linhas agrupadas."""
+        for plano in self.linhas:
+            if plano.item.contorno:
+                yield plano.linha, plano.item.contorno
+
+    def linhas_recolhidas(self):
+        """Última linha de cada bloco contínuo de linhas agrupadas."""
+        recolhidas = []
+        anterior = 0
+        for plano in self.linhas:
+            if anterior and not plano.item.contorno:
+                recolhidas.append(plano.linha - 1)
+            anterior = plano.item.contorno
+        if anterior:
+            recolhidas.append(self.ultima_linha)
+        return recolhidas
+
+
+def compilar_layout(num_colunas=12, contexto=None, layout=None):
+    """
+    Numera as linhas do layout a partir de LINHA_INICIAL e monta as fórmulas
+    dos itens ITEM_FORMULA e ITEM_GRUPO para cada mês. As linhas dos itens
+    ITEM_FONTE dependem das abas fontes e são montadas na escrita da DRE.
+    """
+    layout = LAYOUT_DRE if layout is None else layout
+    numeros = {}
+    for deslocamento, item in enumerate(layout):
+        if item.chave is not None:
+            if item.chave in numeros:
+                raise ValueError(f"Chave duplicada no layout da DRE: {item.chave}")
+            numeros[item.chave] = LINHA_INICIAL + deslocamento
+
+    letras = [get_column_letter(COLUNA_INICIAL + i) for i in range(num_colunas)]
+    anteriores = [get_column_letter(COLUNA_INICIAL - 1)] + letras[:-1]
+    investimentos = [get_column_letter(COLUNA_INICIAL_INVESTIMENTOS + i) for i in range(num_colunas)]
+    base = dict(contexto or {}, **numeros)
+
+    linhas = []
+    for deslocamento, item in enumerate(layout):
+        expressao = item.formula
+        if item.tipo == ITEM_GRUPO:
+            expressao = '=-SUM(%s)' % ', '.join(f'{{col}}{{{filho}}}' for filho in item.filhos)
+        formulas = None
+        if expressao is not None:
+            formulas = [expressao.format(col=col, ant=ant, inv=inv, **base)
+                        for col, ant, inv in zip(letras, anteriores, investimentos)]
+            if item.primeiro is not _SEM_PRIMEIRO and formulas:
+                formulas[0] = item.primeiro
+        linhas.append(LinhaPlano(LINHA_INICIAL + deslocamento, item, formulas))
+
+    return PlanoDRE(num_colunas, linhas, letras)
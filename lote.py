@@ -0,0 +1,102 @@
+"""
+Processamento em lote: gera a DRE de vários arquivos em paralelo.
+
+Cada arquivo é processado em um processo do pool, com as mensagens do
+logger 'dre' capturadas, e o resultado (ou o erro) volta como um
+ResultadoArquivo.
+"""
+import io
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+
+logger = logging.getLogger('dre')
+
+
+class ResultadoArquivo:
+    """Resultado do processamento de um arquivo do lote."""
+
+    __slots__ = ('caminho', 'sucesso', 'data_inicial', 'num_meses', 'datas_invalidas',
+                 'segundos', 'erro', 'log')
+
+    def __init__(self, caminho, sucesso, segundos, log, data_inicial=None, num_meses=None,
+                 datas_invalidas=0, erro=None):
+        self.caminho = caminho
+        self.sucesso = sucesso
+        self.data_inicial = data_inicial
+        self.num_meses = num_meses
+        self.datas_invalidas = datas_invalidas
+        self.segundos = segundos
+        self.erro = erro
+        self.log = log
+
+
+def descobrir_arquivos(diretorio):
+    """Lista os arquivos .xlsx do diretório, ignorando temporários do Excel (~$)."""
+    return sorted(
+        os.path.join(diretorio, nome)
+        for nome in os.listdir(diretorio)
+        if nome.lower().endswith('.xlsx') and not nome.startswith('~$')
+        and os.path.isfile(os.path.join(diretorio, nome))
+    )
+
+
+def processar_arquivo(caminho, gerar):
+    """
+    Executa `gerar(caminho)` capturando as mensagens do logger 'dre'. Nunca
+    levanta exceção: erros são devolvidos no resultado.
+    """
+    saida = io.StringIO()
+    handler = logging.StreamHandler(saida)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    inicio = time.perf_counter()
+    try:
+        resultado = gerar(caminho)
+    except Exception as e:
+        saida.write(traceback.format_exc())
+        return ResultadoArquivo(caminho, False, time.perf_counter() - inicio, saida.getvalue(),
+                                erro=f"{type(e).__name__}: {e}")
+    finally:
+        logger.removeHandler(handler)
+    return ResultadoArquivo(caminho, True, time.perf_counter() - inicio, saida.getvalue(),
+                            resultado.data_inicial, resultado.num_meses, len(resultado.datas_invalidas))
+
+
+def processar_lote(caminhos, gerar, workers=None):
+    """
+    Processa os arquivos em um ProcessPoolExecutor e devolve os resultados na
+    mesma ordem de `caminhos`. `gerar` deve ser uma função de nível de módulo.
+    """
+    if workers == 1 or len(caminhos) <= 1:
+        return [processar_arquivo(caminho, gerar) for caminho in caminhos]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [executor.submit(processar_arquivo, caminho, gerar) for caminho in caminhos]
+        return [futuro.result() for futuro in futuros]
+
+
+def imprimir_resumo(resultados):
+    """Imprime a tabela de resumo do lote e os erros dos arquivos com falha."""
+    largura = max([len(os.path.basename(r.caminho)) for r in resultados] + [7])
+
+    print("\n" + "=" * 80)
+    print("RESUMO DO LOTE")
+    print("=" * 80)
+    print(f"{'Arquivo':<{largura}}  {'Status':<6}  {'Período':<10}  {'Meses':>5}  {'Datas inv.':>10}  {'Tempo (s)':>9}")
+    for r in resultados:
+        status = 'OK' if r.sucesso else 'ERRO'
+        periodo = r.data_inicial or '-'
+        meses = r.num_meses if r.num_meses is not None else '-'
+        print(f"{os.path.basename(r.caminho):<{largura}}  {status:<6}  {periodo:<10}  {meses:>5}  "
+              f"{r.datas_invalidas:>10}  {r.segundos:>9.2f}")
+
+    falhas = [r for r in resultados if not r.sucesso]
+    print(f"\nTotal: {len(resultados)} arquivo(s), {len(resultados) - len(falhas)} com sucesso, "
+          f"{len(falhas)} com erro.")
+    for r in falhas:
+        print(f"\n❌ ERRO em {r.caminho}: {r.erro}")
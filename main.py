@@ -1,157 +1,317 @@
 import openpyxl
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import absolute_coordinate, get_column_letter, quote_sheetname, range_boundaries
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.styles import Font, Alignment, NamedStyle, PatternFill
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.comments import Comment
 from datetime import datetime
+import argparse
+from copy import copy
+import functools
+import io
+import logging
+import re
+import sqlite3
 import sys
 import os
-import parametros
+import tempfile
+import numpy as np
+from agregacao import (ABAS_AGREGADAS, FONTE_CUSTOS, FONTE_FINANCIAMENTO, FONTE_FOLHA, FONTE_VENDAS,
+                       AgregadosMensais, agregar_aba, agregar_fontes)
+from avaliacao import avaliar_dre
+from cenarios import LINHAS_CENARIO, avaliar_cenarios, base_cenarios, grade, ler_variacao, validar_cenarios
+from cache import CacheDRE, caminho_cache_padrao, hash_aba, hash_arquivo, impressao_parametros
+from configuracao import MODOS_DRE, carregar_configuracao, configuracao_padrao, ler_definicao
+from consolidacao import DadosEntidade, agregar_entidades, consolidar, nome_entidade
+from datas import conversor_padrao, indice_mes, mes_do_indice, resumir_meses, somar_datas
+from depreciacao import MODOS_DEPRECIACAO, ler_investimentos, matriz_depreciacao, total_depreciacao
+from impostos import LINHAS_PREJUIZO, compensar_prejuizo
+from incremental import ABAS_INCREMENTAIS, estado_valido, marca_leitura, novo_estado
+import instrumentacao
+from instrumentacao import medir
+from ingestao import COLUNAS_FONTES, ler_aba_externa, ler_fontes, validar_externas
+from layout import (COLUNA_INICIAL, FORMULA_DATA_MES, ITEM_FONTE, LINHA_CABECALHO, LINHA_PERCENTUAL, LINHA_VALOR,
+                    LINHA_VAZIA, compilar_layout)
+from lote import descobrir_arquivos, imprimir_resumo, processar_lote
+from modelo import AbaCompacta
+from perfil import INTERVALO_AMOSTRAGEM_MS, MODOS_PERFIL, executar_com_perfil
+from saida import WorkbookEmMemoria, gravar_valores_em_cache, salvar_streaming
+
+
+logger = logging.getLogger('dre')
+logger.addHandler(logging.NullHandler())
+
+
+class ResumoDatasAba:
+    """
+    Resultado da varredura das datas de uma aba fonte. `meses` guarda o
+    índice de mês de cada linha (ver datas.meses_coluna); fica None quando o
+    resumo vem do cache ou de uma aba compactada na leitura
+    (modelo.AbaCompacta).
+    """
+
+    __slots__ = ('aba', 'mes_min', 'mes_max', 'datas_validas', 'datas_invalidas', 'meses')
+
+    def __init__(self, aba):
+        self.aba = aba
+        self.mes_min = None
+        self.mes_max = None
+        self.datas_validas = 0
+        self.datas_invalidas = []
+        self.meses = None
 
 
-def validar_data(data):
+class VarreduraDatas:
     """
-    Valida se uma data é válida verificando:
-    - Mês entre 1 e 12
-    - Dia válido para o mês (considerando anos bissextos)
-    - Ausência de valores negativos
-    - Ano razoável (entre 1900 e 2100)
+    Resultado único da varredura das datas de Vendas, Custo_Despesas e Folha.
+
+    Calculado uma vez por execução e reutilizado na detecção do período e no
+    relatório de datas inválidas.
     """
-    if not isinstance(data, datetime):
-        return False
 
-    if data.year < 0 or data.month < 0 or data.day < 0:
-        return False
+    def __init__(self, abas):
+        self.abas = abas
 
-    if data.month < 1 or data.month > 12:
-        return False
+    @property
+    def mes_min(self):
+        meses = [r.mes_min for r in self.abas.values() if r.mes_min is not None]
+        return min(meses) if meses else None
 
-    if data.year < 1900 or data.year > 2100:
-        return False
+    @property
+    def mes_max(self):
+        meses = [r.mes_max for r in self.abas.values() if r.mes_max is not None]
+        return max(meses) if meses else None
 
-    try:
-        from datetime import date
-        teste = date(data.year, data.month, data.day)
-        return True
-    except ValueError:
-        return False
+    @property
+    def datas_validas(self):
+        return sum(r.datas_validas for r in self.abas.values())
+
+    @property
+    def datas_invalidas(self):
+        return [item for r in self.abas.values() for item in r.datas_invalidas]
+
+
+COLUNAS_DATA = (('Vendas', 'data'), ('Custo_Despesas', 'data'), ('Folha', 'data'))
+ABAS_NECESSARIAS = ('Vendas', 'Custo_Despesas', 'Folha', 'Investimentos', 'Financiamento')
 
 
-def determinar_periodo_dre(workbook):
+def varrer_datas_aba(fontes, aba, campo='data'):
     """
-    Determina o período inicial e final da DRE baseado nos dados das abas
-    Vendas, Custo_Despesas e Folha.
+    Varre a coluna de datas de uma aba fonte já carregada pela ingestão. As
+    abas compactadas na leitura (modelo.AbaCompacta) já trazem o resumo.
     """
-    datas_encontradas = []
-    datas_invalidas = []
+    dados = fontes[aba]
+    if isinstance(dados, AbaCompacta):
+        return _resumo_de_datas(aba, dados.datas)
+    valores = dados.coluna(campo)
+    meses = conversor_padrao.meses_coluna(valores, coluna=(aba, campo))
+    resumo = _resumo_de_datas(aba, resumir_meses(aba, valores, meses, dados.primeira_linha))
+    resumo.meses = meses
+    return resumo
 
-    def converter_data(valor):
-        """Converte um valor para datetime, lidando com diferentes formatos."""
-        if valor is None:
-            return None
-        try:
-            if isinstance(valor, datetime):
-                return valor
-            elif isinstance(valor, (int, float)):
-                if valor < 0 or valor > 1000000:
-                    return None
-                try:
-                    from datetime import date, timedelta
-                    excel_epoch = date(1899, 12, 30)
-                    data = excel_epoch + timedelta(days=int(valor))
-                    return datetime(data.year, data.month, data.day)
-                except (ValueError, OverflowError):
-                    return None
-            elif isinstance(valor, str):
-                valor = valor.strip()
-                if not valor:
-                    return None
-                formatos = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S',
-                            '%d-%m-%Y', '%m-%d-%Y']
-                for fmt in formatos:
-                    try:
-                        return datetime.strptime(valor, fmt)
-                    except ValueError:
-                        continue
-                return None
+
+def varrer_datas(fontes):
+    """
+    Percorre uma única vez as colunas de data das abas Vendas, Custo_Despesas
+    e Folha, já carregadas pela ingestão.
+    """
+    resumos = {}
+    for aba, campo in COLUNAS_DATA:
+        if aba in fontes:
+            resumos[aba] = varrer_datas_aba(fontes, aba, campo)
+    return VarreduraDatas(resumos)
+
+
+def _resumo_de_datas(aba, datas):
+    resumo = ResumoDatasAba(aba)
+    resumo.mes_min, resumo.mes_max, resumo.datas_validas, resumo.datas_invalidas = datas
+    return resumo
+
+
+def _varrer_e_agregar_aba(fontes, aba):
+    """Varre as datas e agrega uma aba. Devolve (datas, agregados)."""
+    colunas_data = dict(COLUNAS_DATA)
+    datas = None
+    meses = None
+    if aba in colunas_data:
+        resumo = varrer_datas_aba(fontes, aba, colunas_data[aba])
+        meses = resumo.meses
+        datas = (resumo.mes_min, resumo.mes_max, resumo.datas_validas, resumo.datas_invalidas)
+    return datas, agregar_aba(fontes, aba, meses)
+
+
+def _varrer_e_agregar_externa(fontes, aba, config):
+    """Varre as datas e agrega, bloco a bloco, uma aba lida de arquivo externo."""
+    caminho = fontes.externas[aba]
+    datas = (None, None, 0, [])
+    agregados = AgregadosMensais()
+    linhas = 0
+    for bloco in ler_aba_externa(caminho, aba, delimitador=config.csv_delimitador,
+                                 decimal=config.csv_separador_decimal, codificacao=config.csv_codificacao):
+        datas_bloco, agregados_bloco = _varrer_e_agregar_aba({aba: bloco}, aba)
+        datas = somar_datas(datas, datas_bloco)
+        agregados.mesclar(agregados_bloco)
+        linhas += len(bloco)
+    logger.info(f"✓ Aba '{aba}' lida de {caminho} ({linhas} linha(s))")
+    return datas, agregados
+
+
+def _opcoes_csv(config):
+    return (config.csv_delimitador, config.csv_separador_decimal, config.csv_codificacao)
+
+
+def varrer_e_agregar_externas(fontes, varredura, agregados, config, cache=None, hashes=None):
+    """
+    Inclui na varredura e nos agregados as abas lidas de arquivos externos
+    (ver ingestao.ler_aba_externa), com as opções de CSV de `config`. Com
+    `cache`, o resultado de cada arquivo é guardado pelo hash do seu
+    conteúdo (`hashes`: {aba: hash}).
+    """
+    for aba in fontes.externas:
+        chave = None
+        em_cache = None
+        if cache is not None:
+            hash_externa = hashes[aba] if hashes else hash_arquivo(fontes.externas[aba])
+            chave = impressao_parametros({'aba': aba, 'arquivo': hash_externa, 'csv': _opcoes_csv(config)})
+            em_cache = cache.buscar_aba(chave)
+        if em_cache is not None:
+            datas, agregados_aba = em_cache
+            logger.info(f"✓ Aba '{aba}' sem alterações (cache)")
+        else:
+            datas, agregados_aba = _varrer_e_agregar_externa(fontes, aba, config)
+            if chave is not None:
+                cache.guardar_aba(chave, aba, (datas, agregados_aba))
+        varredura.abas[aba] = _resumo_de_datas(aba, datas)
+        agregados.mesclar(agregados_aba)
+
+
+def varrer_e_agregar_com_cache(fontes, cache, estados=None):
+    """
+    Varredura de datas e agregação mensal aba a aba, reaproveitando do cache
+    o resultado das abas cujo conteúdo não mudou.
+
+    Com `estados` (modo incremental, ver incremental.py), as abas de
+    ABAS_INCREMENTAIS foram lidas a partir da marca do seu estado: só as
+    linhas novas são varridas e agregadas e somadas ao estado.
+
+    Devolve (varredura, agregados, novos estados incrementais).
+    """
+    resumos = {}
+    agregados = AgregadosMensais()
+    novos_estados = {}
+    for aba in ABAS_AGREGADAS:
+        if aba not in fontes:
+            continue
+        if estados is not None and aba in ABAS_INCREMENTAIS:
+            estado = estados.get(aba)
+            datas, agregados_aba = _varrer_e_agregar_aba(fontes, aba)
+            if estado is not None:
+                logger.info(f"✓ Aba '{aba}': {len(fontes[aba])} linha(s) nova(s) (modo incremental)")
+                datas = somar_datas(estado.datas, datas)
+                estado.agregados.mesclar(agregados_aba)
+                agregados_aba = estado.agregados
+            novos_estados[aba] = novo_estado(fontes.leituras.get(aba), fontes[aba], datas, agregados_aba)
+        else:
+            chave = hash_aba(fontes[aba])
+            em_cache = cache.buscar_aba(chave)
+            if em_cache is not None:
+                datas, agregados_aba = em_cache
+                logger.info(f"✓ Aba '{aba}' sem alterações (cache)")
             else:
-                return None
-        except (ValueError, TypeError, AttributeError):
-            return None
-
-    if 'Vendas' in workbook.sheetnames:
-        ws_vendas = workbook['Vendas']
-        for row_num, row in enumerate(ws_vendas.iter_rows(min_row=2, min_col=6, max_col=6, values_only=False), start=2):
-            if row[0].value is not None and row[0].value not in ['', None]:
-                data = converter_data(row[0].value)
-                if data:
-                    if validar_data(data):
-                        datas_encontradas.append(data)
-                    else:
-                        datas_invalidas.append(('Vendas', row_num, row[0].value))
-                else:
-                    datas_invalidas.append(('Vendas', row_num, row[0].value))
-
-    if 'Custo_Despesas' in workbook.sheetnames:
-        ws_custo = workbook['Custo_Despesas']
-        for row_num, row in enumerate(ws_custo.iter_rows(min_row=2, min_col=3, max_col=3, values_only=False), start=2):
-            if row[0].value is not None and row[0].value not in ['', None]:
-                data = converter_data(row[0].value)
-                if data:
-                    if validar_data(data):
-                        datas_encontradas.append(data)
-                    else:
-                        datas_invalidas.append(('Custo_Despesas', row_num, row[0].value))
-                else:
-                    datas_invalidas.append(('Custo_Despesas', row_num, row[0].value))
-
-    if 'Folha' in workbook.sheetnames:
-        ws_folha = workbook['Folha']
-        for row_num, row in enumerate(ws_folha.iter_rows(min_row=2, min_col=1, max_col=1, values_only=False), start=2):
-            if row[0].value is not None and row[0].value not in ['', None]:
-                data = converter_data(row[0].value)
-                if data:
-                    if validar_data(data):
-                        datas_encontradas.append(data)
-                    else:
-                        datas_invalidas.append(('Folha', row_num, row[0].value))
-                else:
-                    datas_invalidas.append(('Folha', row_num, row[0].value))
+                datas, agregados_aba = _varrer_e_agregar_aba(fontes, aba)
+                cache.guardar_aba(chave, aba, (datas, agregados_aba))
+        if datas is not None:
+            resumos[aba] = _resumo_de_datas(aba, datas)
+        agregados.mesclar(agregados_aba)
+    return VarreduraDatas(resumos), agregados, novos_estados
 
-    if not datas_encontradas:
-        print("⚠ Aviso: Não foram encontradas datas válidas nas planilhas. Usando valores padrão.")
-        return '2024-01-01', 12, datas_invalidas
 
-    data_min = min(datas_encontradas)
-    data_max = max(datas_encontradas)
+def ler_fontes_incremental(entrada, cache, externas=None):
+    """
+    Lê as abas fontes com os estados incrementais guardados para o arquivo:
+    Vendas e Custo_Despesas são lidas só a partir da marca do seu estado,
+    conferindo o hash das linhas já processadas (ver incremental.py). Os
+    estados das abas com linhas processadas alteradas, removidas ou
+    inseridas são descartados, e essas abas são lidas de novo por completo.
+    As abas lidas de arquivos externos não são incrementais. Devolve
+    (fontes, estados).
+    """
+    externas = externas or {}
+    estados = {}
+    for aba in ABAS_INCREMENTAIS:
+        estado = cache.buscar_estado(entrada, aba) if aba not in externas else None
+        if estado is not None:
+            estados[aba] = estado
+    marcas = {aba: marca_leitura(estados.get(aba)) for aba in ABAS_INCREMENTAIS if aba not in externas}
+    fontes = ler_fontes(entrada, externas=externas, marcas=marcas)
+    alteradas = [aba for aba, estado in estados.items() if not estado_valido(estado, fontes.leituras.get(aba))]
+    if alteradas:
+        logger.warning(f"⚠ Aviso: Linhas já processadas foram alteradas em: {', '.join(alteradas)}. "
+                       f"Processando as abas por completo.")
+        for aba in alteradas:
+            del estados[aba]
+            marcas[aba] = marca_leitura(None)
+        fontes = ler_fontes(entrada, externas=externas, marcas=marcas)
+    return fontes, estados
+
+
+def determinar_periodo_dre(varredura):
+    """
+    Determina o período inicial e final da DRE a partir da varredura de datas
+    das abas Vendas, Custo_Despesas e Folha.
+    """
+    if varredura.mes_min is None:
+        logger.warning("⚠ Aviso: Não foram encontradas datas válidas nas planilhas. Usando valores padrão.")
+        return '2024-01-01', 12
 
-    data_inicial = datetime(data_min.year, data_min.month, 1)
-    data_final = datetime(data_max.year, data_max.month, 1)
+    data_inicial = varredura.mes_min
+    data_final = varredura.mes_max
 
     meses_diff = (data_final.year - data_inicial.year) * 12 + (data_final.month - data_inicial.month)
     num_meses = meses_diff + 1
 
     data_inicial_str = data_inicial.strftime('%Y-%m-%d')
-    print(f"✓ Período detectado: {data_inicial_str} a {data_final.strftime('%Y-%m-%d')} ({num_meses} meses)")
+    logger.info(f"✓ Período detectado: {data_inicial_str} a {data_final.strftime('%Y-%m-%d')} ({num_meses} meses)")
 
-    return data_inicial_str, num_meses, datas_invalidas
+    return data_inicial_str, num_meses
 
 
-def verificar_abas_fontes(workbook, abas_necessarias):
-    abas_existentes = workbook.sheetnames
-    abas_faltantes = [aba for aba in abas_necessarias if aba not in abas_existentes]
+def verificar_abas_fontes(fontes, abas_necessarias):
+    abas_faltantes = [aba for aba in abas_necessarias if not fontes.disponivel(aba)]
     if abas_faltantes:
         raise ValueError(f"ERRO: As seguintes abas fontes não foram encontradas: {', '.join(abas_faltantes)}")
-    print(f"✓ Todas as abas fontes foram encontradas: {', '.join(abas_necessarias)}")
+    logger.info(f"✓ Todas as abas fontes foram encontradas: {', '.join(abas_necessarias)}")
 
 
 def criar_aba_dre_se_nao_existir(workbook):
     if 'DRE' in workbook.sheetnames:
-        print("✓ Aba DRE já existe. Será reconstruída.")
+        logger.info("✓ Aba DRE já existe. Será reconstruída.")
         workbook.remove(workbook['DRE'])
     ws_dre = workbook.create_sheet('DRE', 0)
-    print("✓ Aba DRE criada com sucesso.")
+    logger.info("✓ Aba DRE criada com sucesso.")
     return ws_dre
 
 
+def criar_aba_agregada(workbook, agregados):
+    """
+    Cria a aba oculta _Agg com uma linha por (fonte, categoria, mês) e o
+    valor já somado, usada pelas fórmulas da DRE no modo 'agregado'.
+    """
+    remover_aba_agregada(workbook)
+    ws_agg = workbook.create_sheet(ABA_AGREGADA)
+    ws_agg.sheet_state = 'hidden'
+    ws_agg.append(['Fonte', 'Categoria', 'Mês', 'Valor'])
+    for fonte, categoria, mes, valor in agregados.linhas():
+        ws_agg.append([fonte, categoria, mes_do_indice(mes), valor])
+    logger.info(f"✓ Aba {ABA_AGREGADA} criada com {len(agregados)} linha(s).")
+    return ws_agg
+
+
+def remover_aba_agregada(workbook):
+    if ABA_AGREGADA in workbook.sheetnames:
+        workbook.remove(workbook[ABA_AGREGADA])
+
+
 def configurar_cabecalho_dre(ws_dre, data_inicial='2024-01-01', num_meses=12):
     ws_dre['A1'] = 'DRE'
     ws_dre['A1'].font = Font(size=14, bold=True)
@@ -166,449 +326,419 @@ def configurar_cabecalho_dre(ws_dre, data_inicial='2024-01-01', num_meses=12):
     for i in range(1, num_meses):
         col_letra = get_column_letter(4 + i)
         col_anterior = get_column_letter(4 + i - 1)
-        ws_dre[f'{col_letra}3'] = f'=EDATE({col_anterior}3, 1)'
+        ws_dre[f'{col_letra}3'] = FORMULA_DATA_MES.format(ant=col_anterior)
         ws_dre[f'{col_letra}3'].number_format = 'mm/yy'
         ws_dre[f'{col_letra}3'].alignment = Alignment(horizontal='center')
 
 
-def aplicar_formatacao_dre(ws_dre, num_colunas=12):
-    formato_milhares = '#,##0.00,_);(#,##0.00,); -'
-    formato_porcentagem = '0.0%'
-    font_italico = Font(italic=True)
-    font_negrito = Font(bold=True)
+FORMATO_MILHARES = '#,##0.00,_);(#,##0.00,); -'
+FORMATO_PORCENTAGEM = '0.0%'
+
+# Estilos nomeados por tipo de linha: (estilo do rótulo, estilo dos valores)
+ESTILO_FUNDO = 'DRE Fundo'
+ESTILO_MES = 'DRE Mês'
+ESTILOS_LINHA = {
+    LINHA_VAZIA: (ESTILO_FUNDO, ESTILO_FUNDO),
+    LINHA_CABECALHO: (ESTILO_FUNDO, ESTILO_MES),
+    LINHA_VALOR: ('DRE Rótulo', 'DRE Valor'),
+    LINHA_PERCENTUAL: ('DRE Rótulo %', 'DRE Percentual'),
+}
+
+
+def _fonte(base, **atributos):
+    fonte = copy(base)
+    for nome, valor in atributos.items():
+        setattr(fonte, nome, valor)
+    return fonte
+
+
+def _criar_estilos_dre(fonte_base=DEFAULT_FONT):
+    """
+    Estilos nomeados compartilhados por todas as células da DRE.
+
+    As fontes partem de `fonte_base` (a fonte padrão do workbook), para que as células
+    da DRE mantenham nome e tamanho da fonte em vez de ficarem sem fonte definida.
+    """
+    fill_branco = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
     alinhamento_num = Alignment(horizontal='right')
     alinhamento_texto = Alignment(horizontal='left')
+    return [
+        NamedStyle(ESTILO_FUNDO, fill=fill_branco, font=_fonte(fonte_base)),
+        NamedStyle(ESTILO_MES, fill=fill_branco, font=_fonte(fonte_base), number_format='mm/yy',
+                   alignment=Alignment(horizontal='center', vertical='center')),
+        NamedStyle('DRE Rótulo', fill=fill_branco, font=_fonte(fonte_base, b=True), alignment=alinhamento_texto),
+        NamedStyle('DRE Rótulo %', fill=fill_branco, font=_fonte(fonte_base, b=False, i=True),
+                   alignment=alinhamento_texto),
+        NamedStyle('DRE Valor', fill=fill_branco, font=_fonte(fonte_base, i=False), number_format=FORMATO_MILHARES,
+                   alignment=alinhamento_num),
+        NamedStyle('DRE Percentual', fill=fill_branco, font=_fonte(fonte_base, i=True),
+                   number_format=FORMATO_PORCENTAGEM, alignment=alinhamento_num),
+    ]
+
+
+def registrar_estilos_dre(workbook):
+    """Registra no workbook os estilos nomeados da DRE que ainda não existem."""
+    existentes = set(workbook.named_styles)
+    fontes = getattr(workbook, '_fonts', None)
+    for estilo in _criar_estilos_dre(fontes[0] if fontes else DEFAULT_FONT):
+        if estilo.name not in existentes:
+            workbook.add_named_style(estilo)
+
+
+def _formatar_linha(ws_dre, linha, tipo, coluna_rotulo, ultima_coluna):
+    estilo_rotulo, estilo_valor = ESTILOS_LINHA[tipo]
+    for coluna in (1, 2, 3):
+        ws_dre.cell(row=linha, column=coluna).style = estilo_rotulo if coluna == coluna_rotulo else ESTILO_FUNDO
+    for coluna in range(4, ultima_coluna + 1):
+        ws_dre.cell(row=linha, column=coluna).style = estilo_valor
+
+
+def aplicar_formatacao_dre(ws_dre, num_colunas=12, plano=None):
+    """
+    Formata a DRE a partir do plano compilado do layout (ver layout.py): um
+    estilo nomeado por tipo de linha, aplicado em uma única passada por linha.
+    """
+    if plano is None:
+        plano = compilar_plano_dre(num_colunas)
     fill_azul = PatternFill(start_color='BDD7EE', end_color='BDD7EE', fill_type='solid')
-    fill_branco = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
+    registrar_estilos_dre(ws_dre.parent)
 
     ws_dre.column_dimensions['A'].width = 2.5
     ws_dre.column_dimensions['B'].width = 2.5
     ws_dre.column_dimensions['C'].width = 22
 
     for col_off in range(1, 4 + num_colunas):
-        cell = ws_dre.cell(row=1, column=col_off)
-        cell.fill = fill_azul
-
-    for j in range(num_colunas):
-        c = ws_dre.cell(row=3, column=4 + j)
-        c.number_format = 'mm/yy'
-        c.alignment = Alignment(horizontal='center', vertical='center')
-        c.fill = fill_branco
-
-    max_lin = 56
-    for i in range(2, max_lin + 1):
-        for j in range(1, 4 + num_colunas):
-            cell = ws_dre.cell(row=i, column=j)
-            if cell.fill != fill_azul:
-                cell.fill = fill_branco
+        ws_dre.cell(row=1, column=col_off).fill = fill_azul
 
-    termos_percentagem = ["%", "Growth", "% da Receita"]
-
-    for col in [1, 2, 3]:
-        for i in range(4, max_lin):
-            cell = ws_dre.cell(row=i, column=col)
-            if cell.value is not None:
-                cell_value_str = str(cell.value)
-                is_percentagem = any(termo in cell_value_str for termo in termos_percentagem)
-                if is_percentagem:
-                    cell.font = Font(bold=False, italic=True)
-                elif col == 2 and "Margem" in cell_value_str:
-                    cell.font = Font(bold=True, italic=True)
-                elif col == 2 or col == 3:
-                    cell.font = font_negrito
-                cell.alignment = alinhamento_texto
-
-    linhas_percentuais = [5, 8, 10, 12, 14, 17, 22, 24, 26, 28, 31, 36, 41, 52]
-    for i in range(4, max_lin):
-        for j in range(num_colunas):
-            c = ws_dre.cell(row=i, column=4 + j)
-            if i in linhas_percentuais or (
-                    ws_dre.cell(row=i, column=2).value and "Margem" in str(ws_dre.cell(row=i, column=2).value)):
-                c.number_format = formato_porcentagem
-                c.font = font_italico
-            else:
-                c.number_format = formato_milhares
-                c.font = Font(italic=False)
-            c.alignment = alinhamento_num
-
-
-def construir_estrutura_dre(workbook, ws_dre, num_colunas=12):
-    linha = 4
-    ws_dre.cell(row=linha, column=2).value = 'Receita '
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Vendas!$E:$E,Vendas!$F:$F,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Vendas!$F:$F,"<="&EOMONTH(DRE!{col_letra}$3,0))'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 5
-    ws_dre.cell(row=linha, column=2).value = 'Growth %'
-    for i in range(num_colunas):
-        col = 4 + i
-        if i == 0:
-            ws_dre.cell(row=linha, column=col).value = None
-        else:
-            col_letra = get_column_letter(col)
-            col_anterior = get_column_letter(col - 1)
-            formula = f'=({col_letra}4/{col_anterior}4)-1'
-            ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 7
-    ws_dre.cell(row=linha, column=2).value = 'CMV (-)'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=-SUM({col_letra}9, {col_letra}11, {col_letra}13)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 8
-    ws_dre.cell(row=linha, column=2).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}7/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 9
-    ws_dre.cell(row=linha, column=3).value = 'Armazenagem'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C9)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 10
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}9/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 11
-    ws_dre.cell(row=linha, column=3).value = 'Frete'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C11)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 12
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}11/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 13
-    ws_dre.cell(row=linha, column=3).value = 'Matéria-prima'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C13)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 14
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}13/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 16
-    ws_dre.cell(row=linha, column=2).value = 'Lucro bruto'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}4+{col_letra}7'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 17
-    ws_dre.cell(row=linha, column=2).value = 'Margem Bruta %'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}16/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 19
-    ws_dre.cell(row=linha, column=2).value = 'SG&A (-)'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=-SUM({col_letra}21, {col_letra}23, {col_letra}25, {col_letra}27)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 21
-    ws_dre.cell(row=linha, column=3).value = 'Marketing'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C21)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 22
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}21/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 23
-    ws_dre.cell(row=linha, column=3).value = 'Comercial'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C23)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 24
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}23/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 25
-    ws_dre.cell(row=linha, column=3).value = 'Administrativo'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUMIFS(Custo_Despesas!$B:$B,Custo_Despesas!$C:$C,">="&EOMONTH(DRE!{col_letra}$3,-1)+1,Custo_Despesas!$C:$C,"<="&EOMONTH(DRE!{col_letra}$3,0),Custo_Despesas!$A:$A,$C25)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 26
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}25/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 27
-    ws_dre.cell(row=linha, column=3).value = 'Folha'
-    for i in range(num_colunas):
-        col_letra = get_column_letter(4 + i)
-        formula = (
-            f'=SUMIFS(Folha!$C:$C, Folha!$A:$A, ">= " & EOMONTH(DRE!{col_letra}$3, -1) + 1, Folha!$A:$A, "<= " & EOMONTH(DRE!{col_letra}$3, 0))'
-            f'+SUMIFS(Folha!$D:$D, Folha!$A:$A, ">= " & EOMONTH(DRE!{col_letra}$3, -1) + 1, Folha!$A:$A, "<= " & EOMONTH(DRE!{col_letra}$3, 0))'
-            f'+SUMIFS(Folha!$E:$E, Folha!$A:$A, ">= " & EOMONTH(DRE!{col_letra}$3, -1) + 1, Folha!$A:$A, "<= " & EOMONTH(DRE!{col_letra}$3, 0))'
-        )
-        ws_dre.cell(row=linha, column=4 + i).value = formula
-
-    linha = 28
-    ws_dre.cell(row=linha, column=3).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}27/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 30
-    ws_dre.cell(row=linha, column=2).value = 'EBITDA'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}4+{col_letra}7+{col_letra}19'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 31
-    ws_dre.cell(row=linha, column=2).value = 'Margem EBITDA %'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}30/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 33
-    ws_dre.cell(row=linha, column=2).value = 'D&A (-)'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra_inv = get_column_letter(10 + i)
-        formula = f'=-Investimentos!{col_letra_inv}1'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 35
-    ws_dre.cell(row=linha, column=2).value = 'EBIT'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}30+{col_letra}33'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 36
-    ws_dre.cell(row=linha, column=2).value = 'Margem Operacional %'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}35/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    # --- Juros (-) ---
-    linha = 38
-    ws_dre.cell(row=linha, column=2).value = 'Juros (-)'
-    if 'Financiamento' in workbook.sheetnames:
-        for i in range(num_colunas):
-            col = 4 + i
-            col_letra = get_column_letter(col)
-            # This formula dynamically finds the interest for the correct month.
-            # It assumes interest values are in row 5 and dates are in row 4 of the 'Financiamento' sheet.
-            formula = (
-                f'=-SUMIFS(Financiamento!$J$5:$AZ$5, '
-                f'Financiamento!$J$4:$AZ$4, ">="&EOMONTH(DRE!{col_letra}$3,-1)+1, '
-                f'Financiamento!$J$4:$AZ$4, "<="&EOMONTH(DRE!{col_letra}$3,0))'
-            )
-            ws_dre.cell(row=linha, column=col).value = formula
-    else:
-        print("⚠ Aviso: Aba 'Financiamento' não encontrada. Juros (-) permanecerão zerados.")
-        for i in range(num_colunas):
-            ws_dre.cell(row=linha, column=4 + i).value = 0
-
-    linha = 40
-    ws_dre.cell(row=linha, column=2).value = 'EBT'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}35+{col_letra}38'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 41
-    ws_dre.cell(row=linha, column=2).value = '% da Receita'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'={col_letra}40/{col_letra}4'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    for row in range(43, 51):
-        ws_dre.row_dimensions[row].outline_level = 1
-    ws_dre.row_dimensions[50].collapsed = True
+    ultima_coluna = 3 + num_colunas
+    _formatar_linha(ws_dre, 2, LINHA_VAZIA, None, ultima_coluna)
+    _formatar_linha(ws_dre, 3, LINHA_CABECALHO, None, ultima_coluna)
+    for linha_plano in plano.linhas:
+        item = linha_plano.item
+        _formatar_linha(ws_dre, linha_plano.linha, item.formato, item.coluna_rotulo, ultima_coluna)
+    _formatar_linha(ws_dre, plano.ultima_linha + 1, LINHA_VAZIA, None, ultima_coluna)
+
+
+ABA_AGREGADA = '_Agg'
+
+
+def _serie_fonte(agregados, fonte, data_inicial, num_meses, categoria=None):
+    if agregados is None:
+        return [0] * num_meses
+    mes_inicial = indice_mes(datetime.strptime(data_inicial, '%Y-%m-%d'))
+    return agregados.serie(fonte, mes_inicial, num_meses, categoria)
+
+
+def _intervalo_fonte(fontes, aba, campo):
+    """
+    Referência absoluta às linhas usadas de uma coluna de uma aba fonte
+    (ex.: Vendas!$E$2:$E$261), em vez da coluna inteira.
+    """
+    coluna = get_column_letter(COLUNAS_FONTES[aba][campo])
+    ultima_linha = max(fontes[aba].ultima_linha, 2) if aba in fontes else 2
+    return f'{aba}!${coluna}$2:${coluna}${ultima_linha}'
+
+
+def _consulta_agregada(agregados, fonte, col_letra, linha_categoria=None, sinal=''):
+    """
+    Fórmula que busca o valor mensal de uma fonte na aba auxiliar _Agg
+    (ver criar_aba_agregada), filtrando também pela categoria da linha.
+    """
+    if agregados is None:
+        return None
+    ultima_linha = max(len(agregados) + 1, 2)
+    aba = f"'{ABA_AGREGADA}'"
+    formula = (
+        f'={sinal}SUMIFS({aba}!$D$2:$D${ultima_linha},{aba}!$A$2:$A${ultima_linha},"{fonte}",'
+        f'{aba}!$C$2:$C${ultima_linha},DRE!{col_letra}$3'
+    )
+    if linha_categoria is not None:
+        formula += f',{aba}!$B$2:$B${ultima_linha},$C{linha_categoria}'
+    return formula + ')'
+
+
+def _escrever_celula_fonte(cell, formula, valor, modo, consulta=None):
+    """
+    Escreve uma célula que depende das abas fontes conforme o modo da DRE:
+    - 'formulas': fórmula SUMIFS sobre a aba fonte
+    - 'agregado': fórmula de consulta à aba auxiliar _Agg
+    - 'valores': valor já agregado em Python
+    - 'hibrido': valor agregado, com a fórmula equivalente em um comentário
+    """
+    if modo == 'formulas':
+        cell.value = formula
+        return
+    if modo == 'agregado':
+        cell.value = consulta
+        return
+    cell.value = valor
+    if modo == 'hibrido':
+        cell.comment = Comment(formula, 'DRE')
+
+
+# Fórmulas das linhas alimentadas pelas abas fontes, por aba. Além dos
+# marcadores do layout ({col}, {linha}), usam os intervalos limitados às
+# linhas usadas de cada aba (ver _intervalos_fontes).
+FORMULAS_FONTES = {
+    FONTE_VENDAS: (
+        'SUMIFS({valor},{data},">="&EOMONTH(DRE!{col}$3,-1)+1,{data},"<="&EOMONTH(DRE!{col}$3,0))'
+    ),
+    FONTE_CUSTOS: (
+        'SUMIFS({valor},{data},">="&EOMONTH(DRE!{col}$3,-1)+1,{data},"<="&EOMONTH(DRE!{col}$3,0),'
+        '{categoria},$C{linha})'
+    ),
+    # Um SUMIFS por coluna de valores: como no SUMIFS das demais abas,
+    # células com texto nessas colunas são ignoradas
+    FONTE_FOLHA: (
+        'SUMIFS({salario},{data},">="&EOMONTH(DRE!{col}$3,-1)+1,{data},"<="&EOMONTH(DRE!{col}$3,0))'
+        '+SUMIFS({encargos},{data},">="&EOMONTH(DRE!{col}$3,-1)+1,{data},"<="&EOMONTH(DRE!{col}$3,0))'
+        '+SUMIFS({beneficios},{data},">="&EOMONTH(DRE!{col}$3,-1)+1,{data},"<="&EOMONTH(DRE!{col}$3,0))'
+    ),
+    # Busca os juros do mês correspondente. Assume que os juros estão na
+    # linha 5 e as datas na linha 4 da aba 'Financiamento'.
+    FONTE_FINANCIAMENTO: (
+        'SUMIFS(Financiamento!$J$5:$AZ$5, '
+        'Financiamento!$J$4:$AZ$4, ">="&EOMONTH(DRE!{col}$3,-1)+1, '
+        'Financiamento!$J$4:$AZ$4, "<="&EOMONTH(DRE!{col}$3,0))'
+    ),
+}
+
+
+def _intervalos_fontes(fontes):
+    """Intervalos limitados às linhas usadas de cada aba fonte."""
+    return {
+        FONTE_VENDAS: {
+            'valor': _intervalo_fonte(fontes, FONTE_VENDAS, 'valor'),
+            'data': _intervalo_fonte(fontes, FONTE_VENDAS, 'data'),
+        },
+        FONTE_CUSTOS: {
+            'categoria': _intervalo_fonte(fontes, FONTE_CUSTOS, 'categoria'),
+            'valor': _intervalo_fonte(fontes, FONTE_CUSTOS, 'valor'),
+            'data': _intervalo_fonte(fontes, FONTE_CUSTOS, 'data'),
+        },
+        FONTE_FOLHA: {
+            'data': _intervalo_fonte(fontes, FONTE_FOLHA, 'data'),
+            'salario': _intervalo_fonte(fontes, FONTE_FOLHA, 'salario'),
+            'encargos': _intervalo_fonte(fontes, FONTE_FOLHA, 'encargos'),
+            'beneficios': _intervalo_fonte(fontes, FONTE_FOLHA, 'beneficios'),
+        },
+        FONTE_FINANCIAMENTO: {},
+    }
+
+
+def compilar_plano_dre(num_colunas=12, config=None):
+    """Compila o layout da DRE com os parâmetros de `config` (padrão: parametros.py)."""
+    if config is None:
+        config = configuracao_padrao()
+    return compilar_layout(num_colunas, {'taxa': config.taxa_imposto / 100,
+                                         'limite': config.limite_compensacao_prejuizo / 100})
+
+
+def _serie_linha_fonte(fontes, item, agregados, data_inicial, num_meses):
+    """Valores mensais de uma linha ITEM_FONTE, já com o sinal; zeros se a aba não existir."""
+    if not fontes.disponivel(item.fonte):
+        return [0] * num_meses
+    serie = _serie_fonte(agregados, item.fonte, data_inicial, num_meses, item.categoria)
+    return [-valor for valor in serie] if item.sinal == '-' else serie
+
+
+def series_fontes_dre(fontes, plano, agregados, data_inicial):
+    """Série mensal de cada linha ITEM_FONTE do plano, por chave (ver avaliacao.avaliar_dre)."""
+    return {linha_plano.item.chave: _serie_linha_fonte(fontes, linha_plano.item, agregados, data_inicial,
+                                                       plano.num_colunas)
+            for linha_plano in plano.linhas if linha_plano.item.tipo == ITEM_FONTE}
+
+
+def _escrever_linha_fonte(ws_dre, fontes, linha_plano, plano, intervalos, agregados, data_inicial, modo):
+    item = linha_plano.item
+    linha = linha_plano.linha
+    if not fontes.disponivel(item.fonte):
+        logger.warning(f"⚠ Aviso: Aba '{item.fonte}' não encontrada. {item.rotulo.strip()} permanecerão zerados.")
+        for i in range(plano.num_colunas):
+            ws_dre.cell(row=linha, column=COLUNA_INICIAL + i).value = 0
+        return
+
+    serie = _serie_linha_fonte(fontes, item, agregados, data_inicial, plano.num_colunas)
+    modelo = '=' + item.sinal + FORMULAS_FONTES[item.fonte]
+    linha_categoria = linha if item.categoria is not None else None
+    for i, col_letra in enumerate(plano.letras):
+        formula = modelo.format(col=col_letra, linha=linha, **intervalos[item.fonte])
+        consulta = _consulta_agregada(agregados, item.fonte, col_letra, linha_categoria, item.sinal)
+        _escrever_celula_fonte(ws_dre.cell(row=linha, column=COLUNA_INICIAL + i), formula, serie[i], modo,
+                               consulta)
+
+
+def construir_estrutura_dre(fontes, ws_dre, num_colunas=12, agregados=None, data_inicial=None,
+                            modo='formulas', plano=None, config=None):
+    """
+    Escreve as linhas da DRE a partir do plano compilado do layout (ver
+    layout.py). Nos modos 'agregado', 'valores' e 'hibrido' as linhas
+    alimentadas pelas abas fontes usam `agregados` (ver agregacao.py); as
+    linhas derivadas (margens, totais, impostos) continuam como fórmulas.
+    Sem `plano`, o layout é compilado com os parâmetros de `config`.
+    """
+    if modo not in MODOS_DRE:
+        raise ValueError(f"Modo da DRE inválido: {modo}. Use um de: {', '.join(MODOS_DRE)}")
+    if modo != 'formulas' and agregados is None:
+        raise ValueError(f"O modo '{modo}' requer os valores agregados das abas fontes")
+    if plano is None:
+        plano = compilar_plano_dre(num_colunas, config)
+
+    intervalos = _intervalos_fontes(fontes)
+    for linha_plano in plano.linhas:
+        item = linha_plano.item
+        linha = linha_plano.linha
+        if item.rotulo is not None:
+            ws_dre.cell(row=linha, column=item.coluna_rotulo).value = item.rotulo
+        if linha_plano.formulas is not None:
+            for i, formula in enumerate(linha_plano.formulas):
+                ws_dre.cell(row=linha, column=COLUNA_INICIAL + i).value = formula
+        elif item.tipo == ITEM_FONTE:
+            _escrever_linha_fonte(ws_dre, fontes, linha_plano, plano, intervalos, agregados, data_inicial, modo)
+
+    _configurar_contorno(ws_dre, plano)
+    return plano
+
+
+def _configurar_contorno(ws_dre, plano):
+    for linha, nivel in plano.linhas_contorno():
+        ws_dre.row_dimensions[linha].outline_level = nivel
+    for linha in plano.linhas_recolhidas():
+        ws_dre.row_dimensions[linha].collapsed = True
     ws_dre.sheet_properties.outline_summary_below = True
 
-    linha = 43
-    ws_dre.cell(row=linha, column=2).value = 'Prejuizo Acumulado *'
-    linha = 44
-    ws_dre.cell(row=linha, column=3).value = 'Inicio'
-    ws_dre.cell(row=linha, column=4).value = 0
-    for i in range(1, num_colunas):
-        col = 4 + i
-        col_anterior = get_column_letter(col - 1)
-        formula = f'={col_anterior}47'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 45
-    ws_dre.cell(row=linha, column=3).value = 'Saldo Adquirido'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=-IF({col_letra}40<0,-{col_letra}40,0)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 46
-    ws_dre.cell(row=linha, column=3).value = 'Saldo Utilizado'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=IF({col_letra}$40>0, MIN({col_letra}$40*30%, -{col_letra}$44), 0)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 47
-    ws_dre.cell(row=linha, column=3).value = 'Final'
-    for i in range(num_colunas):
-        col = 4 + i
-        formula = f'=SUM({get_column_letter(col)}44:{get_column_letter(col)}46)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 49
-    ws_dre.cell(row=linha, column=2).value = 'Base de calculo '
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=IF({col_letra}40<0,0,{col_letra}40-{col_letra}46)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 51
-    ws_dre.cell(row=linha, column=2).value = f'Impostos (-)'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        taxa_decimal = parametros.taxa_imposto / 100
-        formula = f'=-{col_letra}49*{taxa_decimal}'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 52
-    ws_dre.cell(row=linha, column=2).value = 'Taxa Efetiva de Imposto %'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=ABS({col_letra}51)/{col_letra}35'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-    linha = 54
-    ws_dre.cell(row=linha, column=2).value = 'Lucro (prejuízo) líquido'
-    for i in range(num_colunas):
-        col = 4 + i
-        col_letra = get_column_letter(col)
-        formula = f'=SUM({col_letra}51,{col_letra}40)'
-        ws_dre.cell(row=linha, column=col).value = formula
-
-def calcular_waterfall_depreciacao(workbook, data_inicial, num_meses):
+
+def _escrever_series(ws_dre, plano, series, chaves):
+    for chave in chaves:
+        linha = plano.linha(chave)
+        for i, valor in enumerate(series[chave].tolist()):
+            ws_dre.cell(row=linha, column=COLUNA_INICIAL + i).value = valor
+
+
+def construir_dre_calculada(ws_dre, plano, series):
+    """
+    Escreve as linhas da DRE com os valores de `series` ({chave: array de
+    valores mensais}) nas linhas dessas chaves e as fórmulas do plano nas
+    demais. Usada na consolidação, cujo arquivo não tem abas fontes nem a
+    aba Investimentos.
+    """
+    for linha_plano in plano.linhas:
+        item = linha_plano.item
+        if item.rotulo is not None:
+            ws_dre.cell(row=linha_plano.linha, column=item.coluna_rotulo).value = item.rotulo
+        if linha_plano.formulas is not None and item.chave not in series:
+            for i, formula in enumerate(linha_plano.formulas):
+                ws_dre.cell(row=linha_plano.linha, column=COLUNA_INICIAL + i).value = formula
+    _escrever_series(ws_dre, plano, series, [chave for chave in plano.por_chave if chave in series])
+    _configurar_contorno(ws_dre, plano)
+
+
+def escrever_compensacao_prejuizo(ws_dre, plano, tabela, config):
+    """
+    Substitui as fórmulas encadeadas da compensação de prejuízo e do imposto
+    (impostos.LINHAS_PREJUIZO) por valores calculados de uma só vez a partir
+    do EBT da DRE calculada (avaliacao.TabelaDRE), com o limite e a taxa de
+    `config`. Devolve as séries escritas, por chave.
+    """
+    ebt = tabela.como_array()[tabela.chaves.index('ebt')]
+    if not np.isfinite(ebt).all():
+        raise ValueError("O EBT da DRE tem valores não numéricos: use modo_prejuizo = 'formulas'")
+    series = compensar_prejuizo(ebt, config.limite_compensacao_prejuizo / 100, config.taxa_imposto / 100)
+    _escrever_series(ws_dre, plano, series, LINHAS_PREJUIZO)
+    return series
+
+
+NOME_EXTENSAO_WATERFALL = '_WaterfallDRE'
+
+
+def extensao_waterfall_anterior(workbook, aba='Investimentos'):
+    """
+    Região (min_col, min_row, max_col, max_row) ocupada pelo waterfall da
+    última execução, lida do nome definido oculto _WaterfallDRE, ou None.
+    """
+    definido = workbook.defined_names.get(NOME_EXTENSAO_WATERFALL)
+    if definido is None:
+        return None
+    for nome_aba, intervalo in definido.destinations:
+        if nome_aba == aba:
+            return range_boundaries(intervalo)
+    return None
+
+
+def registrar_extensao_waterfall(workbook, aba, regiao):
+    """Grava a região ocupada pelo waterfall no nome definido _WaterfallDRE."""
+    min_col, min_row, max_col, max_row = regiao
+    intervalo = absolute_coordinate(
+        f'{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}')
+    workbook.defined_names[NOME_EXTENSAO_WATERFALL] = DefinedName(
+        NOME_EXTENSAO_WATERFALL, attr_text=f'{quote_sheetname(aba)}!{intervalo}', hidden=True)
+
+
+def limpar_regiao(ws, regiao):
+    """Apaga valores e restaura fonte e preenchimento padrão de uma região."""
+    min_col, min_row, max_col, max_row = regiao
+    fonte_padrao = Font(bold=False, color='000000')
+    fill_branco = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
+    for row in range(min_row, max_row + 1):
+        for column in range(min_col, max_col + 1):
+            try:
+                cell = ws.cell(row=row, column=column)
+                cell.font = fonte_padrao
+                cell.fill = fill_branco
+                cell.value = None
+            except AttributeError:
+                continue  # Proteção extra (células mescladas)
+
+
+def calcular_waterfall_depreciacao(workbook, fontes, data_inicial, num_meses, modo=None, config=None):
     """
     Calcula o waterfall de depreciação (D&A) APENAS para o período da DRE.
     Depreciação começa no MÊS SEGUINTE após o investimento ser lançado.
     Usa EDATE como na DRE para garantir sincronização perfeita das datas.
-    Vida útil dos ativos vem de parametros.py
+    Vida útil dos ativos vem de `config` (padrão: parametros.py)
+    Os investimentos são lidos dos buffers da ingestão; o workbook só é
+    usado para escrever o waterfall.
+
+    A depreciação é calculada como uma matriz ativos × meses (ver
+    depreciacao.py) e escrita conforme `modo` (padrão:
+    config.modo_depreciacao): 'valores', 'resumo' (apenas o TOTAL D&A)
+    ou 'auditoria' (fórmulas por ativo e mês).
+
+    Devolve os investimentos lidos (depreciacao.Investimentos), ou None se
+    não houver a aba Investimentos.
     """
-    if 'Investimentos' not in workbook.sheetnames:
-        print("⚠ Aviso: Aba 'Investimentos' não encontrada. Ignorando cálculo de D&A.")
+    if config is None:
+        config = configuracao_padrao()
+    if modo is None:
+        modo = config.modo_depreciacao
+    if modo not in MODOS_DEPRECIACAO:
+        raise ValueError(f"Modo de depreciação inválido: {modo}. Use um de: {', '.join(MODOS_DEPRECIACAO)}")
+
+    if 'Investimentos' not in fontes:
+        logger.warning("⚠ Aviso: Aba 'Investimentos' não encontrada. Ignorando cálculo de D&A.")
         return
 
     ws_inv = workbook['Investimentos']
+    aba_inv = fontes['Investimentos']
+
+    # Usar vida_util_ativos da configuração
+    investimentos = ler_investimentos(aba_inv, config.vida_util_ativos, config.vida_util_padrao)
 
-    # Usar vida_util_ativos de parametros.py
-    investments = []
-    row = 2
-    while ws_inv.cell(row=row, column=1).value is not None:
-        date = ws_inv.cell(row=row, column=1).value
-        desc = ws_inv.cell(row=row, column=2).value
-        value = ws_inv.cell(row=row, column=3).value
-
-        if isinstance(date, datetime) and desc and value:
-            # Busca a vida útil em parametros, usa padrão se não encontrar
-            vida_util = parametros.vida_util_ativos.get(desc, parametros.vida_util_padrao)
-            investments.append({
-                'date': date,
-                'description': desc,
-                'value': value,
-                'vida_util': vida_util
-            })
-        row += 1
-
-    print(f"✓ {len(investments)} investimento(s) encontrado(s)")
+    logger.info(f"✓ {len(investimentos)} investimento(s) encontrado(s)")
 
     waterfall_start_col = 5  # Coluna E
     waterfall_start_row = 3
 
-    max_row = 1
-    for row in range(1, ws_inv.max_row + 1):
-        if (ws_inv.cell(row=row, column=1).value is not None or
-                ws_inv.cell(row=row, column=2).value is not None or
-                ws_inv.cell(row=row, column=3).value is not None):
-            max_row = row
-
-    for row in range(1, waterfall_start_row + max_row):
-        for column in range(waterfall_start_col, waterfall_start_col + 100):
-            try:
-                cell = ws_inv.cell(row=row, column=column)
-                cell.font = Font(bold=False, color='000000')
-                cell.fill = PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-                cell.value = None
-            except AttributeError:
-                continue  # Proteção extra
+    # Limpa apenas a região usada pelo waterfall da execução anterior
+    regiao = extensao_waterfall_anterior(workbook, ws_inv.title)
+    if regiao is None:
+        # Arquivo sem o marcador (ex.: gerado por versões anteriores): limpa
+        # a região que essas versões usavam, limitada às dimensões da aba
+        max_row = max(aba_inv.ultima_linha, 1)
+        regiao = (waterfall_start_col, 1,
+                  min(waterfall_start_col + 99, ws_inv.max_column),
+                  min(waterfall_start_row + max_row - 1, ws_inv.max_row))
+    limpar_regiao(ws_inv, regiao)
 
     ws_inv.cell(row=waterfall_start_row, column=waterfall_start_col).value = 'WATERFALL DE DEPRECIAÇÃO'
     ws_inv.cell(row=waterfall_start_row, column=waterfall_start_col).font = Font(size=12, bold=True)
@@ -634,7 +764,6 @@ def calcular_waterfall_depreciacao(workbook, data_inicial, num_meses):
 
     # Replicar com EDATE como na DRE
     for i in range(1, num_meses):
-        col_letra_atual = get_column_letter(col_primeira_data + i)
         col_letra_anterior = get_column_letter(col_primeira_data + i - 1)
 
         cell = ws_inv.cell(row=waterfall_header_row, column=col_primeira_data + i)
@@ -643,68 +772,65 @@ def calcular_waterfall_depreciacao(workbook, data_inicial, num_meses):
         cell.alignment = Alignment(horizontal='center')
 
     waterfall_data_start_row = waterfall_header_row + 1
-    asset_counter = 1
 
-    for inv_idx, inv in enumerate(investments):
+    date_base_mes = indice_mes(date_base)
+    matriz = matriz_depreciacao(investimentos, date_base_mes, num_meses)
+    depreciacao_mensal = investimentos.depreciacao_mensal.tolist()
+
+    col_ativo = waterfall_start_col
+    col_desc = waterfall_start_col + 1
+    col_valor = waterfall_start_col + 2
+    col_vida_util = waterfall_start_col + 3
+    col_deprec_mensal = waterfall_start_col + 4
+    col_valor_letra = get_column_letter(col_valor)
+    col_vida_util_letra = get_column_letter(col_vida_util)
+    col_deprec_letra = get_column_letter(col_deprec_mensal)
+    letras_meses = [get_column_letter(col_primeira_data + i) for i in range(num_meses)]
+    meses_inicio = investimentos.meses_inicio.tolist()
+    meses_fim = investimentos.meses_fim.tolist()
+
+    for inv_idx in range(len(investimentos)):
         row_num = waterfall_data_start_row + inv_idx
 
-        col_ativo = waterfall_start_col
-        col_desc = waterfall_start_col + 1
-        col_valor = waterfall_start_col + 2
-        col_vida_util = waterfall_start_col + 3
-        col_deprec_mensal = waterfall_start_col + 4
-
-        ws_inv.cell(row=row_num, column=col_ativo).value = asset_counter
-        ws_inv.cell(row=row_num, column=col_desc).value = inv['description']
-        ws_inv.cell(row=row_num, column=col_valor).value = inv['value']
+        ws_inv.cell(row=row_num, column=col_ativo).value = inv_idx + 1
+        ws_inv.cell(row=row_num, column=col_desc).value = investimentos.descricoes[inv_idx]
+        ws_inv.cell(row=row_num, column=col_valor).value = investimentos.valores[inv_idx].item()
         ws_inv.cell(row=row_num, column=col_valor).number_format = '#,##0.00'
-        ws_inv.cell(row=row_num, column=col_vida_util).value = inv['vida_util']
-
-        col_valor_letra = get_column_letter(col_valor)
-        col_vida_util_letra = get_column_letter(col_vida_util)
-        formula_deprec = f'={col_valor_letra}{row_num}/({col_vida_util_letra}{row_num}*12)'
-        ws_inv.cell(row=row_num, column=col_deprec_mensal).value = formula_deprec
-        ws_inv.cell(row=row_num, column=col_deprec_mensal).number_format = '#,##0.00'
-
-        # Data de INÍCIO da DEPRECIAÇÃO = MÊS SEGUINTE ao investimento
-        data_investimento = inv['date'].replace(day=1)
-        mes_deprec_inicio = data_investimento.month + 1
-        ano_deprec_inicio = data_investimento.year
-        if mes_deprec_inicio > 12:
-            mes_deprec_inicio = 1
-            ano_deprec_inicio += 1
-        data_inicio_deprec = data_investimento.replace(year=ano_deprec_inicio, month=mes_deprec_inicio)
-
-        # Data final da depreciação (vida útil * 12 meses depois do início)
-        n_meses_total = inv['vida_util'] * 12
-
-        mes_final = data_inicio_deprec.month + n_meses_total
-        ano_final = data_inicio_deprec.year + (mes_final - 1) // 12
-        mes_final = ((mes_final - 1) % 12) + 1
-        data_fim_deprec = data_inicio_deprec.replace(year=ano_final, month=mes_final)
-
-        # Preencher depreciação por mês - APENAS para o período da DRE
-        for col_idx in range(num_meses):
-            col = col_primeira_data + col_idx
-            col_letra = get_column_letter(col)
-
-            col_deprec_letra = get_column_letter(col_deprec_mensal)
-
-            # Fórmula: se data da coluna >= data inicio E < data fim, então deprecia
-            formula = (
+        vida_util = investimentos.vidas_uteis[inv_idx].item()
+        ws_inv.cell(row=row_num, column=col_vida_util).value = int(vida_util) if vida_util.is_integer() else vida_util
+
+        cell = ws_inv.cell(row=row_num, column=col_deprec_mensal)
+        if modo == 'auditoria':
+            cell.value = f'={col_valor_letra}{row_num}/({col_vida_util_letra}{row_num}*12)'
+        else:
+            cell.value = depreciacao_mensal[inv_idx]
+        cell.number_format = '#,##0.00'
+
+        if modo == 'resumo':
+            continue
+
+        if modo == 'auditoria':
+            # Data de INÍCIO da DEPRECIAÇÃO = MÊS SEGUINTE ao investimento;
+            # a depreciação termina vida útil * 12 meses depois do início
+            data_inicio_deprec = mes_do_indice(meses_inicio[inv_idx])
+            data_fim_deprec = mes_do_indice(int(meses_fim[inv_idx]))
+            linha_valores = [
                 f'=IF(AND({col_letra}{waterfall_header_row}>='
                 f'DATE({data_inicio_deprec.year},{data_inicio_deprec.month},1),'
                 f'{col_letra}{waterfall_header_row}<'
                 f'DATE({data_fim_deprec.year},{data_fim_deprec.month},1)),'
                 f'{col_deprec_letra}{row_num},0)'
-            )
-
-            ws_inv.cell(row=row_num, column=col).value = formula
-            ws_inv.cell(row=row_num, column=col).number_format = '#,##0.00'
+                for col_letra in letras_meses
+            ]
+        else:
+            linha_valores = matriz[inv_idx].tolist()
 
-        asset_counter += 1
+        for col_idx, valor in enumerate(linha_valores):
+            cell = ws_inv.cell(row=row_num, column=col_primeira_data + col_idx)
+            cell.value = valor
+            cell.number_format = '#,##0.00'
 
-    total_row = waterfall_data_start_row + len(investments) + 1
+    total_row = waterfall_data_start_row + len(investimentos) + 1
     col_total = waterfall_start_col
 
     ws_inv.cell(row=1, column=col_total).value = 'TOTAL D&A'
@@ -712,23 +838,25 @@ def calcular_waterfall_depreciacao(workbook, data_inicial, num_meses):
     ws_inv.cell(row=1, column=col_total).fill = PatternFill(start_color='000000', end_color='000000',
                                                                     fill_type='solid')
 
-    for col_idx in range(num_meses):
-        col = col_primeira_data + col_idx
-        col_letra = get_column_letter(col)
-
-        primeira_linha = waterfall_data_start_row
-        ultima_linha = total_row - 1
-
-        formula = f'=SUM({col_letra}{primeira_linha}:{col_letra}{ultima_linha})'
-        cell = ws_inv.cell(row=1, column=col)
-        cell.value = formula
+    # TOTAL D&A = soma das colunas da matriz (ou fórmulas SUM no modo auditoria)
+    totais = matriz.sum(axis=0).tolist()
+    for col_idx, col_letra in enumerate(letras_meses):
+        cell = ws_inv.cell(row=1, column=col_primeira_data + col_idx)
+        if modo == 'auditoria':
+            cell.value = f'=SUM({col_letra}{waterfall_data_start_row}:{col_letra}{total_row - 1})'
+        else:
+            cell.value = totais[col_idx]
         cell.font = Font(bold=True, color='FFFFFF')
         cell.fill = PatternFill(start_color='000000', end_color='000000', fill_type='solid')
         cell.number_format = '#,##0.00'
 
-    print(f"✓ Waterfall de depreciação calculado com sucesso")
-    print(f"  - Total de ativos: {len(investments)}")
-    print(f"  - Vida útil configurada em parametros.py")
+    registrar_extensao_waterfall(workbook, ws_inv.title, (waterfall_start_col, 1, col_primeira_data + num_meses - 1,
+                                                          max(waterfall_header_row, total_row - 2)))
+
+    logger.info(f"✓ Waterfall de depreciação calculado com sucesso")
+    logger.info(f"  - Total de ativos: {len(investimentos)}")
+    logger.info(f"  - Vida útil configurada em {os.path.basename(config.origem or 'parametros.py')}")
+    return investimentos
 
 def converter_periodo_especifico(inicio_str, final_str):
     try:
@@ -749,78 +877,705 @@ def converter_periodo_especifico(inicio_str, final_str):
         raise ValueError(f"Erro ao converter período: {e}. Formato esperado: MM/YY (ex: '01/24')")
 
 
-def automatizar_dre(caminho_arquivo='entrada.xlsx', data_inicial=None, num_meses=None):
+class ResultadoDRE:
+    """
+    Resultado estruturado da geração da DRE.
+
+    `conteudo` traz os bytes do workbook gerado quando nenhum destino foi
+    informado; caso contrário fica None e `destino` indica onde foi salvo.
+    `tabela` traz os valores calculados da DRE (avaliacao.TabelaDRE) quando
+    a geração calculou a DRE em Python (valores em cache das fórmulas ou
+    compensação de prejuízo em valores).
+    """
+
+    __slots__ = ('data_inicial', 'num_meses', 'modo', 'datas_invalidas', 'conteudo', 'destino', 'em_cache',
+                 'tabela')
+
+    def __init__(self, data_inicial, num_meses, modo, datas_invalidas, conteudo=None, destino=None,
+                 em_cache=False, tabela=None):
+        self.data_inicial = data_inicial
+        self.num_meses = num_meses
+        self.modo = modo
+        self.datas_invalidas = datas_invalidas
+        self.conteudo = conteudo
+        self.destino = destino
+        self.em_cache = em_cache
+        self.tabela = tabela
+
+
+def _abrir_entrada(entrada):
+    """Aceita um caminho ou o conteúdo do arquivo em bytes."""
+    if isinstance(entrada, (bytes, bytearray)):
+        return io.BytesIO(entrada)
+    return entrada
+
+
+def _arquivo_temporario(destino):
+    """Caminho livre no diretório do destino, para gravar o arquivo antes de substituí-lo."""
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(destino)))
+    os.close(descritor)
+    return caminho
+
+
+def _mesmo_arquivo(entrada, destino):
+    if not isinstance(entrada, (str, os.PathLike)) or not isinstance(destino, (str, os.PathLike)):
+        return False
+    if os.path.abspath(entrada) == os.path.abspath(destino):
+        return True
     try:
-        abas_necessarias = ['Vendas', 'Custo_Despesas', 'Folha', 'Investimentos', 'Financiamento']
+        # Links e caminhos diferentes para o mesmo arquivo
+        return os.path.samefile(entrada, destino)
+    except OSError:
+        return False
 
-        print("=" * 80)
-        print("AUTOMATIZAÇÃO DA ABA DRE")
-        print("=" * 80)
 
-        print(f"\nCarregando arquivo: {caminho_arquivo}")
-        wb = openpyxl.load_workbook(caminho_arquivo)
-        print(f"✓ Arquivo carregado com sucesso.")
+def _impressao_execucao(config, data_inicial, num_meses, modo, streaming, hashes_externas=None,
+                        valores_em_cache=False):
+    """
+    Impressão digital dos parâmetros que influenciam o arquivo gerado,
+    incluindo o conteúdo das abas lidas de arquivos externos.
+    """
+    return impressao_parametros({
+        'taxa_imposto': config.taxa_imposto,
+        'limite_compensacao_prejuizo': config.limite_compensacao_prejuizo,
+        'modo_prejuizo': config.modo_prejuizo,
+        'auto_detectar_periodo': config.auto_detectar_periodo,
+        'periodo_inicio': config.periodo_inicio,
+        'periodo_final': config.periodo_final,
+        'vida_util_ativos': dict(config.vida_util_ativos),
+        'vida_util_padrao': config.vida_util_padrao,
+        'modo_depreciacao': config.modo_depreciacao,
+        'data_inicial': data_inicial,
+        'num_meses': num_meses,
+        'modo': modo,
+        'streaming': streaming,
+        'valores_em_cache': valores_em_cache,
+        'externas': hashes_externas or {},
+        'csv': _opcoes_csv(config) if hashes_externas else None,
+    })
+
+
+def abrir_cache_padrao(config=None, ativo=None):
+    """
+    Abre o cache configurado em `config` (padrão: parametros.py), ou None se
+    desativado ou indisponível. `ativo` (padrão: config.usar_cache) liga ou
+    desliga o cache nesta execução.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    if not (config.usar_cache if ativo is None else ativo):
+        return None
+    try:
+        return CacheDRE(config.caminho_cache or caminho_cache_padrao(), config.tamanho_maximo_cache_mb * 1024 * 1024)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"⚠ Aviso: Cache indisponível ({e}). Continuando sem cache.")
+        return None
 
-        datas_invalidas = []
 
+def processar_dre(entrada, destino=None, data_inicial=None, num_meses=None, modo=None, streaming=None,
+                  cache=None, incremental=False, externas=None, valores_em_cache=None, config=None):
+    """
+    Gera a DRE e o waterfall de depreciação sem efeitos colaterais
+    interativos: não abre arquivos, não imprime (mensagens vão para o logger
+    'dre') e só grava em disco se `destino` for informado.
+
+    `entrada` é o caminho do arquivo ou seu conteúdo em bytes. `destino` pode
+    ser um caminho ou um objeto de arquivo; sem destino, os bytes do workbook
+    gerado são devolvidos em ResultadoDRE.conteudo. Erros são propagados.
+
+    Com `streaming=True`, o workbook de entrada não é carregado em modo de
+    escrita: as abas geradas são montadas em memória e o arquivo de saída é
+    gravado em modo write_only, copiando as abas fontes (ver saida.py). Nesse
+    modo o destino não pode ser o próprio arquivo de entrada. Por padrão
+    (None), o streaming é usado sempre que o destino não é a própria entrada;
+    só a gravação sobre a entrada carrega o workbook em modo de escrita.
+
+    Com um `cache` (ver cache.py) e um destino em disco, a execução é
+    dispensada quando nada mudou desde a última geração desse destino, e as
+    abas fontes sem alterações não são varridas nem agregadas novamente.
+
+    Com `incremental=True` (requer `cache` e `entrada` como caminho), só as
+    linhas de Vendas e Custo_Despesas posteriores à última linha já
+    processada são lidas, varridas e somadas aos agregados guardados; se
+    alguma linha processada mudou, a aba é processada por completo (ver
+    incremental.py). Nesse modo a saída é gravada em streaming também sobre
+    a própria entrada, por meio de um arquivo temporário.
+
+    `config` (configuracao.Configuracao, padrão: parametros.py) traz os
+    parâmetros da geração; os padrões abaixo vêm dela.
+
+    `externas` ({aba: caminho}, padrão config.fontes_externas) lê
+    Vendas, Custo_Despesas ou Folha de arquivos CSV/Parquet em blocos (ver
+    ingestao.ler_aba_externa). Como as fórmulas da DRE só podem referenciar
+    abas do workbook, os modos 'formulas' e 'hibrido' passam a 'valores'.
+
+    Com `valores_em_cache` (padrão: config.gravar_valores_em_cache), as
+    células da DRE são calculadas em Python (ver avaliacao.py) e gravadas
+    como valor em cache das fórmulas, para leitores que não recalculam o
+    arquivo; a tabela calculada fica em ResultadoDRE.tabela.
+
+    Com config.modo_prejuizo = 'valores', a compensação de prejuízo e o
+    imposto são calculados de uma só vez para todos os meses a partir do EBT
+    da DRE calculada (ver impostos.py) e gravados como valores.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    modo = modo or config.modo_dre
+    if valores_em_cache is None:
+        valores_em_cache = config.gravar_valores_em_cache
+    # A DRE é calculada em Python para os valores em cache e para a
+    # compensação de prejuízo em valores (que parte do EBT calculado)
+    calcular_dre = valores_em_cache or config.modo_prejuizo == 'valores'
+    externas = dict(config.fontes_externas if externas is None else externas)
+    validar_externas(externas)
+    if externas and modo in ('formulas', 'hibrido'):
+        logger.warning(f"⚠ Aviso: As fórmulas da DRE não podem referenciar arquivos externos "
+                       f"({', '.join(externas)}). Usando o modo 'valores'.")
+        modo = 'valores'
+    if incremental and (cache is None or not isinstance(entrada, (str, os.PathLike))):
+        raise ValueError("O modo incremental requer o cache ativo e o caminho do arquivo de entrada.")
+    sobre_entrada = _mesmo_arquivo(entrada, destino)
+    if streaming is None:
+        # O modo incremental grava sempre em streaming, que mantém o XML das
+        # abas fontes (e o hash das linhas processadas); sobre a entrada, o
+        # arquivo é gerado ao lado e substitui a entrada no fim
+        streaming = incremental or not sobre_entrada
+    elif streaming and sobre_entrada and not incremental:
+        raise ValueError("O modo streaming grava um novo arquivo: informe uma saída diferente da entrada.")
+
+    hash_entrada = impressao = None
+    hashes_externas = None
+    if cache is not None:
+        with medir('cache') as span:
+            hashes_externas = {aba: hash_arquivo(caminho) for aba, caminho in externas.items()}
+            anterior = None
+            if isinstance(destino, (str, os.PathLike)):
+                hash_entrada = hash_arquivo(entrada)
+                impressao = _impressao_execucao(config, data_inicial, num_meses, modo, streaming, hashes_externas,
+                                                valores_em_cache)
+                anterior = cache.buscar_execucao(hash_entrada, impressao, destino)
+            span.contar(acertos=int(anterior is not None))
+        if anterior is not None:
+            logger.info(f"\n✓ Nenhuma alteração desde a última execução (cache). Arquivo mantido: {destino}")
+            return ResultadoDRE(anterior.data_inicial, anterior.num_meses, anterior.modo,
+                                anterior.datas_invalidas, destino=destino, em_cache=True)
+
+    logger.info(f"\nLendo abas fontes...")
+    with medir('leitura') as span:
+        estados = None
+        if incremental:
+            fontes, estados = ler_fontes_incremental(entrada, cache, externas)
+        else:
+            fontes = ler_fontes(_abrir_entrada(entrada), externas=externas)
+        span.contar(linhas=sum(len(aba) for aba in fontes.abas.values()))
+    logger.info(f"✓ Abas fontes lidas com sucesso.")
+
+    logger.info(f"\nVarrendo datas das abas fontes...")
+    with medir('varredura') as span:
+        agregados_cache = None
+        novos_estados = {}
+        if cache is not None:
+            varredura, agregados_cache, novos_estados = varrer_e_agregar_com_cache(fontes, cache, estados)
+        else:
+            varredura = varrer_datas(fontes)
+        if externas:
+            if agregados_cache is None:
+                agregados_cache = agregar_fontes(fontes, varredura)
+            varrer_e_agregar_externas(fontes, varredura, agregados_cache, config, cache, hashes_externas)
+        datas_invalidas = varredura.datas_invalidas
+        span.contar(datas_validas=varredura.datas_validas, datas_invalidas=len(datas_invalidas))
+    logger.info(f"✓ {varredura.datas_validas} data(s) válida(s) encontrada(s)")
+
+    with medir('periodo'):
         if data_inicial is None or num_meses is None:
-            if parametros.auto_detectar_periodo:
-                print(f"\nDeterminando período automaticamente...")
-                data_inicial, num_meses, datas_invalidas = determinar_periodo_dre(wb)
+            if config.auto_detectar_periodo:
+                logger.info(f"\nDeterminando período automaticamente...")
+                data_inicial, num_meses = determinar_periodo_dre(varredura)
             else:
-                print(f"\nUsando período específico dos parâmetros...")
-                print(f" Período: {parametros.periodo_inicio} a {parametros.periodo_final}")
+                logger.info(f"\nUsando período específico dos parâmetros...")
+                logger.info(f" Período: {config.periodo_inicio} a {config.periodo_final}")
                 data_inicial, num_meses = converter_periodo_especifico(
-                    parametros.periodo_inicio,
-                    parametros.periodo_final
+                    config.periodo_inicio,
+                    config.periodo_final
                 )
 
-        print(f"✓ Período configurado: {data_inicial} ({num_meses} meses)")
+    logger.info(f"✓ Período configurado: {data_inicial} ({num_meses} meses)")
 
-        print(f"\nVerificando datas inválidas nas planilhas...")
+    logger.info(f"\nVerificando abas fontes...")
+    verificar_abas_fontes(fontes, ABAS_NECESSARIAS)
 
-        _, _, datas_invalidas = determinar_periodo_dre(wb)
-
-        print(f"\nVerificando abas fontes...")
-        verificar_abas_fontes(wb, abas_necessarias)
-
-        print(f"\nCriando aba DRE...")
+    with medir('carga'):
+        if streaming:
+            wb = WorkbookEmMemoria(fontes.sheetnames, fontes.nomes_definidos, fontes.dimensoes)
+        else:
+            logger.info(f"\nCarregando arquivo para escrita...")
+            wb = openpyxl.load_workbook(_abrir_entrada(entrada))
+            logger.info(f"✓ Arquivo carregado com sucesso.")
+
+    with medir('agregacao') as span:
+        agregados = None
+        if modo != 'formulas' or calcular_dre:
+            logger.info(f"\nAgregando abas fontes por mês...")
+            agregados = agregados_cache if agregados_cache is not None else agregar_fontes(fontes, varredura)
+            logger.info(f"✓ Valores agregados para o modo '{modo}'")
+            span.contar(agregados=len(agregados))
+
+    with medir('dre') as span:
+        logger.info(f"\nCriando aba DRE...")
         ws_dre = criar_aba_dre_se_nao_existir(wb)
 
-        print(f"\nConfigurando cabeçalho...")
+        logger.info(f"\nConfigurando cabeçalho...")
         configurar_cabecalho_dre(ws_dre, data_inicial, num_meses)
 
-        print(f"\nConstruindo estrutura da DRE...")
-        construir_estrutura_dre(wb, ws_dre, num_meses)
+        if modo == 'agregado':
+            criar_aba_agregada(wb, agregados)
+        else:
+            remover_aba_agregada(wb)
+
+        logger.info(f"\nConstruindo estrutura da DRE...")
+        plano = compilar_plano_dre(num_meses, config)
+        construir_estrutura_dre(fontes, ws_dre, num_meses, agregados, data_inicial, modo, plano)
+        span.contar(celulas=len(plano.linhas) * num_meses)
+
+    logger.info(f"\nCalculando waterfall de depreciação...")
+    with medir('waterfall') as span:
+        investimentos = calcular_waterfall_depreciacao(wb, fontes, data_inicial, num_meses, config=config)
+        if investimentos is not None:
+            span.contar(ativos=len(investimentos))
+
+    tabela = None
+    if calcular_dre:
+        logger.info(f"\nCalculando os valores da DRE...")
+        with medir('avaliacao') as span:
+            totais = None
+            if investimentos is not None:
+                mes_inicial = indice_mes(datetime.strptime(data_inicial, '%Y-%m-%d'))
+                totais = total_depreciacao(investimentos, mes_inicial, num_meses)
+            tabela = avaliar_dre(plano, data_inicial, series_fontes_dre(fontes, plano, agregados, data_inicial),
+                                 totais)
+            span.contar(celulas=len(tabela.celulas))
+        logger.info(f"✓ {len(tabela.celulas)} célula(s) calculada(s)")
+
+    if config.modo_prejuizo == 'valores':
+        logger.info(f"\nCalculando a compensação de prejuízo...")
+        with medir('prejuizo') as span:
+            escrever_compensacao_prejuizo(ws_dre, plano, tabela, config)
+            span.contar(celulas=len(LINHAS_PREJUIZO) * num_meses)
+        logger.info(f"✓ Compensação de prejuízo e imposto gravados como valores")
+
+    logger.info(f"\nAplicando formatação automática...")
+    with medir('formatacao') as span:
+        aplicar_formatacao_dre(ws_dre, num_meses, plano)
+        span.contar(celulas=(plano.ultima_linha + 1) * (COLUNA_INICIAL + num_meses))
+
+    logger.info(f"\nAjustando freeze panes...")
+    ws_dre.freeze_panes = 'D4'
+
+    resultado = ResultadoDRE(data_inicial, num_meses, modo, datas_invalidas, destino=destino, tabela=tabela)
+    logger.info(f"\nSalvando arquivo...")
+    with medir('gravacao') as span:
+        # Com os valores em cache, o arquivo é montado em memória e
+        # reescrito antes de ir para o destino
+        buffer = io.BytesIO() if destino is None or valores_em_cache else None
+        saida = _arquivo_temporario(destino) if streaming and sobre_entrada else destino
+        try:
+            if streaming:
+                salvar_streaming(wb, _abrir_entrada(entrada), buffer or saida)
+            else:
+                wb.save(buffer or saida)
+            if valores_em_cache:
+                conteudo = gravar_valores_em_cache(buffer.getvalue(), ws_dre.title, tabela.valores_em_cache())
+                if destino is None:
+                    resultado.conteudo = conteudo
+                elif isinstance(saida, (str, os.PathLike)):
+                    with open(saida, 'wb') as arquivo:
+                        arquivo.write(conteudo)
+                else:
+                    saida.write(conteudo)
+                span.contar(bytes=len(conteudo))
+            elif buffer is not None:
+                resultado.conteudo = buffer.getvalue()
+                span.contar(bytes=len(resultado.conteudo))
+            elif isinstance(saida, (str, os.PathLike)):
+                span.contar(bytes=os.path.getsize(saida))
+            if saida is not destino:
+                os.replace(saida, destino)
+        finally:
+            if saida is not destino and os.path.exists(saida):
+                os.remove(saida)
+    if destino is None:
+        logger.info(f"✓ Workbook gerado em memória ({len(resultado.conteudo)} bytes)")
+    else:
+        logger.info(f"✓ Arquivo salvo com sucesso em: {destino}")
 
-        print(f"\nCalculando waterfall de depreciação...")
-        calcular_waterfall_depreciacao(wb, data_inicial, num_meses)
+    for aba, estado in novos_estados.items():
+        if estado is not None:
+            cache.guardar_estado(entrada, aba, estado)
+    if hash_entrada is not None:
+        cache.registrar_execucao(hash_entrada, impressao, destino, hash_arquivo(destino), resultado)
 
-        print(f"\nAplicando formatação automática...")
-        aplicar_formatacao_dre(ws_dre, num_meses)
+    return resultado
 
-        print(f"\nAjustando freeze panes...")
-        ws_dre.freeze_panes = 'D4'
 
-        print(f"\nSalvando arquivo...")
-        wb.save(caminho_arquivo)
+def gerar_dre(caminho_arquivo, data_inicial=None, num_meses=None, caminho_saida=None, streaming=None,
+              usar_cache=None, incremental=False, externas=None, metricas=None, metricas_memoria=None,
+              valores_em_cache=None, config=None):
+    """
+    Gera a DRE de um arquivo e salva em `caminho_saida` (por padrão, sobre o
+    próprio arquivo de entrada). Erros são propagados ao chamador.
+    `usar_cache` (padrão: config.usar_cache, ligado pelo modo incremental)
+    liga ou desliga o cache configurado em `config` (padrão: parametros.py);
+    `incremental` requer o cache. `externas`, `valores_em_cache` e `config`
+    seguem processar_dre.
+
+    Com `metricas` (padrão: config.caminho_metricas), o tempo, a CPU e
+    as contagens de cada fase são gravados nesse arquivo (ver
+    instrumentacao.py), mesmo se a geração falhar; `metricas_memoria` (padrão:
+    config.metricas_memoria) inclui o pico de memória de cada fase.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    destino = caminho_saida or caminho_arquivo
+    metricas = config.caminho_metricas if metricas is None else metricas
+    if metricas_memoria is None:
+        metricas_memoria = config.metricas_memoria
+    medicoes = None
+    if metricas:
+        medicoes = instrumentacao.ativar({'arquivo': os.path.basename(caminho_arquivo)}, metricas_memoria)
+    if usar_cache is None:
+        usar_cache = config.usar_cache or incremental
+    cache = abrir_cache_padrao(config, usar_cache)
+    try:
+        return processar_dre(caminho_arquivo, destino, data_inicial, num_meses, streaming=streaming, cache=cache,
+                             incremental=incremental, externas=externas, valores_em_cache=valores_em_cache,
+                             config=config)
+    finally:
+        if cache is not None:
+            cache.fechar()
+        if medicoes is not None:
+            instrumentacao.desativar()
+            medicoes.gravar(metricas)
+
+
+def periodo_configurado(varredura, config):
+    """Período da DRE (data inicial, número de meses): detectado na varredura ou dos parâmetros de `config`."""
+    with medir('periodo'):
+        if config.auto_detectar_periodo:
+            logger.info(f"\nDeterminando período automaticamente...")
+            data_inicial, num_meses = determinar_periodo_dre(varredura)
+        else:
+            logger.info(f"\nUsando período específico dos parâmetros...")
+            data_inicial, num_meses = converter_periodo_especifico(config.periodo_inicio,
+                                                                   config.periodo_final)
+    logger.info(f"✓ Período configurado: {data_inicial} ({num_meses} meses)")
+    return data_inicial, num_meses
+
 
-        print(f"✓ Arquivo salvo com sucesso em: {caminho_arquivo}")
+def agregar_entidade(caminho, config=None):
+    """
+    Lê, varre as datas e agrega o arquivo de uma entidade da consolidação
+    (ver consolidacao.py), com as vidas úteis de `config` (padrão:
+    parametros.py). Executada nos processos do pool.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    fontes = ler_fontes(caminho)
+    verificar_abas_fontes(fontes, ABAS_NECESSARIAS)
+    varredura = varrer_datas(fontes)
+    agregados = agregar_fontes(fontes, varredura)
+    for resumo in varredura.abas.values():
+        resumo.meses = None  # não é necessário depois da agregação
+    investimentos = ler_investimentos(fontes['Investimentos'], config.vida_util_ativos, config.vida_util_padrao)
+    return DadosEntidade(nome_entidade(caminho), caminho, varredura, agregados, investimentos)
+
+
+CARACTERES_INVALIDOS_ABA = re.compile(r'[\[\]:*?/\\]')
+
+
+def _titulo_aba_entidade(nome, usados):
+    """Título 'DRE <entidade>' válido no Excel (até 31 caracteres) e ainda não usado."""
+    base = CARACTERES_INVALIDOS_ABA.sub('_', f'DRE {nome}')[:31]
+    titulo = base
+    numero = 2
+    while titulo.lower() in usados:
+        sufixo = f' ({numero})'
+        titulo = base[:31 - len(sufixo)] + sufixo
+        numero += 1
+    usados.add(titulo.lower())
+    return titulo
+
+
+def consolidar_dre(caminhos, caminho_saida, por_entidade=False, workers=None, config=None):
+    """
+    Consolida as DREs das entidades de `caminhos` (um arquivo de entrada por
+    entidade) em um novo arquivo `caminho_saida`: a aba DRE traz a soma das
+    entidades e, com `por_entidade`, cada entidade tem a sua aba
+    'DRE <entidade>'. Os arquivos são lidos e agregados uma única vez, em
+    paralelo (ver consolidacao.py), e o período é a união dos períodos
+    detectados nas entidades.
+
+    As linhas alimentadas pelas abas fontes, o D&A e a compensação de
+    prejuízo são gravados como valores; as demais linhas, como fórmulas.
+    Os parâmetros vêm de `config` (padrão: parametros.py). Devolve um
+    ResultadoDRE, com as datas inválidas identificadas por entidade.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    logger.info(f"\nLendo e agregando {len(caminhos)} entidade(s)...")
+    with medir('leitura') as span:
+        entidades = agregar_entidades(caminhos, functools.partial(agregar_entidade, config=config), workers)
+        span.contar(entidades=len(entidades))
+    logger.info(f"✓ Entidades agregadas: {', '.join(entidade.nome for entidade in entidades)}")
+
+    varredura = VarreduraDatas({(entidade.nome, aba): resumo for entidade in entidades
+                                for aba, resumo in entidade.varredura.abas.items()})
+    datas_invalidas = [(f'{entidade.nome}: {aba}', linha, valor) for entidade in entidades
+                       for aba, linha, valor in entidade.varredura.datas_invalidas]
+
+    data_inicial, num_meses = periodo_configurado(varredura, config)
+
+    plano = compilar_plano_dre(num_meses, config)
+    logger.info(f"\nConsolidando as entidades...")
+    with medir('consolidacao') as span:
+        consolidacao = consolidar(entidades, plano, data_inicial,
+                                  indice_mes(datetime.strptime(data_inicial, '%Y-%m-%d')),
+                                  config.limite_compensacao_prejuizo / 100, config.taxa_imposto / 100)
+        span.contar(entidades=len(entidades))
+
+    with medir('dre') as span:
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        abas = [('DRE', 'DRE Consolidada', consolidacao.consolidada())]
+        if por_entidade:
+            usados = {'dre'}
+            for indice, nome in enumerate(consolidacao.nomes):
+                abas.append((_titulo_aba_entidade(nome, usados), f'DRE {nome}', consolidacao.entidade(indice)))
+        for titulo, cabecalho, series in abas:
+            ws_dre = wb.create_sheet(titulo)
+            configurar_cabecalho_dre(ws_dre, data_inicial, num_meses)
+            ws_dre['A1'] = cabecalho
+            construir_dre_calculada(ws_dre, plano, series)
+            aplicar_formatacao_dre(ws_dre, num_meses, plano)
+            ws_dre.freeze_panes = 'D4'
+        span.contar(abas=len(abas), celulas=len(abas) * len(plano.linhas) * num_meses)
+    logger.info(f"✓ {len(abas)} aba(s) DRE construída(s)")
+
+    logger.info(f"\nSalvando arquivo...")
+    with medir('gravacao'):
+        wb.save(caminho_saida)
+    logger.info(f"✓ Arquivo salvo com sucesso em: {caminho_saida}")
+    return ResultadoDRE(data_inicial, num_meses, 'valores', datas_invalidas, destino=caminho_saida)
+
+
+def parametros_cenarios(config):
+    """Parâmetros de `config` que os cenários podem alterar (ver cenarios.py)."""
+    return {
+        'taxa_imposto': config.taxa_imposto,
+        'limite_compensacao_prejuizo': config.limite_compensacao_prejuizo,
+        'vida_util_padrao': config.vida_util_padrao,
+        'vida_util_ativos': dict(config.vida_util_ativos),
+    }
+
+
+def escrever_comparacao_cenarios(ws, tabela, plano, data_inicial, num_meses):
+    """
+    Aba de comparação: uma linha por cenário, com o valor usado dos
+    parâmetros alterados em algum cenário e os totais do período das
+    LINHAS_CENARIO. A variação do
+    lucro líquido é em relação ao primeiro cenário (o Base da grade).
+    """
+    nomes = []
+    for cenario in tabela.cenarios:
+        nomes.extend(nome for nome in cenario.valores if nome not in nomes)
+    rotulos = [plano.por_chave[chave].item.rotulo.strip() for chave in LINHAS_CENARIO]
+
+    data_base = datetime.strptime(data_inicial, '%Y-%m-%d')
+    ws['A1'] = 'Cenários'
+    ws['A1'].font = Font(size=14, bold=True)
+    ws['A2'] = (f"Totais do período de {data_base.strftime('%m/%y')} "
+                f"({num_meses} meses), em relação ao cenário {tabela.cenarios[0].nome}")
+
+    linha_cabecalho = 4
+    cabecalho = ['Cenário'] + nomes + rotulos + ['Variação do lucro líquido']
+    for coluna, texto in enumerate(cabecalho, start=1):
+        cell = ws.cell(row=linha_cabecalho, column=coluna)
+        cell.value = texto
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
+        cell.alignment = Alignment(horizontal='center', wrap_text=True)
+
+    totais = [tabela.totais(chave).tolist() for chave in LINHAS_CENARIO]
+    lucro = totais[LINHAS_CENARIO.index('lucro_liquido')]
+    for indice, cenario in enumerate(tabela.cenarios):
+        linha = linha_cabecalho + 1 + indice
+        ws.cell(row=linha, column=1).value = cenario.nome
+        for coluna, nome in enumerate(nomes, start=2):
+            ws.cell(row=linha, column=coluna).value = tabela.valor(indice, nome)
+        valores = [total[indice] for total in totais] + [lucro[indice] - lucro[0]]
+        for coluna, valor in enumerate(valores, start=2 + len(nomes)):
+            cell = ws.cell(row=linha, column=coluna)
+            cell.value = valor
+            cell.number_format = FORMATO_MILHARES
+
+    ws.column_dimensions['A'].width = min(max([len(c.nome) for c in tabela.cenarios] + [10]) + 2, 60)
+    for coluna in range(2, len(cabecalho) + 1):
+        ws.column_dimensions[get_column_letter(coluna)].width = 16
+    ws.freeze_panes = ws.cell(row=linha_cabecalho + 1, column=2)
+
+
+def simular_cenarios(caminho_arquivo, cenarios, caminho_saida, config=None):
+    """
+    Avalia os `cenarios` (ver cenarios.py) sobre um arquivo de entrada lido
+    e agregado uma única vez, com a DRE base calculada com os parâmetros de
+    `config` (padrão: parametros.py), e grava a aba de comparação 'Cenarios'
+    em um novo arquivo `caminho_saida`. Devolve a TabelaCenarios. Valores
+    de cenário inválidos para a configuração levantam ValueError antes da
+    leitura.
+    """
+    if config is None:
+        config = configuracao_padrao()
+    validar_cenarios(cenarios, config)
+    logger.info(f"\nLendo e agregando {caminho_arquivo}...")
+    with medir('leitura'):
+        entidade = agregar_entidade(caminho_arquivo, config)
+    logger.info(f"✓ Abas fontes lidas e agregadas.")
+
+    data_inicial, num_meses = periodo_configurado(entidade.varredura, config)
+    plano = compilar_plano_dre(num_meses, config)
+
+    logger.info(f"\nAvaliando {len(cenarios)} cenário(s)...")
+    with medir('cenarios') as span:
+        base = base_cenarios(entidade, plano, data_inicial, indice_mes(datetime.strptime(data_inicial, '%Y-%m-%d')),
+                             parametros_cenarios(config))
+        tabela = avaliar_cenarios(base, cenarios)
+        span.contar(cenarios=len(cenarios))
+    logger.info(f"✓ {len(cenarios)} cenário(s) avaliado(s)")
+
+    logger.info(f"\nSalvando arquivo...")
+    with medir('gravacao'):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'Cenarios'
+        escrever_comparacao_cenarios(ws, tabela, plano, data_inicial, num_meses)
+        wb.save(caminho_saida)
+    logger.info(f"✓ Arquivo salvo com sucesso em: {caminho_saida}")
+    return tabela
+
+
+def configurar_log_console():
+    """Envia as mensagens do logger 'dre' para o console, como no modo interativo."""
+    if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def abrir_planilha(caminho_arquivo):
+    """Abre a planilha no aplicativo padrão, quando o sistema oferece suporte."""
+    if not hasattr(os, 'startfile'):
+        print(f"⚠ Aviso: Abertura automática não suportada neste sistema. Arquivo: {caminho_arquivo}")
+        return
+    try:
+        os.startfile(os.path.abspath(caminho_arquivo))
+        print(f"✓ Planilha aberta com sucesso.")
+    except OSError as e:
+        print(f"⚠ Aviso: Não foi possível abrir a planilha: {e}")
+
+
+def automatizar_cenarios(caminho_arquivo, variacoes, caminho_saida='cenarios.xlsx', abrir=True, config=None):
+    configurar_log_console()
+    try:
+        print("=" * 80)
+        print("COMPARAÇÃO DE CENÁRIOS")
+        print("=" * 80)
+        print(f"\nArquivo de entrada: {caminho_arquivo}")
+
+        tabela = simular_cenarios(caminho_arquivo, grade(variacoes), caminho_saida, config)
 
         print("\n" + "=" * 80)
-        print("DRE CONSTRUÍDA COM SUCESSO!")
+        print("CENÁRIOS AVALIADOS COM SUCESSO!")
         print("=" * 80)
+        lucros = tabela.totais('lucro_liquido')
+        melhor, pior = int(lucros.argmax()), int(lucros.argmin())
+        print(f"\nMaior lucro líquido: {tabela.cenarios[melhor].nome} ({lucros[melhor]:,.2f})")
+        print(f"Menor lucro líquido: {tabela.cenarios[pior].nome} ({lucros[pior]:,.2f})")
 
-        print(f"\nAbrindo planilha...")
-        caminho_absoluto = os.path.abspath(caminho_arquivo)
-        os.startfile(caminho_absoluto)
-        print(f"✓ Planilha aberta com sucesso.")
+        if abrir:
+            print(f"\nAbrindo planilha...")
+            abrir_planilha(caminho_saida)
 
-        if datas_invalidas:
-            print(f"\n❌ ERRO: datas invalidas encontradas:")
-            for aba, linha, valor in datas_invalidas:
-                print(f"   - Aba '{aba}', Linha {linha}: {valor}")
-            print(f"   Total: {len(datas_invalidas)} data(s) inválida(s) foram ignoradas.")
+    except ValueError as ve:
+        print(f"\n❌ ERRO: {ve}")
+    except Exception as e:
+        print(f"\n❌ ERRO INESPERADO: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def imprimir_datas_invalidas(datas_invalidas):
+    if datas_invalidas:
+        print(f"\n❌ ERRO: datas invalidas encontradas:")
+        for aba, linha, valor in datas_invalidas:
+            print(f"   - Aba '{aba}', Linha {linha}: {valor}")
+        print(f"   Total: {len(datas_invalidas)} data(s) inválida(s) foram ignoradas.")
+
+
+def automatizar_dre(caminho_arquivo='entrada.xlsx', data_inicial=None, num_meses=None,
+                    caminho_saida=None, abrir=True, streaming=None, usar_cache=None, incremental=False,
+                    externas=None, metricas=None, metricas_memoria=None, valores_em_cache=None, config=None):
+    configurar_log_console()
+    try:
+        print("=" * 80)
+        print("AUTOMATIZAÇÃO DA ABA DRE")
+        print("=" * 80)
+        print(f"\nArquivo de entrada: {caminho_arquivo}")
+
+        resultado = gerar_dre(caminho_arquivo, data_inicial, num_meses, caminho_saida, streaming, usar_cache,
+                              incremental, externas, metricas, metricas_memoria, valores_em_cache, config)
+
+        print("\n" + "=" * 80)
+        if resultado.em_cache:
+            print("DRE JÁ ATUALIZADA (NENHUMA ALTERAÇÃO NAS ABAS FONTES OU PARÂMETROS)")
+        else:
+            print("DRE CONSTRUÍDA COM SUCESSO!")
+        print("=" * 80)
+
+        imprimir_datas_invalidas(resultado.datas_invalidas)
+
+        if abrir:
+            print(f"\nAbrindo planilha...")
+            abrir_planilha(resultado.destino)
+
+    except ValueError as ve:
+        print(f"\n❌ ERRO: {ve}")
+    except Exception as e:
+        print(f"\n❌ ERRO INESPERADO: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def automatizar_consolidacao(caminhos, caminho_saida='consolidado.xlsx', por_entidade=False, workers=None,
+                             abrir=True, config=None):
+    configurar_log_console()
+    try:
+        print("=" * 80)
+        print("CONSOLIDAÇÃO DA DRE")
+        print("=" * 80)
+        print(f"\nEntidades: {len(caminhos)} arquivo(s)")
+
+        resultado = consolidar_dre(caminhos, caminho_saida, por_entidade, workers, config)
+
+        print("\n" + "=" * 80)
+        print("DRE CONSOLIDADA CONSTRUÍDA COM SUCESSO!")
+        print("=" * 80)
+
+        imprimir_datas_invalidas(resultado.datas_invalidas)
+
+        if abrir:
+            print(f"\nAbrindo planilha...")
+            abrir_planilha(resultado.destino)
 
     except ValueError as ve:
         print(f"\n❌ ERRO: {ve}")
@@ -829,5 +1584,161 @@ def automatizar_dre(caminho_arquivo='entrada.xlsx', data_inicial=None, num_meses
         import traceback
         traceback.print_exc()
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Automatização da aba DRE.')
+    subcomandos = parser.add_subparsers(dest='comando')
+
+    parser_lote = subcomandos.add_parser(
+        'batch', help='Gera a DRE de todos os arquivos .xlsx de um diretório em paralelo.')
+    parser_lote.add_argument('diretorio', help='Diretório com os arquivos de entrada')
+    parser_lote.add_argument('--workers', type=int, default=None,
+                             help='Número de processos (padrão: número de CPUs)')
+
+    parser_consolidar = subcomandos.add_parser(
+        'consolidar', help='Consolida as DREs de várias entidades (um arquivo de entrada por entidade).')
+    parser_consolidar.add_argument('entradas', nargs='+',
+                                   help='Arquivos .xlsx das entidades ou diretórios com esses arquivos')
+    parser_consolidar.add_argument('--saida', default='consolidado.xlsx',
+                                   help='Arquivo de saída (padrão: consolidado.xlsx)')
+    parser_consolidar.add_argument('--por-entidade', action='store_true',
+                                   help='Inclui uma aba DRE por entidade além da consolidada')
+    parser_consolidar.add_argument('--workers', type=int, default=None,
+                                   help='Número de processos (padrão: número de CPUs)')
+
+    parser_cenarios = subcomandos.add_parser(
+        'cenarios', help='Compara cenários de parâmetros (taxa de imposto, vida útil) do arquivo de --arquivo.')
+    parser_cenarios.add_argument('--variar', action='append', default=[], metavar='PARAMETRO=V1,V2,...',
+                                 help='Valores de um parâmetro (taxa_imposto, limite_compensacao_prejuizo, '
+                                      'vida_util_padrao ou vida_util_ativos.<descrição>); pode ser repetido, '
+                                      'e os cenários são todas as combinações')
+    parser_cenarios.add_argument('--saida', default='cenarios.xlsx',
+                                 help='Arquivo de saída com a aba de comparação (padrão: cenarios.xlsx)')
+
+    parser.add_argument('--configuracao', '--config', default=None, metavar='ARQUIVO',
+                        help='Lê os parâmetros de ARQUIVO (.py, .json, .toml, .yaml) em vez de parametros.py; '
+                             'os ausentes ficam com o valor de parametros.py')
+    parser.add_argument('--definir', '--set', action='append', default=[], metavar='CHAVE=VALOR',
+                        help='Altera um parâmetro nesta execução (ex.: taxa_imposto=34, '
+                             'vida_util_ativos.Software=3); o valor é lido como JSON ou texto; pode ser repetido')
+    parser.add_argument('--arquivo', default='entrada.xlsx',
+                        help='Arquivo de entrada (padrão: entrada.xlsx)')
+    parser.add_argument('--saida', default=None,
+                        help='Arquivo de saída (padrão: sobrescreve o arquivo de entrada)')
+    parser.add_argument('--nao-abrir', action='store_true',
+                        help='Não abre a planilha ao final (uso em servidores)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Grava a saída em um novo arquivo em modo streaming, sem alterar a entrada '
+                             '(requer --saida; padrão sempre que --saida é diferente da entrada)')
+    parser.add_argument('--sem-streaming', action='store_true',
+                        help='Carrega o workbook em modo de escrita mesmo com --saida')
+    parser.add_argument('--cache', action='store_true',
+                        help='Usa o cache das execuções (ver usar_cache em parametros.py)')
+    parser.add_argument('--sem-cache', action='store_true',
+                        help='Ignora o cache e sempre reconstrói a DRE')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Varre e agrega de Vendas e Custo_Despesas apenas as linhas novas desde a última '
+                             'execução (liga o cache)')
+    parser.add_argument('--fonte', action='append', default=[], metavar='ABA=ARQUIVO',
+                        help='Lê a aba (Vendas, Custo_Despesas ou Folha) de um arquivo CSV ou Parquet; '
+                             'pode ser repetido')
+    parser.add_argument('--metricas', default=None, metavar='ARQUIVO',
+                        help='Grava o tempo e as contagens de cada fase em ARQUIVO (JSON, uma linha por fase; '
+                             'formato do Prometheus se terminar em .prom)')
+    parser.add_argument('--metricas-memoria', action='store_true',
+                        help='Inclui nas métricas o pico de memória de cada fase (tracemalloc; mais lento)')
+    parser.add_argument('--valores-em-cache', action='store_true',
+                        help='Calcula a DRE em Python e grava os valores junto das fórmulas, para leitores '
+                             'que não recalculam o arquivo')
+    parser.add_argument('--perfil', '--profile', default=None, metavar='BASE',
+                        help='Executa com perfil e grava BASE.pstats e BASE.folded (pilhas colapsadas)')
+    parser.add_argument('--perfil-modo', choices=MODOS_PERFIL, default='cprofile',
+                        help="'cprofile' (padrão) ou 'amostragem' (baixo custo, para execuções grandes)")
+    parser.add_argument('--perfil-intervalo', type=float, default=INTERVALO_AMOSTRAGEM_MS, metavar='MS',
+                        help=f'Intervalo entre amostras no modo amostragem (padrão: {INTERVALO_AMOSTRAGEM_MS} ms)')
+
+    args = parser.parse_args(argv)
+    if args.cache and args.sem_cache:
+        parser.error('use --cache ou --sem-cache, não ambos')
+    usar_cache = True if args.cache else (False if args.sem_cache else None)
+
+    try:
+        config = carregar_configuracao(args.configuracao, dict(ler_definicao(texto) for texto in args.definir))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.comando == 'batch':
+        if args.perfil:
+            parser.error('--perfil não é suportado no modo batch')
+        arquivos = descobrir_arquivos(args.diretorio)
+        if not arquivos:
+            print(f"❌ ERRO: Nenhum arquivo .xlsx encontrado em: {args.diretorio}")
+            return 1
+        print(f"Processando {len(arquivos)} arquivo(s) com {args.workers or os.cpu_count()} processo(s)...")
+        gerar = functools.partial(gerar_dre, usar_cache=usar_cache, incremental=args.incremental,
+                                  metricas=args.metricas, metricas_memoria=args.metricas_memoria or None,
+                                  valores_em_cache=args.valores_em_cache or None, config=config)
+        resultados = processar_lote(arquivos, gerar, args.workers)
+        imprimir_resumo(resultados)
+        return 1 if any(not r.sucesso for r in resultados) else 0
+
+    if args.comando == 'cenarios':
+        if args.perfil:
+            parser.error('--perfil não é suportado nos cenários')
+        variacoes = {}
+        for texto in args.variar:
+            try:
+                parametro, valores = ler_variacao(texto, config)
+            except ValueError as e:
+                parser.error(str(e))
+            variacoes[parametro] = valores
+        if _mesmo_arquivo(args.arquivo, args.saida):
+            parser.error('a saída dos cenários deve ser diferente do arquivo de entrada')
+        automatizar_cenarios(args.arquivo, variacoes, args.saida, abrir=not args.nao_abrir, config=config)
+        return 0
+
+    if args.comando == 'consolidar':
+        if args.perfil:
+            parser.error('--perfil não é suportado na consolidação')
+        caminhos = []
+        for entrada in args.entradas:
+            caminhos.extend(descobrir_arquivos(entrada) if os.path.isdir(entrada) else [entrada])
+        # A saída pode estar no mesmo diretório das entradas
+        caminhos = [caminho for caminho in caminhos if not _mesmo_arquivo(caminho, args.saida)]
+        if not caminhos:
+            print(f"❌ ERRO: Nenhum arquivo .xlsx encontrado em: {', '.join(args.entradas)}")
+            return 1
+        automatizar_consolidacao(caminhos, args.saida, args.por_entidade, args.workers, abrir=not args.nao_abrir,
+                                 config=config)
+        return 0
+
+    if args.streaming and not args.saida:
+        parser.error('--streaming requer --saida')
+    if args.streaming and args.sem_streaming:
+        parser.error('use --streaming ou --sem-streaming, não ambos')
+    streaming = True if args.streaming else (False if args.sem_streaming else None)
+    if args.incremental and args.sem_cache:
+        parser.error('--incremental requer o cache (não use --sem-cache)')
+    externas = None
+    if args.fonte:
+        externas = dict(config.fontes_externas)
+        for fonte in args.fonte:
+            aba, separador, caminho = fonte.partition('=')
+            if not separador or not aba or not caminho:
+                parser.error(f'--fonte deve ter o formato ABA=ARQUIVO: {fonte}')
+            externas[aba] = caminho
+    executar = functools.partial(
+        automatizar_dre, args.arquivo, caminho_saida=args.saida, abrir=not args.nao_abrir, streaming=streaming,
+        usar_cache=usar_cache, incremental=args.incremental, externas=externas, metricas=args.metricas,
+        metricas_memoria=args.metricas_memoria or None, valores_em_cache=args.valores_em_cache or None,
+        config=config)
+    if args.perfil:
+        executar_com_perfil(executar, args.perfil, args.perfil_modo, args.perfil_intervalo)
+        print(f"\nPerfil gravado em: {args.perfil}.*")
+    else:
+        executar()
+    return 0
+
+
 if __name__ == '__main__':
-    automatizar_dre()
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Modelo compacto das transações das abas fontes.
+
+Depois da varredura de datas, cada aba agregada é convertida em arrays
+NumPy com uma posição por transação: índice do mês (int32), valor (float64)
+e, quando a aba tem categoria, o código da categoria (int32) em uma tabela
+de categorias internadas. Uma transação ocupa 16 bytes, em vez de um objeto
+Python por célula lida.
+
+Só entram no modelo as transações que contam na DRE (data numérica válida
+e, conforme a aba, valor numérico); as demais ficam com mês MES_INVALIDO.
+
+Vendas, Custo_Despesas e Folha são compactadas já na leitura, bloco a bloco
+(AbaCompacta, ver ingestao.ler_fontes): as listas de valores lidas de cada
+bloco são descartadas e só as transações que contam são guardadas.
+"""
+import numpy as np
+
+from datas import MES_INVALIDO
+
+
+def normalizar_categoria(categoria):
+    if categoria is None:
+        return None
+    return str(categoria).casefold()
+
+
+def numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+class TabelaCategorias:
+    """
+    Categorias internadas: cada categoria recebe um código inteiro na ordem
+    em que aparece. Com `normalizar`, categorias que diferem só em
+    maiúsculas compartilham o código, e o rótulo guardado é o da primeira
+    ocorrência.
+    """
+
+    __slots__ = ('normalizar', 'codigos', 'chaves', 'rotulos')
+
+    def __init__(self, normalizar=True):
+        self.normalizar = normalizar
+        self.codigos = {}
+        self.chaves = []
+        self.rotulos = []
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def codigo(self, categoria):
+        chave = normalizar_categoria(categoria) if self.normalizar else categoria
+        codigo = self.codigos.get(chave)
+        if codigo is None:
+            codigo = self.codigos[chave] = len(self.chaves)
+            self.chaves.append(chave)
+            self.rotulos.append(categoria)
+        return codigo
+
+
+class Transacoes:
+    """Transações de uma fonte da DRE em arrays (ver o docstring do módulo)."""
+
+    __slots__ = ('fonte', 'meses', 'valores', 'categorias', 'tabela')
+
+    def __init__(self, fonte, meses, valores, categorias=None, tabela=None):
+        self.fonte = fonte
+        self.meses = meses
+        self.valores = valores
+        self.categorias = categorias
+        self.tabela = tabela
+
+    def __len__(self):
+        return len(self.meses)
+
+    @property
+    def nbytes(self):
+        total = self.meses.nbytes + self.valores.nbytes
+        if self.categorias is not None:
+            total += self.categorias.nbytes
+        return total
+
+    def contadas(self):
+        """Transacoes só com as transações que contam na DRE."""
+        conta = self.meses >= 0
+        categorias = self.categorias[conta] if self.categorias is not None else None
+        return Transacoes(self.fonte, self.meses[conta], self.valores[conta], categorias, self.tabela)
+
+
+def juntar_transacoes(fonte, partes, tabela=None):
+    """Transacoes de uma aba a partir das de seus blocos, que compartilham a tabela de categorias."""
+    meses = np.concatenate([parte.meses for parte in partes] + [np.empty(0, dtype=np.int32)])
+    valores = np.concatenate([parte.valores for parte in partes] + [np.empty(0, dtype=np.float64)])
+    categorias = None
+    if tabela is not None:
+        categorias = np.concatenate([parte.categorias for parte in partes] + [np.empty(0, dtype=np.int32)])
+    return Transacoes(fonte, meses, valores, categorias, tabela)
+
+
+class AbaCompacta:
+    """
+    Aba fonte compactada durante a leitura: `transacoes` (só as que contam)
+    e `datas`, o resumo da varredura de datas (mes_min, mes_max,
+    datas_validas, datas_invalidas). `primeira_linha` e `ultima_linha`
+    seguem ingestao.AbaFonte; numa aba lida a partir de uma marca (modo
+    incremental), as linhas anteriores a `primeira_linha` não estão nas
+    transações, mas contam para `ultima_linha`.
+    """
+
+    __slots__ = ('nome', 'primeira_linha', 'ultima_linha', 'transacoes', 'datas')
+
+    def __init__(self, nome, primeira_linha, ultima_linha, transacoes, datas):
+        self.nome = nome
+        self.primeira_linha = primeira_linha
+        self.ultima_linha = ultima_linha
+        self.transacoes = transacoes
+        self.datas = datas
+
+    def __len__(self):
+        return self.ultima_linha - self.primeira_linha + 1 if self.ultima_linha else 0
+
+
+def _valores_numericos(valores):
+    return np.fromiter((valor if numero(valor) else np.nan for valor in valores), dtype=np.float64,
+                       count=len(valores))
+
+
+def compactar(fonte, meses, datas, campos_valor, categorias=None, exigir_numero=True, tabela=None):
+    """
+    Monta as Transacoes de uma aba a partir dos índices de mês da varredura
+    (`meses`), da coluna de datas bruta e das colunas de valor. Com mais de
+    uma coluna de valor (Folha), o valor é a soma das colunas numéricas.
+    Com `exigir_numero`, linhas sem valor numérico não contam. `tabela`
+    (TabelaCategorias) permite compartilhar os códigos entre blocos.
+    """
+    meses = np.asarray(meses, dtype=np.int32)
+    # Como nos critérios das fórmulas, datas em texto não entram nas somas
+    data_numerica = np.fromiter((not isinstance(data, str) for data in datas), dtype=bool, count=len(datas))
+    colunas = np.vstack([_valores_numericos(valores) for valores in campos_valor])
+    valores = colunas[0] if len(colunas) == 1 else np.nansum(colunas, axis=0)
+
+    conta = (meses >= 0) & data_numerica
+    if exigir_numero:
+        conta &= ~np.isnan(valores)
+    meses = np.where(conta, meses, MES_INVALIDO).astype(np.int32)
+    valores = np.where(conta, valores, 0.0)
+
+    codigos = None
+    if categorias is None:
+        tabela = None
+    else:
+        tabela = tabela if tabela is not None else TabelaCategorias()
+        codigos = np.full(len(meses), -1, dtype=np.int32)
+        for posicao in np.flatnonzero(conta).tolist():
+            codigos[posicao] = tabela.codigo(categorias[posicao])
+    return Transacoes(fonte, meses, valores, codigos, tabela)
+
+
+def somas_mensais(transacoes):
+    """
+    Soma os valores por (código da categoria, mês). Devolve arrays
+    (códigos, meses, somas), com código -1 quando a fonte não tem categoria.
+    """
+    conta = transacoes.meses >= 0
+    meses = transacoes.meses[conta].astype(np.int64)
+    if transacoes.categorias is not None:
+        codigos = transacoes.categorias[conta].astype(np.int64)
+    else:
+        codigos = np.full(len(meses), -1, dtype=np.int64)
+    chaves, posicoes = np.unique((codigos + 1) * (1 << 32) + meses, return_inverse=True)
+    somas = np.bincount(posicoes, weights=transacoes.valores[conta], minlength=len(chaves))
+    return (chaves >> 32) - 1, chaves & 0xFFFFFFFF, somas
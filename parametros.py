@@ -1,27 +1,84 @@
-# Arquivo de Parâmetros para geração da DRE
-
-# Modifique os valores abaixo conforme necessário
-
-# Taxa de imposto sobre o lucro (em porcentagem)
-# Exemplo: 10 para 10%, 15 para 15%, etc.
-taxa_imposto = 30
-
-# Detecção automática do período da DRE
-# Se True: encontra automaticamente as datas mínima e máxima nas planilhas
-# Se False: usa os parâmetros periodo_inicio e periodo_final definidos abaixo
-auto_detectar_periodo = True
-# Período específico (usado apenas se auto_detectar_periodo = False)
-# Formato: MM/YY (ex: '01/24' para janeiro de 2024)
-periodo_inicio = '03/24'  # Mês/Ano inicial
-periodo_final = '01/24'   # Mês/Ano final
-
-# Vida útil dos ativos por tipo (em anos)
-# Define o número de anos para depreciar cada tipo de ativo
-# A chave deve corresponder EXATAMENTE ao texto na coluna "Descrição" da aba Investimentos
-vida_util_ativos = {
-    'Expansão': 3,
-    'Equipamento': 3,
-    'Software': 5,
-}
-# Valor padrão para vida útil quando o tipo não é encontrado
-vida_util_padrao = 5
\ No newline at end of file
+# Arquivo de Parâmetros para geração da DRE
+
+# Modifique os valores abaixo conforme necessário
+# Os valores também podem vir de um arquivo JSON, TOML ou YAML com as mesmas
+# chaves (opção --configuracao) ou ser alterados por execução (opção --definir);
+# ver configuracao.py
+
+# Taxa de imposto sobre o lucro (em porcentagem)
+# Exemplo: 10 para 10%, 15 para 15%, etc.
+taxa_imposto = 30
+
+# Limite de compensação de prejuízo fiscal (em porcentagem do lucro do mês)
+# Exemplo: 30 para compensar no máximo 30% do lucro com prejuízos anteriores
+limite_compensacao_prejuizo = 30
+
+# Detecção automática do período da DRE
+# Se True: encontra automaticamente as datas mínima e máxima nas planilhas
+# Se False: usa os parâmetros periodo_inicio e periodo_final definidos abaixo
+auto_detectar_periodo = True
+# Período específico (usado apenas se auto_detectar_periodo = False)
+# Formato: MM/YY (ex: '01/24' para janeiro de 2024)
+periodo_inicio = '03/24'  # Mês/Ano inicial
+periodo_final = '01/24'   # Mês/Ano final
+
+# Modo de geração das linhas da DRE alimentadas pelas abas fontes
+# 'formulas': fórmulas SUMIFS sobre as abas fontes (auditável, recálculo lento)
+# 'agregado': fórmulas sobre a aba oculta _Agg, pré-agregada por fonte/categoria/mês
+# 'valores':  valores calculados pelo script (sem recálculo ao abrir)
+# 'hibrido':  valores calculados, com a fórmula equivalente em um comentário
+modo_dre = 'formulas'
+
+# Modo de escrita do waterfall de depreciação na aba Investimentos
+# 'valores':   depreciação calculada pelo script, por ativo e mês
+# 'resumo':    apenas a linha TOTAL D&A (sem a grade por ativo)
+# 'auditoria': fórmulas por ativo e mês (auditável, recálculo lento)
+modo_depreciacao = 'valores'
+
+# Modo de escrita da compensação de prejuízo e do imposto na DRE
+# 'formulas': fórmulas encadeadas mês a mês (auditável; cada mês depende do anterior)
+# 'valores':  valores calculados pelo script de uma só vez para todos os meses
+#             (ver impostos.py; sem recálculo ao abrir)
+modo_prejuizo = 'formulas'
+
+# Vida útil dos ativos por tipo (em anos)
+# Define o número de anos para depreciar cada tipo de ativo
+# A chave deve corresponder EXATAMENTE ao texto na coluna "Descrição" da aba Investimentos
+vida_util_ativos = {
+    'Expansão': 3,
+    'Equipamento': 3,
+    'Software': 5,
+}
+# Valor padrão para vida útil quando o tipo não é encontrado
+vida_util_padrao = 5
+
+# Cache das execuções (ver cache.py), desligado por padrão (opção --cache)
+# Se True: pula a reconstrução quando o arquivo e os parâmetros não mudaram e
+# reaproveita a varredura/agregação das abas fontes sem alterações
+usar_cache = False
+# Arquivo do cache; None: diretório de cache do usuário
+# (%LOCALAPPDATA%\dre no Windows, $XDG_CACHE_HOME/dre ou ~/.cache/dre nos demais)
+caminho_cache = None
+# Tamanho máximo do cache em disco (MB); as entradas mais antigas são removidas
+tamanho_maximo_cache_mb = 64
+
+# Abas fontes lidas de arquivos CSV ou Parquet em vez do arquivo de entrada
+# Aceita 'Vendas', 'Custo_Despesas' e 'Folha', com as colunas na mesma
+# posição da aba (ex.: {'Vendas': 'vendas.csv'}). A linha 1 é o cabeçalho.
+fontes_externas = {}
+# Formato dos arquivos CSV
+csv_delimitador = ','
+csv_separador_decimal = '.'
+csv_codificacao = 'utf-8-sig'
+
+# Métricas de cada fase da geração (tempo, CPU, contagens; ver instrumentacao.py)
+# None: desligadas. Arquivo .prom: formato texto do Prometheus; outro: JSON
+# com uma linha por fase, acrescentada a cada execução
+caminho_metricas = None
+# Se True: inclui o pico de memória de cada fase (tracemalloc, mais lento)
+metricas_memoria = False
+
+# Valores calculados da DRE gravados junto das fórmulas (ver avaliacao.py)
+# Se True: leitores que não recalculam o arquivo (ex.: openpyxl com
+# data_only=True) veem os números; o Excel recalcula normalmente ao abrir
+gravar_valores_em_cache = False
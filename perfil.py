@@ -0,0 +1,156 @@
+"""
+Perfil de execução da geração da DRE (opção --perfil do main.py).
+
+Dois modos:
+- 'cprofile': perfil determinístico com cProfile. Grava <base>.pstats (para
+  pstats, snakeviz etc.) e <base>.folded, com pilhas colapsadas estimadas a
+  partir das arestas chamador -> chamado do cProfile.
+- 'amostragem': uma thread lê a pilha da thread principal a cada intervalo
+  (sys._current_frames) e conta as pilhas. O custo não depende do número de
+  chamadas, então é o modo indicado para execuções grandes. Grava apenas
+  <base>.folded.
+
+Os arquivos .folded têm uma pilha por linha ("a;b;c contagem"), no formato
+aceito por flamegraph.pl, speedscope e inferno — o mesmo produzido por
+`py-spy record -f raw`.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+
+MODOS_PERFIL = ('cprofile', 'amostragem')
+INTERVALO_AMOSTRAGEM_MS = 5
+
+# Limites da reconstrução das pilhas a partir do cProfile: profundidade e
+# tempo acumulado mínimo (segundos) de um ramo para ser percorrido
+PROFUNDIDADE_MAXIMA = 200
+TEMPO_MINIMO_RAMO = 1e-4
+
+
+def _rotulo(arquivo, linha, funcao):
+    # ';' separa os quadros e o último espaço separa a contagem
+    modulo = os.path.splitext(os.path.basename(arquivo))[0] if arquivo not in ('~', '') else ''
+    rotulo = f'{modulo}:{funcao}:{linha}' if modulo else funcao
+    return rotulo.replace(';', ',').replace(' ', '_')
+
+
+def pilhas_de_stats(stats):
+    """
+    Pilhas colapsadas (Counter pilha -> microssegundos) a partir de um
+    pstats.Stats. O tempo próprio de cada função é repartido entre as
+    pilhas em que ela aparece, na proporção do tempo acumulado de cada
+    chamada. Chamadas recursivas e ramos com menos de TEMPO_MINIMO_RAMO são
+    cortados; para compensar, as pilhas de cada função são escaladas para
+    que somem o seu tempo próprio.
+    """
+    dados = stats.stats
+    filhos = {}
+    for funcao, (_, _, _, _, chamadores) in dados.items():
+        for chamador, (_, _, _, acumulado) in chamadores.items():
+            filhos.setdefault(chamador, []).append((funcao, acumulado))
+    raizes = [funcao for funcao, (_, _, _, _, chamadores) in dados.items() if not chamadores]
+
+    por_funcao = {}
+
+    def visitar(funcao, proporcao, pilha, na_pilha):
+        _, _, proprio, acumulado, _ = dados[funcao]
+        pilha = pilha + [_rotulo(*funcao)]
+        na_pilha = na_pilha | {funcao}
+        tempo = proprio * proporcao
+        if tempo > 0:
+            pilhas_funcao = por_funcao.setdefault(funcao, Counter())
+            pilhas_funcao[';'.join(pilha)] += tempo
+        if len(pilha) >= PROFUNDIDADE_MAXIMA or acumulado * proporcao < TEMPO_MINIMO_RAMO:
+            return
+        for filho, acumulado_chamada in filhos.get(funcao, ()):
+            if filho in na_pilha:
+                continue
+            visitar(filho, proporcao * acumulado_chamada / acumulado, pilha, na_pilha)
+
+    for raiz in raizes:
+        visitar(raiz, 1.0, [], frozenset())
+
+    pilhas = Counter()
+    for funcao, pilhas_funcao in por_funcao.items():
+        escala = dados[funcao][2] / sum(pilhas_funcao.values())
+        for pilha, tempo in pilhas_funcao.items():
+            microssegundos = int(round(tempo * escala * 1e6))
+            if microssegundos > 0:
+                pilhas[pilha] += microssegundos
+    return pilhas
+
+
+def gravar_pilhas(pilhas, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        for pilha, contagem in sorted(pilhas.items()):
+            arquivo.write(f'{pilha} {contagem}\n')
+
+
+def executar_com_cprofile(funcao, base):
+    """Executa `funcao()` com cProfile e grava <base>.pstats e <base>.folded."""
+    perfilador = cProfile.Profile()
+    try:
+        return perfilador.runcall(funcao)
+    finally:
+        perfilador.dump_stats(base + '.pstats')
+        gravar_pilhas(pilhas_de_stats(pstats.Stats(perfilador)), base + '.folded')
+
+
+class AmostradorPilhas:
+    """
+    Thread que amostra a pilha de outra thread (por padrão, a que o criou)
+    a cada `intervalo` segundos e conta as pilhas colapsadas.
+    """
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM_MS / 1000, thread_alvo=None):
+        self.intervalo = intervalo
+        self.thread_alvo = thread_alvo if thread_alvo is not None else threading.get_ident()
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='amostrador-perfil', daemon=True)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.thread_alvo)
+            if quadro is None:
+                continue
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(_rotulo(codigo.co_filename, codigo.co_firstlineno, codigo.co_name))
+                quadro = quadro.f_back
+            self.pilhas[';'.join(reversed(pilha))] += 1
+            self.amostras += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        return False
+
+
+def executar_com_amostragem(funcao, base, intervalo_ms=INTERVALO_AMOSTRAGEM_MS):
+    """Executa `funcao()` com o amostrador de pilhas e grava <base>.folded."""
+    amostrador = AmostradorPilhas(intervalo_ms / 1000)
+    try:
+        with amostrador:
+            return funcao()
+    finally:
+        gravar_pilhas(amostrador.pilhas, base + '.folded')
+
+
+def executar_com_perfil(funcao, base, modo='cprofile', intervalo_ms=INTERVALO_AMOSTRAGEM_MS):
+    """Executa `funcao()` no modo de perfil pedido (ver MODOS_PERFIL)."""
+    if modo not in MODOS_PERFIL:
+        raise ValueError(f"Modo de perfil inválido: {modo}. Use um de: {', '.join(MODOS_PERFIL)}")
+    if modo == 'amostragem':
+        return executar_com_amostragem(funcao, base, intervalo_ms)
+    return executar_com_cprofile(funcao, base)
@@ -0,0 +1,538 @@
+"""
+Gravação da DRE em um novo arquivo, em streaming.
+
+As abas geradas (DRE, waterfall em Investimentos, _Agg) são montadas em
+memória por WorkbookEmMemoria, que expõe o mesmo subconjunto da API de
+openpyxl usado pelas funções de escrita de main.py. Em seguida, o arquivo
+de saída é gravado com um workbook openpyxl em modo write_only, com a folha
+de estilos da entrada: as abas novas são gravadas célula a célula, e as
+abas da entrada modificadas (Investimentos) são copiadas linha a linha da
+entrada (lida em modo read_only), com as células geradas sobrepostas.
+
+As abas da entrada não modificadas (Vendas, Custo_Despesas, Folha, DFC,
+BP...) não passam pelo openpyxl: o XML de cada uma, as partes relacionadas
+(desenhos, comentários, tabelas...) e as strings compartilhadas são copiados
+byte a byte do pacote da entrada para o de saída. Como a folha de estilos da
+saída começa com os estilos da entrada, na mesma ordem, os índices de estilo
+dessas abas continuam válidos, e larguras de coluna, alturas de linha e
+células mescladas são mantidas. Nas abas modificadas, são preservados os
+valores, fórmulas e estilos das células, mas não essas propriedades da aba,
+que o modo read_only do openpyxl não expõe.
+
+O arquivo de entrada nunca é alterado. Os nomes definidos do workbook e os
+de escopo de aba (das abas copiadas) são mantidos.
+
+O openpyxl grava as fórmulas sem o valor calculado; gravar_valores_em_cache
+preenche esse valor em uma aba de um arquivo já gravado, para leitores que
+não recalculam as fórmulas (load_workbook(data_only=True)).
+"""
+import copy
+import io
+import posixpath
+import re
+import shutil
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr, unescape
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.styles.stylesheet import apply_stylesheet
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string
+
+
+class CelulaEmMemoria:
+    """Célula gerada, com valor e estilos opcionais (None = padrão)."""
+
+    __slots__ = ('value', 'style', 'font', 'fill', 'alignment', 'number_format', 'comment')
+
+    def __init__(self, value=None):
+        self.value = value
+        self.style = None
+        self.font = None
+        self.fill = None
+        self.alignment = None
+        self.number_format = None
+        self.comment = None
+
+
+class _DimensaoColuna:
+    __slots__ = ('width',)
+
+    def __init__(self):
+        self.width = None
+
+
+class _DimensaoLinha:
+    __slots__ = ('outline_level', 'collapsed')
+
+    def __init__(self):
+        self.outline_level = 0
+        self.collapsed = False
+
+
+class _PropriedadesPlanilha:
+    __slots__ = ('outline_summary_below',)
+
+    def __init__(self):
+        self.outline_summary_below = None
+
+
+class _Dimensoes(dict):
+    def __init__(self, fabrica):
+        super().__init__()
+        self._fabrica = fabrica
+
+    def __missing__(self, chave):
+        valor = self[chave] = self._fabrica()
+        return valor
+
+
+class PlanilhaEmMemoria:
+    """
+    Aba montada em memória. Se `origem` for o nome de uma aba da entrada, as
+    células desta planilha são sobrepostas às da aba original na gravação.
+    """
+
+    def __init__(self, title, origem=None, parent=None, dimensao=(0, 0)):
+        self.title = title
+        self.parent = parent
+        # Dimensões da aba de origem (as células geradas não são contadas)
+        self.max_row, self.max_column = dimensao
+        self.origem = origem
+        self.celulas = {}
+        self.mescladas = []
+        self.column_dimensions = _Dimensoes(_DimensaoColuna)
+        self.row_dimensions = _Dimensoes(_DimensaoLinha)
+        self.sheet_properties = _PropriedadesPlanilha()
+        self.freeze_panes = None
+        self.sheet_state = 'visible'
+        self._proxima_linha = 1
+
+    def cell(self, row, column, value=None):
+        celula = self.celulas.get((row, column))
+        if celula is None:
+            celula = self.celulas[(row, column)] = CelulaEmMemoria()
+        if value is not None:
+            celula.value = value
+        return celula
+
+    def __getitem__(self, coordenada):
+        coluna, linha = coordinate_from_string(coordenada)
+        return self.cell(row=linha, column=column_index_from_string(coluna))
+
+    def __setitem__(self, coordenada, valor):
+        self[coordenada].value = valor
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        if range_string is None:
+            range_string = (f'{get_column_letter(start_column)}{start_row}:'
+                            f'{get_column_letter(end_column)}{end_row}')
+        self.mescladas.append(range_string)
+
+    def append(self, valores):
+        for coluna, valor in enumerate(valores, start=1):
+            if valor is not None:
+                self.cell(row=self._proxima_linha, column=coluna, value=valor)
+        self._proxima_linha += 1
+
+    def linhas(self):
+        """Agrupa as células por linha: {linha: {coluna: célula}}."""
+        por_linha = {}
+        for (linha, coluna), celula in self.celulas.items():
+            por_linha.setdefault(linha, {})[coluna] = celula
+        return por_linha
+
+
+class WorkbookEmMemoria:
+    """
+    Workbook de saída montado em memória a partir da lista de abas da
+    entrada. Abas da entrada acessadas por nome viram camadas de sobreposição;
+    abas removidas não são copiadas.
+    """
+
+    def __init__(self, sheetnames, defined_names=None, dimensoes=None):
+        self.sheetnames = list(sheetnames)
+        self.planilhas = {}
+        self.estilos_nomeados = {}
+        self.defined_names = dict(defined_names or {})
+        self.dimensoes = dimensoes or {}
+
+    @property
+    def named_styles(self):
+        return list(self.estilos_nomeados)
+
+    def add_named_style(self, estilo):
+        self.estilos_nomeados[estilo.name] = estilo
+
+    def __getitem__(self, nome):
+        if nome not in self.sheetnames:
+            raise KeyError(f"Worksheet {nome} does not exist.")
+        planilha = self.planilhas.get(nome)
+        if planilha is None:
+            dimensao = self.dimensoes.get(nome, (0, 0))
+            planilha = self.planilhas[nome] = PlanilhaEmMemoria(nome, origem=nome, parent=self, dimensao=dimensao)
+        return planilha
+
+    def create_sheet(self, title, index=None):
+        planilha = PlanilhaEmMemoria(title, parent=self)
+        self.planilhas[title] = planilha
+        if index is None:
+            self.sheetnames.append(title)
+        else:
+            self.sheetnames.insert(index, title)
+        return planilha
+
+    def remove(self, planilha):
+        self.sheetnames.remove(planilha.title)
+        self.planilhas.pop(planilha.title, None)
+
+
+def _celula_saida(ws, celula):
+    saida = WriteOnlyCell(ws, celula.value)
+    if celula.style is not None:
+        saida.style = celula.style
+    if celula.font is not None:
+        saida.font = celula.font
+    if celula.fill is not None:
+        saida.fill = celula.fill
+    if celula.alignment is not None:
+        saida.alignment = celula.alignment
+    if celula.number_format is not None:
+        saida.number_format = celula.number_format
+    if celula.comment is not None:
+        saida.comment = celula.comment
+    return saida
+
+
+def _configurar_planilha(ws, planilha):
+    for letra, dimensao in planilha.column_dimensions.items():
+        if dimensao.width is not None:
+            ws.column_dimensions[letra].width = dimensao.width
+    for linha, dimensao in planilha.row_dimensions.items():
+        ws.row_dimensions[linha].outline_level = dimensao.outline_level
+        ws.row_dimensions[linha].collapsed = dimensao.collapsed
+    if planilha.sheet_properties.outline_summary_below is not None:
+        ws.sheet_properties.outline_summary_below = planilha.sheet_properties.outline_summary_below
+    for intervalo in planilha.mescladas:
+        ws.merged_cells.add(intervalo)
+    if planilha.freeze_panes:
+        ws.freeze_panes = planilha.freeze_panes
+    ws.sheet_state = planilha.sheet_state
+
+
+def _escrever_planilha(ws, planilha, ws_origem):
+    geradas = planilha.linhas() if planilha is not None else {}
+    ultima_gerada = max(geradas, default=0)
+    numero_linha = 0
+
+    if ws_origem is not None:
+        for numero_linha, row in enumerate(ws_origem.iter_rows(), start=1):
+            sobrepostas = geradas.get(numero_linha, {})
+            largura = max(len(row), max(sobrepostas, default=0))
+            valores = [None] * largura
+            for indice, origem in enumerate(row):
+                if origem is EMPTY_CELL or (origem.value is None and not origem.has_style):
+                    continue
+                celula = WriteOnlyCell(ws, origem.value)
+                if origem.has_style:
+                    # Mesma folha de estilos na entrada e na saída (ver salvar_streaming)
+                    celula._style = copy.copy(origem.style_array)
+                valores[indice] = celula
+            for coluna, celula in sobrepostas.items():
+                valores[coluna - 1] = _celula_saida(ws, celula)
+            ws.append(valores)
+
+    for linha in range(numero_linha + 1, ultima_gerada + 1):
+        sobrepostas = geradas.get(linha, {})
+        valores = [None] * max(sobrepostas, default=0)
+        for coluna, celula in sobrepostas.items():
+            valores[coluna - 1] = _celula_saida(ws, celula)
+        ws.append(valores)
+
+
+def salvar_streaming(workbook, entrada, destino):
+    """
+    Grava `workbook` (WorkbookEmMemoria) em `destino` com openpyxl em modo
+    write_only, copiando da `entrada` as abas fontes: as não modificadas
+    byte a byte, do pacote da entrada, e as modificadas célula a célula.
+    `entrada` deve poder ser aberta novamente (caminho ou arquivo em memória).
+    """
+    wb_origem = openpyxl.load_workbook(entrada, read_only=True)
+    try:
+        with zipfile.ZipFile(entrada) as pacote_entrada:
+            wb_saida = openpyxl.Workbook(write_only=True)
+            # Estilos da entrada na mesma ordem: os índices de estilo das abas copiadas continuam válidos
+            apply_stylesheet(pacote_entrada, wb_saida)
+            if ARC_TEMA in pacote_entrada.namelist():
+                wb_saida.loaded_theme = pacote_entrada.read(ARC_TEMA)
+            existentes = set(wb_saida.named_styles)
+            for estilo in workbook.estilos_nomeados.values():
+                if estilo.name not in existentes:
+                    wb_saida.add_named_style(estilo)
+            for nome, definido in workbook.defined_names.items():
+                wb_saida.defined_names[nome] = definido
+
+            copiadas = []
+            for nome in workbook.sheetnames:
+                planilha = workbook.planilhas.get(nome)
+                ws = wb_saida.create_sheet(nome)
+                ws_origem = None
+                if planilha is None or planilha.origem is not None:
+                    ws_origem = wb_origem[nome]
+                    for nome_local, definido in ws_origem.defined_names.items():
+                        ws.defined_names[nome_local] = copy.copy(definido)
+                if planilha is None:
+                    # Aba vazia no lugar da original, substituída na cópia do pacote
+                    ws.sheet_state = ws_origem.sheet_state
+                    copiadas.append(nome)
+                    continue
+                _configurar_planilha(ws, planilha)
+                _escrever_planilha(ws, planilha, ws_origem)
+
+            gerado = io.BytesIO()
+            wb_saida.save(gerado)
+            _copiar_abas(gerado, pacote_entrada, copiadas, destino)
+    finally:
+        wb_origem.close()
+
+
+_NS_PLANILHA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_RELACOES = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PACOTE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_NS_TIPOS = '{http://schemas.openxmlformats.org/package/2006/content-types}'
+_TIPO_STRINGS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+
+ARC_WORKBOOK = 'xl/workbook.xml'
+_RELACAO_XML = re.compile(rb'<(?:[\w.-]+:)?Relationship\b[^>]*>')
+_ATRIBUTO_XML = re.compile(rb'\s([\w:.-]+)\s*=\s*("[^"]*"|\'[^\']*\')')
+ARC_TEMA = 'xl/theme/theme1.xml'
+ARC_TIPOS = '[Content_Types].xml'
+
+# Célula com fórmula e sem valor, como gravada pelo openpyxl:
+# <c r="E5" s="3"><f>...</f><v /></c>
+_CELULA_FORMULA = re.compile(rb'<c r="([A-Z]+[0-9]+)"([^>]*)><f>(.*?)</f><v\s*/></c>', re.S)
+_ATRIBUTO_TIPO = re.compile(rb'\st="[^"]*"')
+
+
+def _caminho_relacoes(parte):
+    """Caminho do arquivo de relações (.rels) de uma parte do pacote."""
+    pasta, nome = posixpath.split(parte)
+    return posixpath.join(pasta, '_rels', nome + '.rels')
+
+
+def _resolver(parte, alvo):
+    """Caminho, dentro do pacote, do alvo de uma relação da `parte`."""
+    if alvo.startswith('/'):
+        return alvo.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(parte), alvo))
+
+
+def _relacoes(arquivo_zip, parte):
+    """Elemento Relationships da `parte` (None se ela não tiver relações)."""
+    try:
+        return ElementTree.fromstring(arquivo_zip.read(_caminho_relacoes(parte)))
+    except KeyError:
+        return None
+
+
+def _atributos(elemento):
+    """Atributos de um elemento XML em bytes ('<Relationship Id="rId1" .../>'), sem escape."""
+    return {nome.decode(): unescape(valor[1:-1].decode('utf-8'), {'&quot;': '"', '&apos;': "'"})
+            for nome, valor in _ATRIBUTO_XML.findall(elemento)}
+
+
+def _acrescentar(conteudo, fechamento, elementos):
+    """XML `conteudo` com `elementos` (bytes) inseridos antes da tag de fechamento da raiz."""
+    if not elementos:
+        return conteudo
+    posicao = conteudo.rindex(fechamento)
+    return conteudo[:posicao] + b''.join(elementos) + conteudo[posicao:]
+
+
+def _elemento(nome, **atributos):
+    return ('<' + nome + ''.join(f' {chave}={quoteattr(valor)}' for chave, valor in atributos.items())
+            + '/>').encode('utf-8')
+
+
+def _parte_da_aba(arquivo_zip, aba):
+    """Caminho, dentro do pacote, do XML da aba `aba`."""
+    workbook = ElementTree.fromstring(arquivo_zip.read(ARC_WORKBOOK))
+    relacoes = _relacoes(arquivo_zip, ARC_WORKBOOK)
+    destinos = {rel.get('Id'): rel.get('Target') for rel in relacoes.iter(f'{_NS_PACOTE}Relationship')}
+    for sheet in workbook.iter(f'{_NS_PLANILHA}sheet'):
+        if sheet.get('name') == aba:
+            return _resolver(ARC_WORKBOOK, destinos[sheet.get(f'{_NS_RELACOES}id')])
+    raise KeyError(f"Worksheet {aba} does not exist.")
+
+
+def _nome_livre(parte, usados):
+    """`parte`, ou o mesmo nome com outro número (drawing1.xml -> drawing2.xml) se já usado."""
+    if parte not in usados:
+        return parte
+    base, extensao = posixpath.splitext(parte)
+    base = base.rstrip('0123456789')
+    numero = 1
+    while f'{base}{numero}{extensao}' in usados:
+        numero += 1
+    return f'{base}{numero}{extensao}'
+
+
+class _CopiaPartes:
+    """
+    Partes do pacote de entrada a copiar para o de saída, com as partes
+    relacionadas (desenhos, gráficos, comentários, tabelas...). Uma parte
+    cujo nome já existe na saída é renomeada, e as relações que apontam
+    para ela são reescritas.
+    """
+
+    def __init__(self, origem, usados):
+        self.origem = origem
+        self.nomes_origem = set(origem.namelist())
+        self.usados = usados
+        self.copiadas = {}
+        self.relacoes = {}
+
+    def copiar(self, parte, destino):
+        """Registra a cópia de `parte` (da entrada) em `destino` (na saída)."""
+        self.copiadas[parte] = destino
+        self.usados.add(destino)
+        try:
+            relacoes = self.origem.read(_caminho_relacoes(parte))
+        except KeyError:
+            return destino
+
+        def reescrever(correspondencia):
+            atributos = _atributos(correspondencia.group(0))
+            if atributos.get('TargetMode') == 'External' or 'Target' not in atributos:
+                return correspondencia.group(0)
+            alvo = _resolver(parte, atributos['Target'])
+            if alvo not in self.nomes_origem:
+                return correspondencia.group(0)
+            novo = self.copiadas.get(alvo)
+            if novo is None:
+                novo = self.copiar(alvo, _nome_livre(alvo, self.usados))
+            if novo == alvo and posixpath.dirname(parte) == posixpath.dirname(destino):
+                return correspondencia.group(0)
+            atributos['Target'] = '/' + novo
+            return _elemento('Relationship', **atributos)
+
+        caminho = _caminho_relacoes(destino)
+        self.usados.add(caminho)
+        self.relacoes[caminho] = _RELACAO_XML.sub(reescrever, relacoes)
+        return destino
+
+    def atualizar_tipos(self, tipos_saida):
+        """Acrescenta aos tipos de conteúdo da saída os das partes copiadas."""
+        tipos_origem = ElementTree.fromstring(self.origem.read(ARC_TIPOS))
+        sobrescritos = {tipo.get('PartName'): tipo.get('ContentType')
+                        for tipo in tipos_origem.iter(f'{_NS_TIPOS}Override')}
+        padroes = {tipo.get('Extension').lower(): tipo.get('ContentType')
+                   for tipo in tipos_origem.iter(f'{_NS_TIPOS}Default')}
+        tipos = ElementTree.fromstring(tipos_saida)
+        existentes = {tipo.get('PartName') for tipo in tipos.iter(f'{_NS_TIPOS}Override')}
+        extensoes = {tipo.get('Extension').lower() for tipo in tipos.iter(f'{_NS_TIPOS}Default')}
+        novos = []
+        for parte, destino in self.copiadas.items():
+            tipo = sobrescritos.get('/' + parte)
+            if tipo is not None:
+                if '/' + destino not in existentes:
+                    novos.append(_elemento('Override', PartName='/' + destino, ContentType=tipo))
+                continue
+            extensao = posixpath.splitext(destino)[1].lstrip('.').lower()
+            if extensao not in extensoes and extensao in padroes:
+                novos.append(_elemento('Default', Extension=extensao, ContentType=padroes[extensao]))
+                extensoes.add(extensao)
+        return _acrescentar(tipos_saida, b'</Types>', novos)
+
+
+def _copiar_abas(gerado, origem, abas, destino):
+    """
+    Grava em `destino` o pacote `gerado` (arquivo salvo pelo openpyxl) com o
+    XML das `abas` substituído pelo das abas da entrada (pacote `origem`),
+    copiado byte a byte com as partes relacionadas e as strings
+    compartilhadas da entrada.
+    """
+    with zipfile.ZipFile(gerado) as pacote:
+        copia = _CopiaPartes(origem, set(pacote.namelist()))
+        substituidas = set()
+        for aba in abas:
+            parte = _parte_da_aba(pacote, aba)
+            copia.copiar(_parte_da_aba(origem, aba), parte)
+            substituidas.add(parte)
+
+        relacoes_workbook = pacote.read(_caminho_relacoes(ARC_WORKBOOK))
+        strings = next((_resolver(ARC_WORKBOOK, rel.get('Target'))
+                        for rel in _relacoes(origem, ARC_WORKBOOK).iter(f'{_NS_PACOTE}Relationship')
+                        if rel.get('Type') == _TIPO_STRINGS), None)
+        if abas and strings is not None and strings in copia.nomes_origem:
+            ids = {rel.get('Id') for rel in ElementTree.fromstring(relacoes_workbook)}
+            numero = len(ids) + 1
+            while f'rId{numero}' in ids:
+                numero += 1
+            destino_strings = copia.copiar(strings, _nome_livre('xl/sharedStrings.xml', copia.usados))
+            relacoes_workbook = _acrescentar(relacoes_workbook, b'</Relationships>', [
+                _elemento('Relationship', Type=_TIPO_STRINGS, Target='/' + destino_strings, Id=f'rId{numero}')])
+
+        with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as saida:
+            for info in pacote.infolist():
+                if info.filename in substituidas or info.filename in copia.relacoes:
+                    continue
+                if info.filename == ARC_TIPOS:
+                    saida.writestr(info, copia.atualizar_tipos(pacote.read(info)))
+                elif info.filename == _caminho_relacoes(ARC_WORKBOOK):
+                    saida.writestr(info, relacoes_workbook)
+                else:
+                    saida.writestr(info, pacote.read(info))
+            for parte, parte_saida in copia.copiadas.items():
+                tamanho = origem.getinfo(parte).file_size
+                with origem.open(parte) as leitura, \
+                        saida.open(parte_saida, 'w', force_zip64=tamanho > zipfile.ZIP64_LIMIT) as escrita:
+                    shutil.copyfileobj(leitura, escrita, 1 << 20)
+            for caminho, conteudo in copia.relacoes.items():
+                saida.writestr(caminho, conteudo)
+
+
+def _valor_em_cache(valor):
+    """Atributo de tipo e conteúdo de <v> para o valor calculado de uma fórmula."""
+    codigo = getattr(valor, 'codigo', None)
+    if codigo is not None:
+        return b' t="e"', escape(codigo).encode()
+    if isinstance(valor, bool):
+        return b' t="b"', b'1' if valor else b'0'
+    if isinstance(valor, (int, float)):
+        # + 0.0 troca -0.0 por 0.0
+        return b'', repr(float(valor) + 0.0).encode()
+    return b' t="str"', escape(str(valor)).encode('utf-8')
+
+
+def gravar_valores_em_cache(conteudo, aba, valores):
+    """
+    Devolve o arquivo `conteudo` (bytes de um .xlsx gravado pelo openpyxl)
+    com o valor calculado das fórmulas da aba `aba` preenchido a partir de
+    `valores` ({coordenada: valor}; erros do Excel como objetos com o
+    atributo `codigo`). Células sem valor em `valores` não são alteradas e
+    o Excel continua recalculando as fórmulas ao abrir o arquivo.
+    """
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as origem:
+        parte = _parte_da_aba(origem, aba)
+
+        def preencher(correspondencia):
+            coordenada = correspondencia.group(1).decode()
+            if coordenada not in valores:
+                return correspondencia.group(0)
+            tipo, valor = _valor_em_cache(valores[coordenada])
+            atributos = _ATRIBUTO_TIPO.sub(b'', correspondencia.group(2))
+            return (b'<c r="' + correspondencia.group(1) + b'"' + atributos + tipo + b'><f>'
+                    + correspondencia.group(3) + b'</f><v>' + valor + b'</v></c>')
+
+        saida = io.BytesIO()
+        with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as destino:
+            for info in origem.infolist():
+                dados = origem.read(info)
+                if info.filename == parte:
+                    dados = _CELULA_FORMULA.sub(preencher, dados)
+                destino.writestr(info, dados)
+    return saida.getvalue()
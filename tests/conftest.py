@@ -0,0 +1,129 @@
+import math
+import operator
+import os
+import re
+import shutil
+import zipfile
+from types import SimpleNamespace
+
+import openpyxl
+import pytest
+
+import avaliacao
+from configuracao import configuracao_padrao
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def entrada(tmp_path):
+    """Cópia do arquivo de exemplo entrada.xlsx em um diretório temporário."""
+    caminho = tmp_path / 'entrada.xlsx'
+    shutil.copy(os.path.join(RAIZ, 'entrada.xlsx'), caminho)
+    return str(caminho)
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Configuração padrão sem cache, com o arquivo de cache no diretório temporário."""
+    return configuracao_padrao().alterar({'usar_cache': False, 'caminho_cache': str(tmp_path / 'cache.sqlite'),
+                                          'caminho_metricas': None})
+
+
+COMPARACOES = {'>=': operator.ge, '<=': operator.le, '<>': operator.ne, '>': operator.gt, '<': operator.lt,
+               '=': operator.eq}
+
+
+def _criterio(criterio):
+    """Teste de um critério do SUMIFS ('>=45292', 'Frete', 10) sobre o valor de uma célula."""
+    operador, alvo = '=', criterio
+    if isinstance(criterio, str):
+        operador = next((op for op in COMPARACOES if criterio.startswith(op)), '=')
+        alvo = criterio[len(operador):] if criterio.startswith(operador) else criterio
+        try:
+            alvo = float(alvo)
+        except ValueError:
+            alvo = alvo.lower()
+    comparar = COMPARACOES[operador]
+
+    def testar(valor):
+        if isinstance(alvo, str):
+            return isinstance(valor, str) and comparar(valor.lower(), alvo)
+        return isinstance(valor, (int, float)) and not isinstance(valor, bool) and comparar(valor, alvo)
+    return testar
+
+
+def _somases(avaliador, aba, argumentos):
+    """SUMIFS do Excel, só para avaliar nos testes as fórmulas gravadas nas linhas fontes."""
+    valores = [argumento(avaliador, aba) for argumento in argumentos]
+    soma, intervalos, criterios = valores[0], valores[1::2], [_criterio(c) for c in valores[2::2]]
+    return math.fsum(valor for indice, valor in enumerate(soma)
+                     if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+                     and all(testar(intervalo[indice]) for intervalo, testar in zip(intervalos, criterios)))
+
+
+class AbaAvaliada:
+    """Aba de um arquivo gerado com as fórmulas avaliadas, no formato usado por TabelaDRE.divergencias."""
+
+    def __init__(self, avaliador, aba):
+        self.avaliador = avaliador
+        self.aba = aba
+
+    def cell(self, row, column):
+        valor = self.avaliador.valor(self.aba, row, column)
+        return SimpleNamespace(value=valor.codigo if isinstance(valor, avaliacao.ErroExcel) else valor)
+
+
+@pytest.fixture
+def avaliar_arquivo(monkeypatch):
+    """
+    Função que avalia as fórmulas gravadas em um arquivo gerado, a partir
+    das próprias abas fontes do arquivo, e devolve a aba DRE (AbaAvaliada).
+    """
+    monkeypatch.setitem(avaliacao.FUNCOES, 'SUMIFS', _somases)
+
+    def avaliar(caminho):
+        avaliador = avaliacao.AvaliadorFormulas()
+        wb = openpyxl.load_workbook(caminho)
+        for ws in wb.worksheets:
+            for linha in ws.iter_rows():
+                for celula in linha:
+                    if celula.value is not None:
+                        avaliador.definir(ws.title, celula.row, celula.column, celula.value)
+        return AbaAvaliada(avaliador, avaliacao.ABA_DRE)
+    return avaliar
+
+
+_TEXTO_EM_LINHA = re.compile(rb' t="inlineStr"><is><t(?: [^>]*)?>(.*?)</t></is>', re.S)
+
+
+def _usar_strings_compartilhadas(caminho):
+    with zipfile.ZipFile(caminho) as origem:
+        partes = {info.filename: origem.read(info) for info in origem.infolist()}
+    textos = {}
+
+    def compartilhar(correspondencia):
+        indice = textos.setdefault(correspondencia.group(1), len(textos))
+        return b' t="s"><v>%d</v>' % indice
+
+    for nome in [nome for nome in partes if nome.startswith('xl/worksheets/sheet')]:
+        partes[nome] = _TEXTO_EM_LINHA.sub(compartilhar, partes[nome])
+    partes['xl/sharedStrings.xml'] = (
+        b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        + b''.join(b'<si><t xml:space="preserve">' + texto + b'</t></si>' for texto in textos) + b'</sst>')
+    partes['xl/_rels/workbook.xml.rels'] = partes['xl/_rels/workbook.xml.rels'].replace(
+        b'</Relationships>', b'<Relationship Id="rId99" Target="sharedStrings.xml" Type="http://schemas.'
+        b'openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/></Relationships>')
+    partes['[Content_Types].xml'] = partes['[Content_Types].xml'].replace(
+        b'</Types>', b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-'
+        b'officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+    with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as destino:
+        for nome, conteudo in partes.items():
+            destino.writestr(nome, conteudo)
+
+
+@pytest.fixture
+def usar_strings_compartilhadas():
+    """Função que regrava um arquivo com os textos em xl/sharedStrings.xml, como o Excel grava."""
+    return _usar_strings_compartilhadas
@@ -0,0 +1,57 @@
+import openpyxl
+import pytest
+
+from main import processar_dre
+
+
+def _editar(caminho):
+    """Meses com prejuízo no meio do período e um valor em texto na Folha."""
+    wb = openpyxl.load_workbook(caminho)
+    for linha in wb['Vendas'].iter_rows(min_row=2):
+        if linha[5].value is not None and linha[5].value.month in (6, 7):
+            linha[4].value *= 0.5
+    wb['Folha'].cell(row=2, column=5).value = 'n/d'
+    wb.save(caminho)
+
+
+@pytest.mark.parametrize('modo', ['formulas', 'agregado', 'hibrido', 'valores'])
+def test_avaliador_igual_as_formulas_gravadas(entrada, tmp_path, config, avaliar_arquivo, modo):
+    _editar(entrada)
+    destino = str(tmp_path / 'saida.xlsx')
+    resultado = processar_dre(entrada, destino, modo=modo, valores_em_cache=True, config=config)
+
+    assert resultado.tabela.divergencias(avaliar_arquivo(destino)) == []
+
+
+def test_valores_em_cache_gravados(entrada, tmp_path, config):
+    destino = str(tmp_path / 'saida.xlsx')
+    resultado = processar_dre(entrada, destino, valores_em_cache=True, config=config)
+
+    ws = openpyxl.load_workbook(destino, data_only=True)['DRE']
+    assert resultado.tabela.divergencias(ws) == []
+
+
+@pytest.mark.parametrize('modo', ['valores', 'hibrido', 'agregado'])
+def test_modo_igual_as_formulas_avaliadas(entrada, tmp_path, config, avaliar_arquivo, modo):
+    _editar(entrada)
+    formulas = str(tmp_path / 'formulas.xlsx')
+    destino = str(tmp_path / 'saida.xlsx')
+    processar_dre(entrada, formulas, modo='formulas', config=config)
+    processar_dre(entrada, destino, modo=modo, config=config)
+
+    ws_formulas = openpyxl.load_workbook(formulas)['DRE']
+    ws_saida = openpyxl.load_workbook(destino)['DRE']
+    assert (ws_saida.max_row, ws_saida.max_column) == (ws_formulas.max_row, ws_formulas.max_column)
+    assert not any(isinstance(celula.value, str) and aba in celula.value
+                   for linha in ws_saida.iter_rows() for celula in linha
+                   for aba in ('Vendas!', 'Custo_Despesas!', 'Folha!'))
+
+    esperado, encontrado = avaliar_arquivo(formulas), avaliar_arquivo(destino)
+    for linha in range(1, ws_formulas.max_row + 1):
+        for coluna in range(1, ws_formulas.max_column + 1):
+            valor_formulas = esperado.cell(linha, coluna).value
+            valor_saida = encontrado.cell(linha, coluna).value
+            if isinstance(valor_formulas, (int, float)) and isinstance(valor_saida, (int, float)):
+                assert valor_saida == pytest.approx(valor_formulas, rel=1e-9, abs=1e-6), (linha, coluna)
+            else:
+                assert valor_saida == valor_formulas, (linha, coluna)
@@ -0,0 +1,33 @@
+import numpy as np
+import openpyxl
+
+from main import abrir_cache_padrao, gerar_dre, processar_dre
+
+
+def _alterar_venda(caminho, linha, acrescimo):
+    wb = openpyxl.load_workbook(caminho)
+    celula = wb['Vendas'].cell(row=linha, column=5)
+    celula.value += acrescimo
+    wb.save(caminho)
+
+
+def test_cache_desligado_por_padrao(config):
+    assert abrir_cache_padrao(config) is None
+    assert abrir_cache_padrao(config.alterar({'usar_cache': True})) is not None
+
+
+def test_cache_apos_alteracao_igual_a_execucao_sem_cache(entrada, tmp_path, config):
+    destino = str(tmp_path / 'saida.xlsx')
+    primeira = gerar_dre(entrada, caminho_saida=destino, usar_cache=True, valores_em_cache=True, config=config)
+    assert not primeira.em_cache
+    assert gerar_dre(entrada, caminho_saida=destino, usar_cache=True, valores_em_cache=True,
+                     config=config).em_cache
+
+    _alterar_venda(entrada, 10, 5000)
+    com_cache = gerar_dre(entrada, caminho_saida=destino, usar_cache=True, valores_em_cache=True, config=config)
+    assert not com_cache.em_cache
+    sem_cache = processar_dre(entrada, str(tmp_path / 'referencia.xlsx'), valores_em_cache=True, config=config)
+
+    assert com_cache.tabela.chaves == sem_cache.tabela.chaves
+    np.testing.assert_allclose(com_cache.tabela.como_array(), sem_cache.tabela.como_array())
+    assert not np.allclose(com_cache.tabela.como_array(), primeira.tabela.como_array(), equal_nan=True)
@@ -0,0 +1,36 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+from cenarios import Cenario, grade, ler_variacao
+from main import simular_cenarios
+
+
+@pytest.mark.parametrize('texto, mensagem', [
+    ('taxa_imposto=34,abc', "Valor inválido para taxa_imposto: 'abc'"),
+    ('taxa_imposto=nan', "Valor inválido para taxa_imposto: 'nan'"),
+    ('taxa_imposto=-5', 'taxa_imposto deve estar entre 0 e 100'),
+    ('limite_compensacao_prejuizo=30,150', 'limite_compensacao_prejuizo deve estar entre 0 e 100'),
+    ('vida_util_padrao=0', 'vida_util_padrao deve ser maior que 0'),
+    ('vida_util_ativos.Software=-3', "vida_util_ativos['Software'] deve ser maior que 0"),
+])
+def test_variacao_invalida(config, texto, mensagem):
+    with pytest.raises(ValueError, match=re.escape(mensagem)):
+        ler_variacao(texto, config)
+
+
+def test_cenario_invalido_rejeitado_antes_da_leitura(tmp_path, config):
+    destino = str(tmp_path / 'cenarios.xlsx')
+    with pytest.raises(ValueError, match=r'Cenário inválido \(vida_util_padrao=0\)'):
+        simular_cenarios(str(tmp_path / 'inexistente.xlsx'), [Cenario({}), Cenario({'vida_util_padrao': 0})],
+                         destino, config)
+    assert not os.path.exists(destino)
+
+
+def test_cenarios_validos(entrada, tmp_path, config):
+    variacoes = dict([ler_variacao('taxa_imposto=0,34,100', config), ler_variacao('vida_util_padrao=1,10', config)])
+    tabela = simular_cenarios(entrada, grade(variacoes), str(tmp_path / 'cenarios.xlsx'), config)
+    for serie in tabela.series.values():
+        assert np.isfinite(serie).all()
@@ -0,0 +1,98 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import configuracao
+from configuracao import Configuracao, carregar_configuracao, configuracao_padrao, ler_definicao
+
+
+def _gravar(caminho, valores, mtime_ns=None):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(valores, arquivo)
+    if mtime_ns is not None:
+        os.utime(caminho, ns=(mtime_ns, mtime_ns))
+    return str(caminho)
+
+
+def test_chaves_ausentes_no_arquivo_ficam_com_o_padrao(tmp_path):
+    config = carregar_configuracao(_gravar(tmp_path / 'dre.json', {'taxa_imposto': 25}))
+    padrao = configuracao_padrao()
+    assert config.taxa_imposto == 25
+    assert config.vida_util_padrao == padrao.vida_util_padrao
+    assert config.origem == str(tmp_path / 'dre.json')
+
+
+def test_chave_desconhecida_rejeitada(tmp_path):
+    with pytest.raises(ValueError, match='desconhecido.*taxa_impostos'):
+        carregar_configuracao(_gravar(tmp_path / 'dre.json', {'taxa_impostos': 25}))
+    with pytest.raises(ValueError, match='desconhecido: taxa_impostos'):
+        configuracao_padrao().alterar({'taxa_impostos': 25})
+
+
+def test_chave_ausente_rejeitada_na_validacao():
+    valores = configuracao_padrao().como_dict()
+    del valores['modo_dre']
+    with pytest.raises(ValueError, match='ausente.*modo_dre'):
+        Configuracao(valores)
+
+
+def test_cache_invalidado_por_mtime_e_tamanho(tmp_path):
+    caminho = _gravar(tmp_path / 'dre.json', {'taxa_imposto': 25}, mtime_ns=1_000_000_000)
+    primeira = carregar_configuracao(caminho)
+    assert carregar_configuracao(caminho) is primeira
+
+    # Mesmo tamanho, nova data de modificação
+    _gravar(caminho, {'taxa_imposto': 26}, mtime_ns=2_000_000_000)
+    segunda = carregar_configuracao(caminho)
+    assert segunda is not primeira and segunda.taxa_imposto == 26
+
+    # Mesma data de modificação, novo tamanho
+    _gravar(caminho, {'taxa_imposto': 26.5}, mtime_ns=2_000_000_000)
+    terceira = carregar_configuracao(caminho)
+    assert terceira is not segunda and terceira.taxa_imposto == 26.5
+    assert configuracao._cache[os.path.abspath(caminho)][1] is terceira
+
+
+def test_definir_com_chave_pontuada():
+    padrao = configuracao_padrao()
+    definicoes = dict(ler_definicao(texto) for texto in (
+        'vida_util_ativos.Software=2', 'vida_util_ativos.Servidor=4', 'taxa_imposto=15.5', 'modo_dre=valores'))
+    config = carregar_configuracao(definicoes=definicoes)
+
+    assert dict(config.vida_util_ativos) == {**padrao.vida_util_ativos, 'Software': 2, 'Servidor': 4}
+    assert (config.taxa_imposto, config.modo_dre) == (15.5, 'valores')
+    assert padrao.vida_util_ativos['Software'] == 5 and 'Servidor' not in padrao.vida_util_ativos
+
+    with pytest.raises(ValueError, match='não aceita itens'):
+        padrao.alterar({'taxa_imposto.x': 1})
+    with pytest.raises(ValueError, match='vida_util_ativos'):
+        padrao.alterar({'vida_util_ativos.Software': 0})
+
+
+def test_configuracao_imutavel():
+    config = configuracao_padrao()
+    with pytest.raises(AttributeError, match='imutável'):
+        config.taxa_imposto = 10
+    with pytest.raises(AttributeError, match='imutável'):
+        del config.taxa_imposto
+    with pytest.raises(TypeError):
+        config.vida_util_ativos['Software'] = 3
+
+    copia = config.como_dict()
+    copia['vida_util_ativos']['Software'] = 3
+    assert config.vida_util_ativos['Software'] == 5
+
+
+def test_pickle_para_o_pool_de_processos(tmp_path):
+    config = carregar_configuracao(_gravar(tmp_path / 'dre.json', {'taxa_imposto': 25}),
+                                   {'vida_util_ativos.Software': 3})
+    copia = pickle.loads(pickle.dumps(config))
+
+    assert isinstance(copia, Configuracao)
+    assert copia.como_dict() == config.como_dict()
+    assert copia.origem == config.origem
+    assert copia.vida_util_ativos['Software'] == 3
+    with pytest.raises(AttributeError):
+        copia.taxa_imposto = 10
@@ -0,0 +1,80 @@
+import shutil
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+
+from avaliacao import avaliar_dre
+from consolidacao import consolidar
+from datas import indice_mes
+from impostos import LINHAS_PREJUIZO, compensar_prejuizo
+from main import agregar_entidade, compilar_plano_dre, consolidar_dre, processar_dre
+
+
+# Colunas de data das abas fontes (1 = A)
+COLUNAS_DATA = {'Vendas': 6, 'Custo_Despesas': 3, 'Folha': 1, 'Investimentos': 1}
+
+
+def _deslocar_datas(origem, destino, meses):
+    """Cópia de `origem` com todas as datas das abas fontes `meses` meses depois."""
+    wb = openpyxl.load_workbook(origem)
+    for aba, coluna in COLUNAS_DATA.items():
+        for (celula,) in wb[aba].iter_rows(min_row=2, min_col=coluna, max_col=coluna):
+            if isinstance(celula.value, datetime):
+                mes = celula.value.month - 1 + meses
+                celula.value = celula.value.replace(year=celula.value.year + mes // 12, month=mes % 12 + 1)
+    wb.save(destino)
+
+
+def test_consolidacao_de_entidades_com_periodos_disjuntos(entrada, tmp_path, config):
+    caminhos = [str(tmp_path / 'matriz.xlsx'), str(tmp_path / 'filial.xlsx')]
+    shutil.copy(entrada, caminhos[0])
+    _deslocar_datas(entrada, caminhos[1], 24)
+
+    individuais = [processar_dre(caminho, str(tmp_path / f'dre_{indice}.xlsx'), modo='valores',
+                                 valores_em_cache=True, config=config)
+                   for indice, caminho in enumerate(caminhos)]
+    assert [resultado.data_inicial for resultado in individuais] == ['2024-01-01', '2026-01-01']
+    assert individuais[0].num_meses == individuais[1].num_meses == 13
+
+    resultado = consolidar_dre(caminhos, str(tmp_path / 'consolidado.xlsx'), workers=1, config=config)
+    # Eixo comum: união dos períodos, com os meses sem dados entre eles
+    assert (resultado.data_inicial, resultado.num_meses) == ('2024-01-01', 37)
+
+    plano = compilar_plano_dre(resultado.num_meses, config)
+    mes_inicial = indice_mes(datetime(2024, 1, 1))
+    limite, taxa = config.limite_compensacao_prejuizo / 100, config.taxa_imposto / 100
+    entidades = [agregar_entidade(caminho, config) for caminho in caminhos]
+    consolidacao = consolidar(entidades, plano, resultado.data_inicial, mes_inicial, limite, taxa)
+    assert consolidacao.nomes == ['matriz', 'filial']
+
+    # Cada entidade, no seu próprio período, igual à sua DRE individual
+    for indice, (individual, deslocamento) in enumerate(zip(individuais, (0, 24))):
+        series = consolidacao.entidade(indice)
+        janela = slice(deslocamento, deslocamento + individual.num_meses)
+        for chave, serie in series.items():
+            np.testing.assert_allclose(serie[janela], individual.tabela.serie(chave), err_msg=chave)
+        fora = np.ones(resultado.num_meses, dtype=bool)
+        fora[janela] = False
+        assert not series['receita'][fora].any()
+
+    # Consolidada: soma das linhas por entidade
+    consolidada = consolidacao.consolidada()
+    for chave, serie in consolidacao.series.items():
+        np.testing.assert_allclose(consolidada[chave], serie[0] + serie[1], err_msg=chave)
+
+    # Prejuízo compensado por entidade e depois somado, não sobre o EBT somado
+    ebt = np.stack([_ebt(plano, resultado.data_inicial, consolidacao.entidade(indice)) for indice in (0, 1)])
+    for indice, (individual, deslocamento) in enumerate(zip(individuais, (0, 24))):
+        np.testing.assert_allclose(ebt[indice, deslocamento:deslocamento + 13], individual.tabela.serie('ebt'))
+    por_entidade = compensar_prejuizo(ebt, limite, taxa)
+    sobre_soma = compensar_prejuizo(ebt.sum(axis=0, keepdims=True), limite, taxa)
+    for chave in LINHAS_PREJUIZO:
+        np.testing.assert_allclose(consolidacao.series[chave], por_entidade[chave], err_msg=chave)
+        np.testing.assert_allclose(consolidada[chave], por_entidade[chave].sum(axis=0), err_msg=chave)
+    assert not np.allclose(consolidada['impostos'], sobre_soma['impostos'][0])
+
+
+def _ebt(plano, data_inicial, series):
+    tabela = avaliar_dre(plano, data_inicial, series, 0.0 - series['depreciacao'], chaves=('ebt',))
+    return tabela.como_array()[tabela.chaves.index('ebt')]
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import numpy as np
+
+from datas import indice_mes
+from depreciacao import ler_investimentos, matriz_depreciacao, total_depreciacao
+from ingestao import AbaFonte
+
+
+VIDA_UTIL = {'Computador': 1, 'Veículo': 5}
+
+# (data, descrição, valor) na ordem da aba Investimentos
+LANCAMENTOS = [
+    (datetime(2020, 1, 10), 'Computador', 5000.0),        # totalmente depreciado antes da DRE
+    (datetime(2023, 3, 20), 'Computador', 1200.0),        # vida útil termina em mar/24
+    (datetime(2024, 2, 15), 'Equipamento Novo', 2400.0),  # descrição desconhecida: vida útil padrão
+    (datetime(2024, 6, 1), 'Veículo', 0),                 # sem valor: ignorado
+    (datetime(2024, 12, 5), 'Computador', 600.0),         # comprado no último mês da DRE
+]
+
+
+def _aba_investimentos(lancamentos):
+    aba = AbaFonte('Investimentos', ('data', 'descricao', 'valor'))
+    for data, descricao, valor in lancamentos:
+        aba.colunas['data'].append(data)
+        aba.colunas['descricao'].append(descricao)
+        aba.colunas['valor'].append(valor)
+    aba.ultima_linha = aba.primeira_linha + len(lancamentos) - 1
+    return aba
+
+
+def test_total_depreciacao_igual_ao_calculo_manual():
+    investimentos = ler_investimentos(_aba_investimentos(LANCAMENTOS), VIDA_UTIL, vida_util_padrao=2)
+    assert len(investimentos) == 4
+    np.testing.assert_allclose(investimentos.vidas_uteis, [1, 1, 2, 1])
+
+    # jan/24 a jan/25: 1200/12 = 100 de abr/23 a mar/24; 2400/24 = 100 a partir de mar/24;
+    # 600/12 = 50 a partir de jan/25
+    esperado = [100, 100, 200, 100, 100, 100, 100, 100, 100, 100, 100, 100, 150]
+    mes_inicial = indice_mes(datetime(2024, 1, 1))
+    np.testing.assert_allclose(total_depreciacao(investimentos, mes_inicial, 13), esperado)
+    np.testing.assert_allclose(total_depreciacao(investimentos, mes_inicial, 12), esperado[:12])
+
+    matriz = matriz_depreciacao(investimentos, mes_inicial, 13)
+    assert not matriz[0].any()
+    assert not matriz[3, :12].any()
+    np.testing.assert_allclose(matriz.sum(axis=1), [0, 300, 1100, 50])
+
+
+def test_leitura_para_na_primeira_linha_sem_data():
+    lancamentos = LANCAMENTOS[1:2] + [(None, 'Computador', 100.0)] + LANCAMENTOS[2:]
+    investimentos = ler_investimentos(_aba_investimentos(lancamentos), VIDA_UTIL, vida_util_padrao=2)
+    assert investimentos.descricoes == ['Computador']
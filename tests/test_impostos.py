@@ -0,0 +1,94 @@
+import numpy as np
+import openpyxl
+import pytest
+
+from avaliacao import avaliar_dre
+from impostos import LINHAS_PREJUIZO, compensar_prejuizo
+from layout import COLUNA_INICIAL
+from main import compilar_plano_dre, processar_dre
+
+
+# Sequências de EBT com prejuízos e lucros que cruzam o limite de compensação
+SEQUENCIAS = [
+    [-100.0, 50.0, 300.0, -20.0, 10.0, 1000.0],
+    [-75303.0, -10632.0, 45999.0, 8804.0, 56104.0, 117675.0, 77184.0, 139505.0],
+    [500.0, -200.0, 100.0, 100.0, -50.0, 0.0, 900.0, -1000.0],
+    [100.0, 200.0, 0.0, 300.0],
+    [-10.0, -20.0, -30.0],
+]
+
+
+def _compensar_serial(ebt, limite, taxa, saldo_inicial=0.0):
+    """Cadeia mês a mês das fórmulas da DRE, em Python."""
+    linhas = {chave: [] for chave in LINHAS_PREJUIZO}
+    saldo = saldo_inicial
+    for valor in ebt:
+        prejuizo, lucro = max(-valor, 0.0), max(valor, 0.0)
+        utilizado = min(limite * lucro, saldo) if lucro > 0 else 0.0
+        linhas['prejuizo_inicio'].append(-saldo)
+        saldo = saldo + prejuizo - utilizado
+        linhas['prejuizo_adquirido'].append(-prejuizo)
+        linhas['prejuizo_utilizado'].append(utilizado)
+        linhas['prejuizo_final'].append(-saldo)
+        linhas['base_calculo'].append(lucro - utilizado)
+        linhas['impostos'].append(-(lucro - utilizado) * taxa)
+    return linhas
+
+
+@pytest.mark.parametrize('ebt', SEQUENCIAS)
+@pytest.mark.parametrize('limite', [0.0, 0.3, 1.0])
+def test_forma_fechada_igual_a_cadeia_serial(ebt, limite):
+    calculado = compensar_prejuizo(ebt, limite, 0.34)
+    esperado = _compensar_serial(ebt, limite, 0.34)
+    for chave in LINHAS_PREJUIZO:
+        np.testing.assert_allclose(calculado[chave], esperado[chave], atol=1e-9, err_msg=chave)
+
+
+def test_forma_fechada_por_entidade_com_saldo_inicial():
+    ebt = np.array([SEQUENCIAS[0], SEQUENCIAS[2][:6], [-5.0, 5.0, 5.0, 5.0, 5.0, 5.0]])
+    limites = np.array([[0.3], [0.5], [1.0]])
+    taxas = np.array([[0.34], [0.15], [0.25]])
+    saldos = np.array([0.0, 120.0, 40.0])
+
+    calculado = compensar_prejuizo(ebt, limites, taxas, saldos)
+    for i in range(len(ebt)):
+        esperado = _compensar_serial(ebt[i], limites[i, 0], taxas[i, 0], saldos[i])
+        for chave in LINHAS_PREJUIZO:
+            np.testing.assert_allclose(calculado[chave][i], esperado[chave], atol=1e-9, err_msg=chave)
+
+
+@pytest.mark.parametrize('ebt', SEQUENCIAS)
+def test_forma_fechada_igual_as_formulas_da_dre(config, ebt):
+    config = config.alterar({'taxa_imposto': 34, 'limite_compensacao_prejuizo': 30})
+    plano = compilar_plano_dre(len(ebt), config)
+    tabela = avaliar_dre(plano, '2024-01-01', {'receita': ebt})
+    np.testing.assert_allclose(tabela.serie('ebt'), ebt)
+
+    calculado = compensar_prejuizo(ebt, 0.3, 0.34)
+    for chave in LINHAS_PREJUIZO:
+        np.testing.assert_allclose(calculado[chave], tabela.serie(chave), atol=1e-9, err_msg=chave)
+
+
+def test_modo_valores_igual_as_formulas_gravadas(entrada, tmp_path, config, avaliar_arquivo):
+    # Prejuízo em janeiro e fevereiro e de novo em junho e julho
+    wb = openpyxl.load_workbook(entrada)
+    for linha in wb['Vendas'].iter_rows(min_row=2):
+        if linha[5].value is not None and linha[5].value.month in (6, 7):
+            linha[4].value *= 0.5
+    wb.save(entrada)
+
+    formulas = str(tmp_path / 'formulas.xlsx')
+    processar_dre(entrada, formulas, config=config)
+    valores = str(tmp_path / 'valores.xlsx')
+    resultado = processar_dre(entrada, valores, config=config.alterar({'modo_prejuizo': 'valores'}))
+
+    plano = resultado.tabela.plano
+    colunas = range(COLUNA_INICIAL, COLUNA_INICIAL + plano.num_colunas)
+    ws_valores = openpyxl.load_workbook(valores)['DRE']
+    ws_formulas = avaliar_arquivo(formulas)
+    assert min(resultado.tabela.serie('ebt')[5:7]) < 0
+    for chave in LINHAS_PREJUIZO:
+        linha = plano.linha(chave)
+        gravados = [ws_valores.cell(row=linha, column=coluna).value for coluna in colunas]
+        avaliados = [ws_formulas.cell(row=linha, column=coluna).value for coluna in colunas]
+        np.testing.assert_allclose(gravados, avaliados, atol=1e-6, err_msg=chave)
@@ -0,0 +1,125 @@
+import datetime
+import logging
+import zipfile
+
+import numpy as np
+import openpyxl
+import pytest
+
+import ingestao
+from datas import indice_mes
+from ingestao import ler_fontes
+from main import gerar_dre, processar_dre
+
+
+def _editar_vendas(caminho, alteracoes=(), novas=(), remover=None):
+    wb = openpyxl.load_workbook(caminho)
+    ws = wb['Vendas']
+    for linha, acrescimo in alteracoes:
+        ws.cell(row=linha, column=5).value += acrescimo
+    if remover is not None:
+        ws.delete_rows(remover)
+    for valor, mes in novas:
+        ws.append(['Cliente Novo', 'Produto A', 1, valor, valor, mes])
+    wb.save(caminho)
+
+
+def _comparar_com_execucao_completa(resultado, entrada, tmp_path, config):
+    referencia = processar_dre(entrada, str(tmp_path / 'referencia.xlsx'), valores_em_cache=True, config=config)
+    assert resultado.tabela.chaves == referencia.tabela.chaves
+    np.testing.assert_allclose(resultado.tabela.como_array(), referencia.tabela.como_array())
+    return referencia
+
+
+@pytest.mark.parametrize('edicao', [
+    {'novas': [(1234.5, datetime.datetime(2024, 12, 1))]},
+    {'alteracoes': [(10, 5000)], 'novas': [(1234.5, datetime.datetime(2024, 12, 1))]},
+    {'remover': 10, 'novas': [(1234.5, datetime.datetime(2024, 12, 1))]},
+    {'alteracoes': [(10, 5000)]},
+])
+def test_incremental_igual_a_execucao_completa(entrada, tmp_path, config, edicao):
+    destino = str(tmp_path / 'saida.xlsx')
+    anterior = gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+
+    _editar_vendas(entrada, **edicao)
+    resultado = gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+
+    assert not resultado.em_cache
+    _comparar_com_execucao_completa(resultado, entrada, tmp_path, config)
+    assert not np.allclose(resultado.tabela.como_array(), anterior.tabela.como_array(), equal_nan=True)
+
+
+def test_incremental_linha_antiga_alterada_receita_de_janeiro(entrada, tmp_path, config):
+    destino = str(tmp_path / 'saida.xlsx')
+    anterior = gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+    wb = openpyxl.load_workbook(entrada, read_only=True)
+    assert wb['Vendas'].cell(row=10, column=6).value == datetime.datetime(2024, 1, 1)
+    wb.close()
+
+    _editar_vendas(entrada, alteracoes=[(10, 5000)], novas=[(100.0, datetime.datetime(2024, 1, 1))])
+    resultado = gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+
+    assert resultado.tabela.serie('receita')[0] == pytest.approx(anterior.tabela.serie('receita')[0] + 5100)
+    _comparar_com_execucao_completa(resultado, entrada, tmp_path, config)
+
+
+@pytest.mark.parametrize('tamanho_bloco', [ingestao.TAMANHO_BLOCO_XML, 300])
+def test_leitura_apos_marca_igual_a_leitura_completa(entrada, monkeypatch, tamanho_bloco):
+    monkeypatch.setattr(ingestao, 'TAMANHO_BLOCO_XML', tamanho_bloco)
+    completa = ler_fontes(entrada, marcas={'Vendas': (0, 2)})
+    parcial = ler_fontes(entrada, marcas={'Vendas': (100, 91)})
+    vendas = parcial['Vendas']
+
+    wb = openpyxl.load_workbook(entrada, read_only=True)
+    linhas = wb['Vendas'].iter_rows(min_row=101, min_col=5, max_col=6, values_only=True)
+    novas = [(indice_mes(data), valor) for valor, data in linhas
+             if isinstance(data, datetime.datetime) and isinstance(valor, (int, float))]
+    wb.close()
+    assert (vendas.primeira_linha, vendas.ultima_linha) == (91, completa['Vendas'].ultima_linha)
+    assert vendas.transacoes.meses.tolist() == [mes for mes, _ in novas]
+    assert vendas.transacoes.valores.tolist() == [valor for _, valor in novas]
+    leitura = parcial.leituras['Vendas']
+    assert leitura.suportada and leitura.ultima == completa.leituras['Vendas'].ultima
+    assert leitura.hash_final == completa.leituras['Vendas'].hash_final
+    assert leitura.hash_marca != completa.leituras['Vendas'].hash_marca
+
+
+def test_incremental_sobre_a_entrada_le_so_as_linhas_novas(entrada, config, tmp_path, caplog):
+    # O XML das abas passa a ser o que o openpyxl grava ao editar o arquivo
+    _editar_vendas(entrada)
+    gerar_dre(entrada, caminho_saida=entrada, incremental=True, valores_em_cache=True, config=config)
+    _editar_vendas(entrada, novas=[(1234.5, datetime.datetime(2024, 12, 1))])
+
+    with caplog.at_level(logging.INFO, logger='dre'):
+        resultado = gerar_dre(entrada, caminho_saida=entrada, incremental=True, valores_em_cache=True,
+                              config=config)
+
+    assert "Aba 'Vendas': 1 linha(s) nova(s)" in caplog.text
+    assert "Aba 'Custo_Despesas': 0 linha(s) nova(s)" in caplog.text
+    assert 'alteradas' not in caplog.text
+    _comparar_com_execucao_completa(resultado, entrada, tmp_path, config)
+
+
+def test_incremental_texto_compartilhado_alterado(entrada, config, tmp_path, caplog, usar_strings_compartilhadas):
+    usar_strings_compartilhadas(entrada)
+    destino = str(tmp_path / 'saida.xlsx')
+    gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+
+    # Só o texto compartilhado muda: o XML das linhas continua o mesmo
+    wb = openpyxl.load_workbook(entrada, read_only=True)
+    categoria = wb['Custo_Despesas'].cell(row=2, column=1).value
+    wb.close()
+    with zipfile.ZipFile(entrada) as pacote:
+        partes = {nome: pacote.read(nome) for nome in pacote.namelist()}
+    antigo, novo = f'>{categoria}</t>'.encode(), f'>{categoria} (revisada)</t>'.encode()
+    assert partes['xl/sharedStrings.xml'].count(antigo) == 1
+    partes['xl/sharedStrings.xml'] = partes['xl/sharedStrings.xml'].replace(antigo, novo)
+    with zipfile.ZipFile(entrada, 'w', zipfile.ZIP_DEFLATED) as pacote:
+        for nome, dados in partes.items():
+            pacote.writestr(nome, dados)
+
+    with caplog.at_level(logging.WARNING, logger='dre'):
+        resultado = gerar_dre(entrada, caminho_saida=destino, incremental=True, valores_em_cache=True, config=config)
+
+    assert 'alteradas em: Custo_Despesas.' in caplog.text
+    _comparar_com_execucao_completa(resultado, entrada, tmp_path, config)
@@ -0,0 +1,141 @@
+import csv
+from datetime import date, datetime
+
+import numpy as np
+import openpyxl
+import pytest
+
+import ingestao
+from ingestao import ABAS_COMPACTAS, ABAS_EXTERNAS, _converter_data, _converter_numero, ler_aba_externa, ler_fontes
+from main import processar_dre
+from modelo import AbaCompacta
+
+
+def _numero_br(valor):
+    """Número no formato '1.234.567,89', sem perder dígitos."""
+    inteiro, _, fracao = repr(float(valor)).partition('.')
+    sinal, inteiro = ('-', inteiro[1:]) if inteiro.startswith('-') else ('', inteiro)
+    grupos = []
+    while inteiro:
+        grupos.insert(0, inteiro[-3:])
+        inteiro = inteiro[:-3]
+    return f"{sinal}{'.'.join(grupos)},{fracao}"
+
+
+def _texto_csv(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return _numero_br(valor)
+    return '' if valor is None else str(valor)
+
+
+def _exportar(entrada, diretorio, formato):
+    """Exporta as abas fontes externas do arquivo, com as colunas nas posições da aba."""
+    wb = openpyxl.load_workbook(entrada, read_only=True)
+    caminhos = {}
+    for aba in ABAS_EXTERNAS:
+        linhas = [list(linha) for linha in wb[aba].iter_rows(values_only=True)]
+        caminho = str(diretorio / f'{aba}.{formato}')
+        if formato == 'csv':
+            with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+                csv.writer(arquivo, delimiter=';').writerows([[_texto_csv(v) for v in linha] for linha in linhas])
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            cabecalho = [str(nome) for nome in linhas[0]]
+            colunas = list(zip(*linhas[1:]))
+            pq.write_table(pa.table({nome: list(coluna) for nome, coluna in zip(cabecalho, colunas)}), caminho)
+        caminhos[aba] = caminho
+    wb.close()
+    return caminhos
+
+
+@pytest.mark.parametrize('formato', ['csv', 'parquet'])
+def test_dre_com_fontes_externas_igual_ao_xlsx(entrada, tmp_path, config, formato):
+    if formato == 'parquet':
+        pytest.importorskip('pyarrow')
+    externas = _exportar(entrada, tmp_path, formato)
+    config = config.alterar({'csv_delimitador': ';', 'csv_separador_decimal': ','})
+
+    referencia = processar_dre(entrada, str(tmp_path / 'xlsx.xlsx'), modo='valores', valores_em_cache=True,
+                               config=config)
+    resultado = processar_dre(entrada, str(tmp_path / 'externas.xlsx'), modo='valores', externas=externas,
+                              valores_em_cache=True, config=config)
+
+    assert (resultado.data_inicial, resultado.num_meses) == (referencia.data_inicial, referencia.num_meses)
+    assert resultado.tabela.chaves == referencia.tabela.chaves
+    np.testing.assert_allclose(resultado.tabela.como_array(), referencia.tabela.como_array())
+    assert resultado.datas_invalidas == referencia.datas_invalidas
+
+
+@pytest.mark.parametrize('texto, decimal, esperado', [
+    ('1.234.567,89', ',', 1234567.89),
+    ('-1.000,5', ',', -1000.5),
+    ('12,5', ',', 12.5),
+    (' 1.000 ', ',', 1000.0),
+    ('1234.5', '.', 1234.5),
+    ('', ',', None),
+    ('n/d', ',', 'n/d'),
+    (1500, ',', 1500),
+])
+def test_converter_numero(texto, decimal, esperado):
+    assert _converter_numero(texto, decimal) == esperado
+
+
+def test_converter_data_rejeita_textos_que_nao_sao_datas():
+    coluna = ('Vendas', 'data')
+    assert _converter_data('2024-03-15', coluna) == datetime(2024, 3, 15)
+    assert _converter_data(date(2024, 3, 15), coluna) == datetime(2024, 3, 15)
+    assert _converter_data('  ', coluna) is None
+    for texto in ('n/d', '2024-13-45', '31/02/2024'):
+        assert _converter_data(texto, coluna) == texto
+
+
+def test_datas_em_texto_invalidas_informadas_na_varredura(entrada, tmp_path, config):
+    caminho = tmp_path / 'vendas.csv'
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['Cliente', 'Produto', 'Quantidade', 'Preço', 'Valor', 'Data'])
+        escritor.writerow(['A', 'P', 1, 100, '1000.5', '2024-01-10'])
+        escritor.writerow(['B', 'P', 1, 100, '250', 'ontem'])
+        escritor.writerow(['C', 'P', 1, 100, '300', '2024-02-30'])
+        escritor.writerow(['D', 'P', 1, 100, '400', '2024-02-05'])
+
+    blocos = list(ler_aba_externa(str(caminho), 'Vendas'))
+    assert blocos[0].coluna('data') == [datetime(2024, 1, 10), 'ontem', '2024-02-30', datetime(2024, 2, 5)]
+    assert blocos[0].coluna('valor') == [1000.5, 250.0, 300.0, 400.0]
+
+    resultado = processar_dre(entrada, str(tmp_path / 'saida.xlsx'), modo='valores', externas={'Vendas': str(caminho)},
+                              valores_em_cache=True, config=config)
+    assert [(aba, linha, valor) for aba, linha, valor in resultado.datas_invalidas if aba == 'Vendas'] == \
+        [('Vendas', 3, 'ontem'), ('Vendas', 4, '2024-02-30')]
+    receita = resultado.tabela.serie('receita')
+    assert (receita[0], receita[1]) == (1000.5, 400.0)
+
+
+def test_leitura_em_blocos_igual_a_leitura_em_um_bloco(entrada, tmp_path, config, monkeypatch):
+    wb = openpyxl.load_workbook(entrada)
+    wb['Vendas'].cell(row=5, column=6).value = 'ontem'
+    wb.save(entrada)
+    referencia = processar_dre(entrada, str(tmp_path / 'um_bloco.xlsx'), modo='valores', valores_em_cache=True,
+                               config=config)
+    um_bloco = ler_fontes(entrada)
+
+    monkeypatch.setattr(ingestao, 'LINHAS_POR_BLOCO', 7)
+    resultado = processar_dre(entrada, str(tmp_path / 'blocos.xlsx'), modo='valores', valores_em_cache=True,
+                              config=config)
+    em_blocos = ler_fontes(entrada)
+
+    assert resultado.tabela.chaves == referencia.tabela.chaves
+    np.testing.assert_allclose(resultado.tabela.como_array(), referencia.tabela.como_array())
+    assert ('Vendas', 5, 'ontem') in resultado.datas_invalidas
+    assert resultado.datas_invalidas == referencia.datas_invalidas
+    for aba in ABAS_COMPACTAS:
+        # Só as transações que contam ficam na memória, 16 bytes cada
+        assert isinstance(em_blocos[aba], AbaCompacta)
+        transacoes = em_blocos[aba].transacoes
+        assert transacoes.nbytes <= 16 * len(transacoes) and (transacoes.meses >= 0).all()
+        assert em_blocos[aba].datas == um_bloco[aba].datas
+        assert em_blocos[aba].ultima_linha == um_bloco[aba].ultima_linha
+    assert em_blocos['Custo_Despesas'].transacoes.tabela.chaves == um_bloco['Custo_Despesas'].transacoes.tabela.chaves
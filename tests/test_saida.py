@@ -0,0 +1,98 @@
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.comments import Comment
+from openpyxl.workbook.defined_name import DefinedName
+
+from main import processar_dre
+from saida import _parte_da_aba
+
+
+def test_streaming_mantem_nomes_definidos(entrada, tmp_path, config):
+    wb = openpyxl.load_workbook(entrada)
+    wb.defined_names['global_vendas'] = DefinedName('global_vendas', attr_text='Vendas!$F$2')
+    wb['Vendas'].defined_names['local_vendas'] = DefinedName('local_vendas', attr_text='Vendas!$E$2:$E$5')
+    wb.save(entrada)
+
+    destino = str(tmp_path / 'saida.xlsx')
+    processar_dre(entrada, destino, streaming=True, config=config)
+
+    saida = openpyxl.load_workbook(destino)
+    assert saida.defined_names['global_vendas'].attr_text == 'Vendas!$F$2'
+    local = saida['Vendas'].defined_names['local_vendas']
+    assert local.attr_text == 'Vendas!$E$2:$E$5'
+    assert local.localSheetId == saida.sheetnames.index('Vendas')
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_estilos_dre_usam_fonte_padrao_do_workbook(entrada, tmp_path, config, streaming):
+    destino = str(tmp_path / 'saida.xlsx')
+    processar_dre(entrada, destino, streaming=streaming, config=config)
+
+    ws = openpyxl.load_workbook(destino)['DRE']
+    for coordenada in ('A3', 'B5', 'D3', 'D5'):
+        fonte = ws[coordenada].font
+        assert (fonte.name, fonte.sz) == ('Calibri', 11)
+
+
+def _celulas(ws):
+    return [[(celula.value, repr(celula.font), repr(celula.fill), repr(celula.border), repr(celula.alignment),
+              celula.number_format) for celula in linha] for linha in ws.iter_rows()]
+
+
+def test_streaming_copia_abas_nao_modificadas_do_pacote(entrada, tmp_path, config, usar_strings_compartilhadas):
+    wb = openpyxl.load_workbook(entrada)
+    wb['DFC']['A1'].comment = Comment('Comentário da DFC', 'Financeiro')
+    wb['Vendas'].merge_cells('H1:I1')
+    wb['Vendas'].column_dimensions['A'].width = 33
+    wb['BP'].sheet_state = 'hidden'
+    wb.save(entrada)
+    usar_strings_compartilhadas(entrada)
+
+    destino = str(tmp_path / 'saida.xlsx')
+    # Modo híbrido: os comentários da DRE usam os mesmos nomes de parte que o da DFC
+    processar_dre(entrada, destino, modo='hibrido', streaming=True, config=config)
+
+    with zipfile.ZipFile(entrada) as pacote_entrada, zipfile.ZipFile(destino) as pacote_saida:
+        for aba in ('DFC', 'BP', 'Vendas', 'Folha', 'Financiamento', 'Custo_Despesas'):
+            assert (pacote_saida.read(_parte_da_aba(pacote_saida, aba))
+                    == pacote_entrada.read(_parte_da_aba(pacote_entrada, aba))), aba
+
+    original, saida = openpyxl.load_workbook(entrada), openpyxl.load_workbook(destino)
+    assert saida.sheetnames == original.sheetnames
+    for aba in ('DFC', 'BP', 'Vendas', 'Folha', 'Financiamento', 'Custo_Despesas'):
+        assert _celulas(saida[aba]) == _celulas(original[aba]), aba
+    assert saida['Vendas']['A1'].value == 'Cliente'
+    assert saida['DFC']['A1'].comment.text == 'Comentário da DFC'
+    assert saida['BP'].sheet_state == 'hidden'
+    assert [str(intervalo) for intervalo in saida['Vendas'].merged_cells.ranges] == ['H1:I1']
+    assert saida['Vendas'].column_dimensions['A'].width == 33
+    assert any(celula.comment is not None for linha in saida['DRE'].iter_rows() for celula in linha)
+    # Investimentos é reescrita com o waterfall, sobre os textos das strings compartilhadas
+    assert [linha[:3] for linha in saida['Investimentos'].iter_rows(max_col=3, values_only=True)] == \
+        [linha[:3] for linha in original['Investimentos'].iter_rows(max_col=3, values_only=True)]
+
+
+def _cargas_em_modo_de_escrita(monkeypatch):
+    cargas = []
+    carregar = openpyxl.load_workbook
+
+    def registrar(arquivo, *args, **kwargs):
+        if not kwargs.get('read_only'):
+            cargas.append(arquivo)
+        return carregar(arquivo, *args, **kwargs)
+    monkeypatch.setattr(openpyxl, 'load_workbook', registrar)
+    return cargas
+
+
+def test_streaming_padrao_quando_a_saida_e_outro_arquivo(entrada, tmp_path, config, monkeypatch):
+    cargas = _cargas_em_modo_de_escrita(monkeypatch)
+    processar_dre(entrada, str(tmp_path / 'saida.xlsx'), config=config)
+    assert processar_dre(entrada, config=config).conteudo
+    assert cargas == []
+
+    processar_dre(entrada, entrada, config=config)
+    assert len(cargas) == 1
+    processar_dre(entrada, str(tmp_path / 'outra.xlsx'), streaming=False, config=config)
+    assert len(cargas) == 2